@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services.posting import apply_journal
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica os lançamentos pendentes do diário (modo ACCOUNT_POSTING_MODE=journal) "
+        "ao saldo das contas da empresa. Com --loop, corre continuamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--account",
+            type=int,
+            action="append",
+            dest="account_ids",
+            help="ID da conta a aplicar (pode repetir). Por omissão: todas com pendentes.",
+        )
+        parser.add_argument("--loop", action="store_true", help="Correr continuamente.")
+        parser.add_argument("--interval", type=float, default=2.0, help="Segundos entre ciclos (--loop).")
+
+    def handle(self, *args, **options):
+        while True:
+            applied = apply_journal(options["account_ids"])
+            if applied or not options["loop"]:
+                self.stdout.write(f"{applied} lançamentos aplicados.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Loan
+from core.services.loan_aging import portfolio_aging
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o cálculo da antiguidade dos atrasos (PAR 30/60/90) sobre os "
+        "empréstimos desembolsados da base de dados e mostra o plano (EXPLAIN) "
+        "da query agrupada. Falha se a mediana passar --max-ms."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=10, help="Execuções medidas.")
+        parser.add_argument("--max-ms", type=float, default=200.0, help="Limite da mediana (ms).")
+        parser.add_argument("--explain", action="store_true", help="Mostra o EXPLAIN da query agrupada.")
+
+    def handle(self, *args, **options):
+        loans = Loan.objects.filter(status="disbursed").count()
+
+        # primeira execução fora da medição (cache de páginas do InnoDB)
+        with CaptureQueriesContext(connection) as ctx:
+            aging = portfolio_aging()
+
+        timings = []
+        for _ in range(max(options["repeat"], 1)):
+            start = time.perf_counter()
+            portfolio_aging()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        median = statistics.median(timings)
+        self.stdout.write(
+            f"{loans} empréstimos desembolsados · {len(ctx.captured_queries)} queries · "
+            f"mediana {median:.1f} ms · máx {max(timings):.1f} ms"
+        )
+        self.stdout.write(
+            "  " + " · ".join(f"PAR{days} {value}%" for days, value in aging.portfolio.par_values)
+        )
+
+        if options["explain"]:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN {ctx.captured_queries[0]['sql']}")
+                for row in cursor.fetchall():
+                    self.stdout.write(f"    {row}")
+
+        if median > options["max_ms"]:
+            raise CommandError(f"Mediana {median:.0f} ms acima do limite de {options['max_ms']:.0f} ms.")
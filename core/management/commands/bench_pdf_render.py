@@ -0,0 +1,68 @@
+import statistics
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+
+from core.services.pdf import PdfRenderer
+from core.services.reports import REPORT_LABELS, ReportParams, build_report_context
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a geração do PDF de um relatório: renderer novo em cada PDF (CSS e "
+        "fontes processados de cada vez) contra o renderer pré-aquecido do processo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", dest="report_type", default="balances", choices=sorted(REPORT_LABELS))
+        parser.add_argument("--start", help="Data inicial (AAAA-MM-DD). Por omissão, início do mês.")
+        parser.add_argument("--end", help="Data final (AAAA-MM-DD). Por omissão, hoje.")
+        parser.add_argument("--repeat", type=int, default=10, help="PDFs gerados em cada modo.")
+        parser.add_argument(
+            "--max-ms",
+            type=float,
+            default=None,
+            help="Falha se a mediana com o renderer pré-aquecido passar este valor.",
+        )
+
+    def handle(self, *args, **options):
+        today = date.today()
+        try:
+            start_date = date.fromisoformat(options["start"]) if options["start"] else today.replace(day=1)
+            end_date = date.fromisoformat(options["end"]) if options["end"] else today
+        except ValueError as exc:
+            raise CommandError(f"Data inválida: {exc}")
+
+        params = ReportParams(report_type=options["report_type"], start_date=start_date, end_date=end_date)
+        html_string = render_to_string("reports/report_pdf.html", build_report_context(params))
+        repeat = max(options["repeat"], 1)
+
+        cold = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            PdfRenderer().render(html_string)
+            cold.append((time.perf_counter() - start) * 1000)
+
+        renderer = PdfRenderer()
+        renderer.warm_up()
+        warm = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pdf_bytes = renderer.render(html_string)
+            warm.append((time.perf_counter() - start) * 1000)
+
+        stats = renderer.stats
+        self.stdout.write(f"{params.title}: {len(pdf_bytes) / 1024:.0f} KB, {stats.pages // stats.renders} páginas")
+        self.stdout.write(f"  {'renderer novo:':<23} mediana {statistics.median(cold):7.1f} ms · máx {max(cold):7.1f} ms")
+        self.stdout.write(f"  {'renderer pré-aquecido:':<23} mediana {statistics.median(warm):7.1f} ms · máx {max(warm):7.1f} ms")
+        self.stdout.write(
+            f"  aquecimento {stats.warmup_ms:.0f} ms · layout {stats.layout_ms / stats.renders:.1f} ms/PDF "
+            f"· escrita {stats.write_ms / stats.renders:.1f} ms/PDF"
+        )
+
+        if options["max_ms"] is not None and statistics.median(warm) > options["max_ms"]:
+            raise CommandError(
+                f"Mediana {statistics.median(warm):.0f} ms acima do limite de {options['max_ms']:.0f} ms."
+            )
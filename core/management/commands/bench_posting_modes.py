@@ -0,0 +1,123 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import CompanyAccount, Transaction
+from core.services.posting import (
+    POSTING_MODE_JOURNAL,
+    POSTING_MODE_LOCKED,
+    apply_journal,
+    lock_account,
+    post_transaction,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o débito de lançamentos concorrentes numa só conta da empresa "
+        "nos modos 'locked' e 'journal'. Cada lançamento corre numa transacção que "
+        "simula o resto do registo (--work-ms) antes do commit. "
+        "Usar apenas numa base de dados local/de testes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--account", type=int, required=True, help="ID da conta da empresa.")
+        parser.add_argument("--threads", type=int, default=20, help="Caixas em paralelo.")
+        parser.add_argument("--postings", type=int, default=20, help="Lançamentos por thread.")
+        parser.add_argument(
+            "--work-ms",
+            type=float,
+            default=5.0,
+            help="Trabalho simulado dentro da transacção, depois do lançamento (ms).",
+        )
+        parser.add_argument("--keep", action="store_true", help="Não reverter os lançamentos no fim.")
+
+    def _run(self, account_id, mode, threads_count, postings, work_ms, tag):
+        barrier = threading.Barrier(threads_count)
+        errors = []
+
+        def worker(n):
+            try:
+                barrier.wait()
+                for i in range(postings):
+                    with db_transaction.atomic():
+                        post_transaction(
+                            account_id,
+                            Transaction.TX_TYPE_IN,
+                            Decimal("1.00"),
+                            timezone.localdate(),
+                            f"{tag} {mode} #{n}.{i}",
+                            source_type="manual",
+                            mode=mode,
+                        )
+                        if work_ms:
+                            time.sleep(work_ms / 1000.0)
+            except Exception as exc:
+                errors.append(str(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(threads_count)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start, errors
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            raise CommandError("SQLite não suporta SELECT ... FOR UPDATE; usar MySQL/MariaDB.")
+        if not CompanyAccount.objects.filter(pk=options["account"]).exists():
+            raise CommandError(f"Conta da empresa inválida: {options['account']}.")
+
+        account_id = options["account"]
+        total = options["threads"] * options["postings"]
+        tag = f"Benchmark {uuid.uuid4().hex[:8]}"
+
+        apply_journal([account_id])
+        initial = CompanyAccount.objects.values_list("balance", flat=True).get(pk=account_id)
+
+        results = {}
+        for mode in (POSTING_MODE_LOCKED, POSTING_MODE_JOURNAL):
+            elapsed, errors = self._run(
+                account_id, mode, options["threads"], options["postings"], options["work_ms"], tag
+            )
+            results[mode] = elapsed
+            self.stdout.write(
+                f"{mode:8}: {total} lançamentos em {elapsed:7.2f}s "
+                f"({total / elapsed:8.1f}/s) · erros: {len(errors)}"
+            )
+            for error in errors[:5]:
+                self.stdout.write(self.style.WARNING(error))
+
+        start = time.perf_counter()
+        applied = apply_journal([account_id])
+        self.stdout.write(f"Aplicação do diário: {applied} lançamentos em {time.perf_counter() - start:.2f}s")
+
+        posted = Transaction.objects.filter(company_account_id=account_id, description__startswith=tag)
+        count = posted.count()
+        final = CompanyAccount.objects.values_list("balance", flat=True).get(pk=account_id)
+        expected = initial + Decimal("1.00") * count
+
+        if results[POSTING_MODE_JOURNAL]:
+            self.stdout.write(f"Ganho do modo diário: {results[POSTING_MODE_LOCKED] / results[POSTING_MODE_JOURNAL]:.1f}x")
+        if final == expected and count == 2 * total:
+            self.stdout.write(self.style.SUCCESS(f"Saldo final {final} = esperado."))
+        else:
+            self.stdout.write(self.style.ERROR(f"Saldo final {final} ≠ esperado {expected} ({count} lançamentos)."))
+
+        if not options["keep"] and count:
+            with db_transaction.atomic():
+                lock_account(account_id, active_only=False)
+                posted.delete()
+                CompanyAccount.objects.filter(pk=account_id).update(
+                    balance=F("balance") - Decimal("1.00") * count
+                )
+            self.stdout.write("Lançamentos do benchmark revertidos.")
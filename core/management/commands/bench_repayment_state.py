@@ -0,0 +1,110 @@
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q, Sum
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Loan
+from core.services.repayment_state import repayment_states
+
+
+def _legacy_states(loans):
+    """
+    Cálculo anterior (um empréstimo de cada vez, várias queries por empréstimo),
+    mantido aqui apenas como referência para o benchmark.
+    """
+    results = {}
+    for loan in loans:
+        repayments = loan.repayments.all()
+
+        paid_total = repayments.aggregate(t=Sum("principal_amount"))["t"] or Decimal("0")
+        outstanding = max(loan.principal_amount - paid_total, Decimal("0"))
+
+        cycle_start = loan.release_date or loan.created_at.date()
+        cycle_due = loan.first_payment_date
+
+        paid_before = (
+            repayments.filter(payment_date__lt=cycle_start).aggregate(t=Sum("principal_amount"))["t"]
+            or Decimal("0")
+        )
+        base = max(loan.principal_amount - paid_before, Decimal("0"))
+
+        rate = loan.interest_type.rate if loan.interest_type and loan.interest_type.rate else Decimal("0")
+        rate_decimal = (rate / Decimal("100")).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+        interest_total = (base * rate_decimal).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+        q_cycle = Q(payment_date__gte=cycle_start)
+        if cycle_due:
+            q_cycle &= Q(payment_date__lte=cycle_due)
+        interest_paid = repayments.filter(q_cycle).aggregate(t=Sum("interest_amount"))["t"] or Decimal("0")
+
+        results[loan.id] = (outstanding, interest_total, max(interest_total - interest_paid, Decimal("0")))
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o cálculo de estado de reembolso por empréstimo (loop) com o "
+        "motor set-based (uma query agrupada) para os empréstimos desembolsados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Número máximo de empréstimos.")
+        parser.add_argument("--repeat", type=int, default=3, help="Número de repetições (melhor tempo).")
+
+    def _run(self, func, repeat):
+        best = None
+        queries = 0
+        result = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                result = func()
+                elapsed = time.perf_counter() - start
+            queries = len(ctx.captured_queries)
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best, queries
+
+    def handle(self, *args, **options):
+        loans_qs = (
+            Loan.objects.select_related("interest_type")
+            .filter(status="disbursed")
+            .order_by("-id")
+        )
+        if options["limit"]:
+            loans_qs = loans_qs[: options["limit"]]
+        loan_ids = list(loans_qs.values_list("id", flat=True))
+
+        legacy, legacy_time, legacy_queries = self._run(
+            lambda: _legacy_states(Loan.objects.select_related("interest_type").filter(pk__in=loan_ids)),
+            options["repeat"],
+        )
+        engine, engine_time, engine_queries = self._run(
+            lambda: repayment_states(loan_ids), options["repeat"]
+        )
+
+        mismatches = [
+            loan_id
+            for loan_id, (outstanding, interest_total, remaining) in legacy.items()
+            if (
+                engine[loan_id].outstanding_principal,
+                engine[loan_id].cycle_interest_total,
+                engine[loan_id].interest_remaining,
+            )
+            != (outstanding, interest_total, remaining)
+        ]
+
+        self.stdout.write(f"Empréstimos: {len(loan_ids)}")
+        self.stdout.write(f"Loop por empréstimo : {legacy_time * 1000:9.1f} ms · {legacy_queries} queries")
+        self.stdout.write(f"Motor set-based     : {engine_time * 1000:9.1f} ms · {engine_queries} queries")
+        if engine_time:
+            self.stdout.write(f"Ganho               : {legacy_time / engine_time:9.1f}x")
+
+        if mismatches:
+            self.stdout.write(
+                self.style.ERROR(f"{len(mismatches)} empréstimos com resultados diferentes: {mismatches[:20]}")
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("Resultados idênticos."))
@@ -0,0 +1,106 @@
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Módulos que não devem ser carregados no arranque (só na primeira utilização)
+HEAVY_MODULES = ["weasyprint", "fontTools", "cffi", "pydyf", "PIL", "numpy", "pypdf"]
+
+# Arranque de um worker: django.setup() + URLconf completo (importa todas as views)
+BOOT_SCRIPT = """
+import time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - start)
+"""
+
+
+def _parse_importtime(stderr):
+    """
+    Linhas de `python -X importtime`:
+    "import time:  self [us] | cumulative | imported package"
+    Devolve [(módulo, self_us, cumulative_us)].
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        rows.append((parts[2].strip(), self_us, cumulative_us))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede o arranque de um worker (django.setup() + URLconf) num processo novo, "
+        "com o tempo de import por módulo (python -X importtime), e indica se "
+        "dependências pesadas (WeasyPrint, ...) são carregadas no arranque."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=25, help="Módulos mais lentos a mostrar.")
+        parser.add_argument("--repeat", type=int, default=5, help="Arranques medidos (mediana).")
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Falha se algum módulo pesado for importado no arranque.",
+        )
+
+    def _boot(self, importtime=False):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            "DJANGO_SETTINGS_MODULE", "salama_project.settings"
+        ))
+        cmd = [sys.executable]
+        if importtime:
+            cmd += ["-X", "importtime"]
+        cmd += ["-c", BOOT_SCRIPT]
+        proc = subprocess.run(cmd, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise CommandError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "Arranque falhou.")
+        return float(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+    def handle(self, *args, **options):
+        timings = [self._boot()[0] for _ in range(max(options["repeat"], 1))]
+        _, stderr = self._boot(importtime=True)
+        rows = _parse_importtime(stderr)
+
+        by_package = defaultdict(int)
+        for module, self_us, _ in rows:
+            by_package[module.split(".")[0]] += self_us
+
+        self.stdout.write(
+            f"Arranque (setup + URLconf): mediana {statistics.median(timings) * 1000:.0f} ms "
+            f"· min {min(timings) * 1000:.0f} ms · {len(rows)} módulos importados"
+        )
+
+        self.stdout.write("\nMódulos mais lentos (cumulativo):")
+        for module, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[: options["top"]]:
+            self.stdout.write(f"  {cumulative_us / 1000:9.1f} ms  {self_us / 1000:8.1f} ms  {module}")
+
+        self.stdout.write("\nPor pacote (self):")
+        for package, total_us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[: options["top"]]:
+            self.stdout.write(f"  {total_us / 1000:9.1f} ms  {package}")
+
+        loaded = {module.split(".")[0] for module, _, _ in rows}
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        if heavy:
+            message = f"Módulos pesados carregados no arranque: {', '.join(heavy)}."
+            if options["strict"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("Nenhum módulo pesado carregado no arranque."))
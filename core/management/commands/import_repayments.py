@@ -0,0 +1,62 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CompanyAccount
+from core.services.repayment_import import import_repayments
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa reembolsos de empréstimos a partir de um extracto CSV "
+        "(M-Pesa / e-Mola / banco), com as mesmas regras do registo manual."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Caminho do ficheiro CSV.")
+        parser.add_argument(
+            "--account",
+            type=int,
+            help="ID da conta da empresa que recebe (se o CSV não tiver a coluna company_account).",
+        )
+        parser.add_argument(
+            "--method",
+            default="mobile",
+            choices=["cash", "bank", "mobile"],
+            help="Método por omissão (se o CSV não tiver a coluna method).",
+        )
+        parser.add_argument("--user", help="Username registado como autor das transacções.")
+        parser.add_argument("--dry-run", action="store_true", help="Valida e simula sem gravar.")
+
+    def handle(self, *args, **options):
+        if options["account"] and not CompanyAccount.objects.filter(pk=options["account"], is_active=True).exists():
+            raise CommandError(f"Conta da empresa inválida: {options['account']}.")
+
+        user = None
+        if options["user"]:
+            try:
+                user = get_user_model().objects.get(username=options["user"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Utilizador não encontrado: {options['user']}.")
+
+        try:
+            with open(options["path"], "rb") as fh:
+                start = time.perf_counter()
+                result = import_repayments(
+                    fh,
+                    company_account_id=options["account"],
+                    method=options["method"],
+                    user=user,
+                    dry_run=options["dry_run"],
+                )
+                elapsed = time.perf_counter() - start
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for row in result.error_rows:
+            self.stdout.write(self.style.WARNING(f"Linha {row.line}: {row.error}"))
+
+        self.stdout.write(f"{len(result.rows)} linhas processadas em {elapsed:.2f}s.")
+        style = self.style.WARNING if result.error_rows else self.style.SUCCESS
+        self.stdout.write(style(result.summary))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.report_prerender import month_end_params, prerender_report, previous_month
+from core.services.reports import REPORT_LABELS, ReportError
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera antecipadamente os PDFs de fim de mês (todos os tipos de relatório, "
+        "globais e por conta da empresa) e regista-os em sl_prerendered_reports. "
+        "Pensado para o cron no primeiro dia do mês; pode ser repetido — só volta "
+        "a gerar os relatórios cujos dados mudaram."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Mês a gerar (AAAA-MM). Por omissão, o mês anterior.")
+        parser.add_argument(
+            "--type",
+            dest="report_types",
+            action="append",
+            choices=sorted(REPORT_LABELS),
+            help="Tipo de relatório (repetível). Por omissão, todos.",
+        )
+        parser.add_argument("--global-only", action="store_true", help="Sem as versões por conta da empresa.")
+        parser.add_argument("--force", action="store_true", help="Gera de novo mesmo os que ainda são válidos.")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                year, month = (int(part) for part in options["month"].split("-"))
+                if not 1 <= month <= 12:
+                    raise ValueError
+            except ValueError:
+                raise CommandError("--month: use o formato AAAA-MM.")
+        else:
+            year, month = previous_month()
+
+        generated = kept = 0
+        failures = []
+        for params in month_end_params(
+            year,
+            month,
+            report_types=options["report_types"],
+            per_account=not options["global_only"],
+        ):
+            label = f"{params.report_type} · conta {params.company_account_id or 'todas'}"
+            try:
+                report, created = prerender_report(params, force=options["force"])
+            except ReportError as exc:
+                failures.append(label)
+                self.stdout.write(self.style.WARNING(f"{label}: {exc}"))
+                continue
+
+            if created:
+                generated += 1
+                if options["verbosity"] >= 2:
+                    self.stdout.write(f"{label}: {report.file_size / 1024:.0f} KB em {report.duration_ms} ms")
+            else:
+                kept += 1
+
+        summary = f"{year}-{month:02d}: {generated} gerados, {kept} ainda válidos, {len(failures)} recusados."
+        if failures:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
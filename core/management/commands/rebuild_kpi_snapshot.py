@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.services.kpi_snapshot import rebuild_kpi_snapshot
+
+
+class Command(BaseCommand):
+    help = "Reconstrói a fotografia diária de KPIs do dashboard (sl_dashboard_kpi_snapshots)."
+
+    def handle(self, *args, **options):
+        rows = rebuild_kpi_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Fotografia de KPIs reconstruída ({rows} dias)."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from core.services.lease_allocation import rebuild_lease_allocations
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói a imputação dos pagamentos de leasing às semanas dos contratos "
+        "(sl_vehicle_lease_allocations / sl_vehicle_lease_coverage)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--contract",
+            type=int,
+            action="append",
+            dest="contract_ids",
+            help="ID do contrato a recalcular (pode repetir). Por omissão: todos.",
+        )
+
+    def handle(self, *args, **options):
+        with db_transaction.atomic():
+            rows = rebuild_lease_allocations(options["contract_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Imputações recalculadas para {rows} contratos."))
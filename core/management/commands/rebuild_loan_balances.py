@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from core.services.loan_balances import rebuild_loan_balances
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o resumo de saldos por empréstimo (sl_loan_balances) a partir dos reembolsos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loan",
+            type=int,
+            action="append",
+            dest="loan_ids",
+            help="ID do empréstimo a recalcular (pode repetir). Por omissão: todos os desembolsados/fechados.",
+        )
+
+    def handle(self, *args, **options):
+        with db_transaction.atomic():
+            rows = rebuild_loan_balances(options["loan_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Saldos recalculados para {rows} empréstimos."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.services.pnl import rebuild_pnl_rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o agregado mensal do P&L (sl_pnl_monthly) a partir dos "
+        "rendimentos, despesas, juros de reembolsos e pagamentos de leasing. "
+        "Depois de construído, os lançamentos mantêm-no actualizado."
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_pnl_rollup()
+        self.stdout.write(self.style.SUCCESS(f"Agregado do P&L reconstruído: {rows} linhas."))
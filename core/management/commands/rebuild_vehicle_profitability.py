@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from core.services.vehicle_profitability import rebuild_vehicle_profitability
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o resumo de rentabilidade por viatura (sl_vehicle_profitability) a partir dos contratos e pagamentos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vehicle",
+            type=int,
+            action="append",
+            dest="vehicle_ids",
+            help="ID da viatura a recalcular (pode repetir). Por omissão: toda a frota.",
+        )
+
+    def handle(self, *args, **options):
+        with db_transaction.atomic():
+            rows = rebuild_vehicle_profitability(options["vehicle_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Rentabilidade recalculada para {rows} viaturas."))
@@ -0,0 +1,104 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F
+
+from core.models import ReportJob
+from core.services.report_jobs import claim_jobs, mark_failed, requeue_stale_jobs
+from core.services.report_process import init_process, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker da fila de relatórios PDF (sl_report_jobs): reserva pedidos em fila "
+        "e gera-os num pool de processos. Vários workers podem correr em paralelo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=2, help="Processos de geração em paralelo.")
+        parser.add_argument("--poll", type=float, default=2.0, help="Intervalo de consulta da fila (segundos).")
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=30,
+            help="Pedidos 'a gerar' há mais tempo do que isto voltam à fila.",
+        )
+        parser.add_argument("--once", action="store_true", help="Processa a fila actual e termina.")
+
+    def _executor(self, processes):
+        # "spawn": os processos não herdam as ligações à base de dados do worker
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_process,
+        )
+
+    def handle(self, *args, **options):
+        processes = max(options["processes"], 1)
+        poll = max(options["poll"], 0.1)
+        stale_after = timedelta(minutes=options["stale_minutes"])
+
+        in_flight = {}
+        executor = self._executor(processes)
+        self.stdout.write(f"Worker de relatórios: {processes} processos.")
+
+        try:
+            while True:
+                close_old_connections()
+
+                requeued = requeue_stale_jobs(stale_after)
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"{requeued} pedidos parados devolvidos à fila/falhados."))
+
+                for job_id in claim_jobs(processes - len(in_flight)):
+                    in_flight[executor.submit(run_job, job_id)] = (job_id, time.perf_counter())
+
+                if not in_flight:
+                    if options["once"]:
+                        break
+                    time.sleep(poll)
+                    continue
+
+                done, _ = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id, start = in_flight.pop(future)
+                    elapsed = time.perf_counter() - start
+                    stats = None
+                    try:
+                        _, status, error, stats = future.result()
+                    except Exception as exc:
+                        # processo do pool morreu (ex.: sem memória): o pool fica inutilizável
+                        broken = broken or isinstance(exc, BrokenProcessPool)
+                        mark_failed(job_id, f"{type(exc).__name__}: {exc}")
+                        status, error = ReportJob.STATUS_FAILED, str(exc)
+
+                    if error:
+                        self.stdout.write(self.style.ERROR(f"#{job_id} {status} em {elapsed:.1f}s: {error}"))
+                    elif stats:
+                        self.stdout.write(
+                            f"#{job_id} {status} em {elapsed:.1f}s "
+                            f"(PDF {stats['last_ms']:.0f} ms · média do processo {stats['avg_ms']:.0f} ms "
+                            f"em {stats['renders']} PDFs)"
+                        )
+                    else:
+                        self.stdout.write(f"#{job_id} {status} em {elapsed:.1f}s")
+
+                if broken:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = self._executor(processes)
+        except KeyboardInterrupt:
+            self.stdout.write("A terminar…")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            # pedidos reservados que não chegaram a começar voltam à fila
+            cancelled = [job_id for future, (job_id, _) in in_flight.items() if future.cancelled()]
+            if cancelled:
+                ReportJob.objects.filter(pk__in=cancelled, status=ReportJob.STATUS_RUNNING).update(
+                    status=ReportJob.STATUS_QUEUED, started_at=None, attempts=F("attempts") - 1
+                )
@@ -0,0 +1,38 @@
+# Os modelos do core são `managed = False` (esquema gerido na BD MySQL).
+# As tabelas novas são criadas aqui com SQL explícito, no mesmo estilo do dump.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_dashboard_kpi_snapshots` (
+                  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+                  `snapshot_date` date NOT NULL,
+                  `portfolio_total` decimal(15,2) DEFAULT NULL,
+                  `outstanding_principal` decimal(15,2) DEFAULT NULL,
+                  `interest_to_receive` decimal(15,2) DEFAULT NULL,
+                  `loans_pending` int(11) DEFAULT NULL,
+                  `loans_approved` int(11) DEFAULT NULL,
+                  `loans_disbursed` int(11) DEFAULT NULL,
+                  `loans_closed` int(11) DEFAULT NULL,
+                  `loans_cancelled` int(11) DEFAULT NULL,
+                  `repayments_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `repayments_count` int(11) NOT NULL DEFAULT 0,
+                  `disbursements_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `vehicle_lease_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `updated_at` datetime NOT NULL,
+                  PRIMARY KEY (`id`),
+                  UNIQUE KEY `sl_dks_snapshot_date_uniq` (`snapshot_date`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_dashboard_kpi_snapshots`;",
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_dashboard_kpi_snapshots"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_loan_balances` (
+                  `loan_id` bigint(20) NOT NULL,
+                  `principal_paid_total` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `repayments_count` int(11) NOT NULL DEFAULT 0,
+                  `cycle_start` date DEFAULT NULL,
+                  `cycle_due` date DEFAULT NULL,
+                  `principal_paid_before_cycle` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `interest_paid_cycle` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `last_repayment_id` bigint(20) DEFAULT NULL,
+                  `last_repayment_date` date DEFAULT NULL,
+                  `updated_at` datetime NOT NULL,
+                  PRIMARY KEY (`loan_id`),
+                  KEY `sl_loan_balances_last_repayment_fk` (`last_repayment_id`),
+                  CONSTRAINT `sl_loan_balances_loan_fk` FOREIGN KEY (`loan_id`) REFERENCES `sl_loans` (`id`) ON DELETE CASCADE,
+                  CONSTRAINT `sl_loan_balances_last_repayment_fk` FOREIGN KEY (`last_repayment_id`) REFERENCES `sl_loan_repayments` (`id`) ON DELETE SET NULL
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_loan_balances`;",
+        ),
+    ]
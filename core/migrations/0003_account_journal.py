@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_loan_balances"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_transactions`
+                  MODIFY `balance_before` decimal(15,2) DEFAULT NULL,
+                  MODIFY `balance_after` decimal(15,2) DEFAULT NULL,
+                  ADD KEY `sl_transactions_pending_idx` (`company_account_id`, `balance_after`);
+            """,
+            # Antes de reverter, aplicar o diário (manage.py apply_account_journal)
+            reverse_sql="""
+                ALTER TABLE `sl_transactions`
+                  DROP KEY `sl_transactions_pending_idx`,
+                  MODIFY `balance_before` decimal(15,2) NOT NULL,
+                  MODIFY `balance_after` decimal(15,2) NOT NULL;
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_company_account_checkpoints` (
+                  `account_id` bigint(20) NOT NULL,
+                  `last_transaction_id` bigint(20) DEFAULT NULL,
+                  `transactions_applied` bigint(20) NOT NULL DEFAULT 0,
+                  `applied_at` datetime NOT NULL,
+                  PRIMARY KEY (`account_id`),
+                  CONSTRAINT `sl_company_account_checkpoints_account_fk` FOREIGN KEY (`account_id`) REFERENCES `sl_company_accounts` (`id`) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_company_account_checkpoints`;",
+        ),
+    ]
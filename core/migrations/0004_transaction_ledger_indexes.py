@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_account_journal"),
+    ]
+
+    operations = [
+        # Paginação por chave do histórico: ORDER BY tx_date, id com filtros por conta/tipo/origem
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_transactions`
+                  ADD KEY `sl_transactions_active_date_idx` (`is_active`, `tx_date`, `id`),
+                  ADD KEY `sl_transactions_account_date_idx` (`company_account_id`, `is_active`, `tx_date`, `id`),
+                  ADD KEY `sl_transactions_type_date_idx` (`tx_type`, `is_active`, `tx_date`, `id`),
+                  ADD KEY `sl_transactions_source_date_idx` (`source_type`, `is_active`, `tx_date`, `id`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_transactions`
+                  DROP KEY `sl_transactions_active_date_idx`,
+                  DROP KEY `sl_transactions_account_date_idx`,
+                  DROP KEY `sl_transactions_type_date_idx`,
+                  DROP KEY `sl_transactions_source_date_idx`;
+            """,
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_transaction_ledger_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_report_jobs` (
+                  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+                  `report_type` varchar(30) NOT NULL,
+                  `params` longtext NOT NULL,
+                  `params_hash` char(64) NOT NULL,
+                  `base_url` varchar(255) DEFAULT NULL,
+                  `inflight_key` char(64) DEFAULT NULL,
+                  `status` varchar(10) NOT NULL DEFAULT 'queued',
+                  `file` varchar(255) DEFAULT NULL,
+                  `file_size` bigint(20) DEFAULT NULL,
+                  `attempts` int(11) NOT NULL DEFAULT 0,
+                  `error` longtext DEFAULT NULL,
+                  `duration_ms` int(11) DEFAULT NULL,
+                  `requested_by_id` int(11) DEFAULT NULL,
+                  `created_at` datetime(6) NOT NULL,
+                  `started_at` datetime(6) DEFAULT NULL,
+                  `finished_at` datetime(6) DEFAULT NULL,
+                  PRIMARY KEY (`id`),
+                  UNIQUE KEY `sl_report_jobs_inflight_uq` (`inflight_key`),
+                  KEY `sl_report_jobs_status_idx` (`status`, `id`),
+                  KEY `sl_report_jobs_hash_idx` (`params_hash`, `status`),
+                  KEY `sl_report_jobs_user_idx` (`requested_by_id`, `id`),
+                  CONSTRAINT `sl_report_jobs_user_fk` FOREIGN KEY (`requested_by_id`) REFERENCES `auth_user` (`id`) ON DELETE SET NULL
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_report_jobs`;",
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_report_jobs"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_report_jobs`
+                  ADD COLUMN `cache_key` char(64) DEFAULT NULL AFTER `inflight_key`,
+                  ADD COLUMN `from_cache` tinyint(1) NOT NULL DEFAULT 0 AFTER `cache_key`,
+                  ADD KEY `sl_report_jobs_cache_idx` (`cache_key`, `status`, `finished_at`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_report_jobs`
+                  DROP KEY `sl_report_jobs_cache_idx`,
+                  DROP COLUMN `from_cache`,
+                  DROP COLUMN `cache_key`;
+            """,
+        ),
+    ]
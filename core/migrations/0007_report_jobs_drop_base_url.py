@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_report_cache"),
+    ]
+
+    operations = [
+        # O renderer lê os ficheiros estáticos do disco: o URL do site deixou de ser guardado
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_report_jobs`
+                  DROP COLUMN `base_url`;
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_report_jobs`
+                  ADD COLUMN `base_url` varchar(255) DEFAULT NULL AFTER `params_hash`;
+            """,
+        ),
+    ]
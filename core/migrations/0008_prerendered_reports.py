@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_report_jobs_drop_base_url"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_prerendered_reports` (
+                  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+                  `report_type` varchar(30) NOT NULL,
+                  `period_start` date NOT NULL,
+                  `period_end` date NOT NULL,
+                  `company_account_id` bigint(20) DEFAULT NULL,
+                  `params_hash` char(64) NOT NULL,
+                  `cache_key` char(64) NOT NULL,
+                  `file` varchar(255) NOT NULL,
+                  `file_size` bigint(20) NOT NULL DEFAULT 0,
+                  `duration_ms` int(11) NOT NULL DEFAULT 0,
+                  `generated_at` datetime(6) NOT NULL,
+                  PRIMARY KEY (`id`),
+                  UNIQUE KEY `sl_prerendered_reports_params_uq` (`params_hash`),
+                  KEY `sl_prerendered_reports_period_idx` (`period_start`, `report_type`),
+                  KEY `sl_prerendered_reports_account_idx` (`company_account_id`),
+                  CONSTRAINT `sl_prerendered_reports_account_fk` FOREIGN KEY (`company_account_id`) REFERENCES `sl_company_accounts` (`id`) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_prerendered_reports`;",
+        ),
+    ]
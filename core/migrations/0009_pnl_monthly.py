@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_prerendered_reports"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_pnl_monthly` (
+                  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+                  `month` date NOT NULL,
+                  `line` varchar(20) NOT NULL,
+                  `category_id` bigint(20) NOT NULL DEFAULT 0,
+                  `company_account_id` bigint(20) NOT NULL,
+                  `amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `entries` int(11) NOT NULL DEFAULT 0,
+                  `updated_at` datetime(6) NOT NULL,
+                  PRIMARY KEY (`id`),
+                  UNIQUE KEY `sl_pnl_monthly_uq` (`month`, `line`, `category_id`, `company_account_id`),
+                  KEY `sl_pnl_monthly_account_idx` (`company_account_id`, `month`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_pnl_monthly`;",
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_pnl_monthly"),
+    ]
+
+    operations = [
+        # Antiguidade dos atrasos (services/loan_aging.py): empréstimos
+        # desembolsados por validade e pedido pendente mais antigo de cada um
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_loans`
+                  ADD KEY `sl_loans_status_due_idx` (`status`, `first_payment_date`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_loans`
+                  DROP KEY `sl_loans_status_due_idx`;
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_loan_payment_requests`
+                  ADD KEY `sl_loan_payment_requests_aging_idx` (`loan_id`, `status`, `due_date`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_loan_payment_requests`
+                  DROP KEY `sl_loan_payment_requests_aging_idx`;
+            """,
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_loan_aging_indexes"),
+    ]
+
+    operations = [
+        # Plano semanal de leasing (services/lease_schedule.py): pagamentos de
+        # cada contrato até uma data, somados só a partir do índice
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_vehicle_lease_payments`
+                  ADD KEY `sl_vehicle_lease_payments_schedule_idx` (`contract_id`, `payment_date`, `amount`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_vehicle_lease_payments`
+                  DROP KEY `sl_vehicle_lease_payments_schedule_idx`;
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_vehicle_lease_contracts`
+                  ADD KEY `sl_vehicle_lease_contracts_status_start_idx` (`status`, `start_date`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_vehicle_lease_contracts`
+                  DROP KEY `sl_vehicle_lease_contracts_status_start_idx`;
+            """,
+        ),
+    ]
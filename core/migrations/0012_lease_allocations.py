@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_lease_schedule_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_vehicle_lease_allocations` (
+                  `id` bigint(20) NOT NULL AUTO_INCREMENT,
+                  `contract_id` bigint(20) NOT NULL,
+                  `payment_id` bigint(20) NOT NULL,
+                  `week` int(10) unsigned NOT NULL,
+                  `due_date` date NOT NULL,
+                  `amount` decimal(15,2) NOT NULL,
+                  `created_at` datetime(6) NOT NULL,
+                  PRIMARY KEY (`id`),
+                  UNIQUE KEY `sl_vehicle_lease_allocations_uq` (`payment_id`, `week`),
+                  KEY `sl_vehicle_lease_allocations_week_idx` (`contract_id`, `week`),
+                  CONSTRAINT `sl_vehicle_lease_allocations_contract_fk` FOREIGN KEY (`contract_id`) REFERENCES `sl_vehicle_lease_contracts` (`id`) ON DELETE CASCADE,
+                  CONSTRAINT `sl_vehicle_lease_allocations_payment_fk` FOREIGN KEY (`payment_id`) REFERENCES `sl_vehicle_lease_payments` (`id`) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_vehicle_lease_allocations`;",
+        ),
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_vehicle_lease_coverage` (
+                  `contract_id` bigint(20) NOT NULL,
+                  `weeks_covered` int(10) unsigned NOT NULL DEFAULT 0,
+                  `partial_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `unallocated_amount` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `paid_total` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `payments_count` int(10) unsigned NOT NULL DEFAULT 0,
+                  `paid_until` date DEFAULT NULL,
+                  `next_due_date` date DEFAULT NULL,
+                  `last_payment_id` bigint(20) DEFAULT NULL,
+                  `last_payment_date` date DEFAULT NULL,
+                  `updated_at` datetime(6) NOT NULL,
+                  PRIMARY KEY (`contract_id`),
+                  KEY `sl_vehicle_lease_coverage_next_due_idx` (`next_due_date`),
+                  KEY `sl_vehicle_lease_coverage_last_payment_fk` (`last_payment_id`),
+                  CONSTRAINT `sl_vehicle_lease_coverage_contract_fk` FOREIGN KEY (`contract_id`) REFERENCES `sl_vehicle_lease_contracts` (`id`) ON DELETE CASCADE,
+                  CONSTRAINT `sl_vehicle_lease_coverage_last_payment_fk` FOREIGN KEY (`last_payment_id`) REFERENCES `sl_vehicle_lease_payments` (`id`) ON DELETE SET NULL
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_vehicle_lease_coverage`;",
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_lease_allocations"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE `sl_vehicle_profitability` (
+                  `vehicle_id` bigint(20) NOT NULL,
+                  `revenue_total` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `payments_count` int(10) unsigned NOT NULL DEFAULT 0,
+                  `last_payment_date` date DEFAULT NULL,
+                  `contracts_count` int(10) unsigned NOT NULL DEFAULT 0,
+                  `first_lease_date` date DEFAULT NULL,
+                  `closed_lease_days` int(10) unsigned NOT NULL DEFAULT 0,
+                  `active_since` date DEFAULT NULL,
+                  `active_weekly_rent` decimal(15,2) NOT NULL DEFAULT 0.00,
+                  `payback_date` date DEFAULT NULL,
+                  `updated_at` datetime(6) NOT NULL,
+                  PRIMARY KEY (`vehicle_id`),
+                  CONSTRAINT `sl_vehicle_profitability_vehicle_fk` FOREIGN KEY (`vehicle_id`) REFERENCES `sl_leased_vehicles` (`id`) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+            """,
+            reverse_sql="DROP TABLE `sl_vehicle_profitability`;",
+        ),
+    ]
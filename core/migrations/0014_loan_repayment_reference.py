@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_vehicle_profitability"),
+    ]
+
+    operations = [
+        # Referência do extracto (importação CSV): verificada contra os
+        # reembolsos já importados para não registar o mesmo extracto duas vezes
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_loan_repayments`
+                  ADD COLUMN `reference` varchar(100) DEFAULT NULL,
+                  ADD KEY `sl_loan_repayments_reference_idx` (`reference`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_loan_repayments`
+                  DROP KEY `sl_loan_repayments_reference_idx`,
+                  DROP COLUMN `reference`;
+            """,
+        ),
+        # Importações anteriores: a referência só estava nas notas ("[IMP-<lote>#<linha>] <referência>")
+        migrations.RunSQL(
+            sql="""
+                UPDATE `sl_loan_repayments`
+                   SET `reference` = LEFT(TRIM(SUBSTRING(`notes`, LOCATE('] ', `notes`) + 2)), 100)
+                 WHERE `notes` LIKE '[IMP-%] %' AND `reference` IS NULL;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_loan_repayment_reference"),
+    ]
+
+    operations = [
+        # Lote de importação (CSV de reembolsos / cobrança semanal): o MySQL não
+        # devolve os ids do bulk_create, que são recuperados por estas colunas
+        # (antes eram marcas nas notas, que ficam para o texto do operador)
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_loan_repayments`
+                  ADD COLUMN `import_batch` varchar(32) DEFAULT NULL,
+                  ADD COLUMN `import_line` int unsigned DEFAULT NULL,
+                  ADD KEY `sl_loan_repayments_import_batch_idx` (`import_batch`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_loan_repayments`
+                  DROP KEY `sl_loan_repayments_import_batch_idx`,
+                  DROP COLUMN `import_line`,
+                  DROP COLUMN `import_batch`;
+            """,
+        ),
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE `sl_vehicle_lease_payments`
+                  ADD COLUMN `import_batch` varchar(32) DEFAULT NULL,
+                  ADD KEY `sl_vehicle_lease_payments_import_batch_idx` (`import_batch`);
+            """,
+            reverse_sql="""
+                ALTER TABLE `sl_vehicle_lease_payments`
+                  DROP KEY `sl_vehicle_lease_payments_import_batch_idx`,
+                  DROP COLUMN `import_batch`;
+            """,
+        ),
+    ]
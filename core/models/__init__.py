@@ -19,6 +19,15 @@ from .loanrepayment import LoanRepayment
 from .leasedvehicle import LeasedVehicle
 from .vehicleleasecontract import VehicleLeaseContract
 from .vehicleleasepayment import VehicleLeasePayment
+from .dashboardkpisnapshot import DashboardKPISnapshot
+from .loanbalance import LoanBalance
+from .companyaccountcheckpoint import CompanyAccountCheckpoint
+from .reportjob import ReportJob
+from .prerenderedreport import PrerenderedReport
+from .pnlmonthly import PnlMonthly
+from .vehicleleaseallocation import VehicleLeaseAllocation
+from .vehicleleasecoverage import VehicleLeaseCoverage
+from .vehicleprofitability import VehicleProfitability
 
 __all__ = [
     'Member',
@@ -41,4 +50,13 @@ __all__ = [
     'LeasedVehicle',
     'VehicleLeaseContract',
     'VehicleLeasePayment',
+    'DashboardKPISnapshot',
+    'LoanBalance',
+    'CompanyAccountCheckpoint',
+    'ReportJob',
+    'PrerenderedReport',
+    'PnlMonthly',
+    'VehicleLeaseAllocation',
+    'VehicleLeaseCoverage',
+    'VehicleProfitability',
 ]
\ No newline at end of file
@@ -0,0 +1,33 @@
+# core/models/companyaccountcheckpoint.py
+
+from django.db import models
+
+from .companyaccount import CompanyAccount
+
+
+class CompanyAccountCheckpoint(models.Model):
+    """
+    Ponto de aplicação do diário de uma conta da empresa (modo "journal").
+
+    No modo diário, os lançamentos são gravados em sl_transactions com
+    balance_before/balance_after a NULL (pendentes) e o saldo em
+    CompanyAccount.balance é avançado em lote por `apply_account_journal`.
+    Esta linha guarda até onde o diário já foi aplicado.
+    """
+
+    account = models.OneToOneField(
+        CompanyAccount,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="checkpoint",
+    )
+    last_transaction_id = models.BigIntegerField(null=True, blank=True)
+    transactions_applied = models.BigIntegerField(default=0)
+    applied_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_company_account_checkpoints"
+
+    def __str__(self):
+        return f"Checkpoint · {self.account_id} · até #{self.last_transaction_id}"
@@ -0,0 +1,61 @@
+# core/models/dashboardkpisnapshot.py
+
+from django.db import models
+
+
+class DashboardKPISnapshot(models.Model):
+    """
+    Fotografia diária dos KPIs do dashboard.
+
+    - Colunas de "stock" (carteira, principal em dívida, contagens por status):
+      valor no fim do dia `snapshot_date`. Só o dia actual (e datas futuras)
+      recebem actualizações incrementais; podem ser NULL em linhas históricas
+      recriadas pelo comando `rebuild_kpi_snapshot`.
+    - Colunas de "fluxo" (reembolsos, desembolsos, leasing): movimentos cuja
+      data de negócio (payment_date / disburse_date) é `snapshot_date`.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    snapshot_date = models.DateField(unique=True)
+
+    # Stocks
+    portfolio_total = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    outstanding_principal = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    interest_to_receive = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    loans_pending = models.IntegerField(null=True, blank=True)
+    loans_approved = models.IntegerField(null=True, blank=True)
+    loans_disbursed = models.IntegerField(null=True, blank=True)
+    loans_closed = models.IntegerField(null=True, blank=True)
+    loans_cancelled = models.IntegerField(null=True, blank=True)
+
+    # Fluxos do dia
+    repayments_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    repayments_count = models.IntegerField(default=0)
+    disbursements_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    vehicle_lease_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    updated_at = models.DateTimeField()
+
+    STOCK_FIELDS = (
+        "portfolio_total",
+        "outstanding_principal",
+        "interest_to_receive",
+        "loans_pending",
+        "loans_approved",
+        "loans_disbursed",
+        "loans_closed",
+        "loans_cancelled",
+    )
+    FLOW_FIELDS = (
+        "repayments_amount",
+        "repayments_count",
+        "disbursements_amount",
+        "vehicle_lease_amount",
+    )
+
+    class Meta:
+        managed = False
+        db_table = "sl_dashboard_kpi_snapshots"
+
+    def __str__(self):
+        return f"KPIs {self.snapshot_date}"
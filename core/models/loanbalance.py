@@ -0,0 +1,48 @@
+# core/models/loanbalance.py
+
+from django.db import models
+
+from .loan import Loan
+from .loanrepayment import LoanRepayment
+
+
+class LoanBalance(models.Model):
+    """
+    Resumo desnormalizado dos reembolsos de um empréstimo (1 linha por Loan).
+    Mantido por `register_repayment` / `register_disbursement` e reconstruível
+    com `manage.py rebuild_loan_balances`.
+    """
+
+    loan = models.OneToOneField(
+        Loan,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="balance_summary",
+    )
+
+    principal_paid_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    repayments_count = models.PositiveIntegerField(default=0)
+
+    # Ciclo actual (release_date / first_payment_date do empréstimo)
+    cycle_start = models.DateField(null=True, blank=True)
+    cycle_due = models.DateField(null=True, blank=True)
+    principal_paid_before_cycle = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    interest_paid_cycle = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    last_repayment = models.ForeignKey(
+        LoanRepayment,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    last_repayment_date = models.DateField(null=True, blank=True)
+
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_loan_balances"
+
+    def __str__(self):
+        return f"Saldo Loan #{self.loan_id}"
@@ -40,6 +40,11 @@ class LoanRepayment(models.Model):
         blank=True,
     )
     notes = models.TextField(null=True, blank=True)
+    # Referência do extracto (M-Pesa / e-Mola / banco) dos reembolsos importados
+    reference = models.CharField(max_length=100, null=True, blank=True, db_index=True)
+    # Lote e linha do ficheiro dos reembolsos importados (ver repayment_import)
+    import_batch = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    import_line = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
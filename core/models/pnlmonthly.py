@@ -0,0 +1,38 @@
+# core/models/pnlmonthly.py
+
+from django.db import models
+
+
+class PnlMonthly(models.Model):
+    """
+    Agregado mensal da demonstração de resultados (P&L): uma linha por
+    (mês, rubrica, categoria, conta da empresa).
+
+    - `line`: income / expense (com categoria), loan_interest / lease_revenue
+      (sem categoria — `category_id` = 0).
+    - `month`: 1º dia do mês da data de negócio do lançamento.
+
+    Reconstruído por `manage.py rebuild_pnl_rollup` e mantido pelos
+    lançamentos (services/pnl.py: apply_pnl_delta).
+    """
+
+    LINE_INCOME = "income"
+    LINE_EXPENSE = "expense"
+    LINE_LOAN_INTEREST = "loan_interest"
+    LINE_LEASE_REVENUE = "lease_revenue"
+
+    id = models.BigAutoField(primary_key=True)
+    month = models.DateField()
+    line = models.CharField(max_length=20)
+    category_id = models.BigIntegerField(default=0)
+    company_account_id = models.BigIntegerField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    entries = models.IntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_pnl_monthly"
+
+    def __str__(self):
+        return f"P&L {self.month:%Y-%m} · {self.line} {self.category_id} · conta {self.company_account_id}"
@@ -0,0 +1,42 @@
+# core/models/prerenderedreport.py
+
+from django.db import models
+
+from .companyaccount import CompanyAccount
+
+
+class PrerenderedReport(models.Model):
+    """
+    Índice dos PDFs de fim de mês gerados antecipadamente por
+    `manage.py prerender_month_end_reports` (um por tipo de relatório e
+    conta da empresa, ou global quando `company_account` é NULL).
+
+    `params_hash` identifica os parâmetros (ReportParams.digest()) e
+    `cache_key` a marca d'água dos dados na altura da geração: o ficheiro
+    só é servido enquanto a marca d'água actual for a mesma.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    report_type = models.CharField(max_length=30)
+    period_start = models.DateField()
+    period_end = models.DateField()
+    company_account = models.ForeignKey(
+        CompanyAccount,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="prerendered_reports",
+    )
+    params_hash = models.CharField(max_length=64, unique=True)
+    cache_key = models.CharField(max_length=64)
+    file = models.FileField(upload_to="reports/month_end/%Y/%m/")
+    file_size = models.BigIntegerField(default=0)
+    duration_ms = models.IntegerField(default=0)
+    generated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_prerendered_reports"
+
+    def __str__(self):
+        return f"{self.report_type} {self.period_start:%Y-%m} · conta {self.company_account_id or 'todas'}"
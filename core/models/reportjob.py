@@ -0,0 +1,67 @@
+# core/models/reportjob.py
+
+from django.conf import settings
+from django.db import models
+
+
+class ReportJob(models.Model):
+    """
+    Pedido de geração de um relatório PDF, processado fora do pedido web
+    pelo worker `manage.py run_report_worker`.
+
+    `inflight_key` tem o hash dos parâmetros enquanto o pedido está em fila
+    ou a correr (e NULL depois): a chave única impede dois pedidos iguais em
+    simultâneo — o segundo reutiliza o primeiro.
+
+    Pedidos servidos a partir da cache (`from_cache`) apontam para o ficheiro
+    de um pedido anterior com a mesma `cache_key`.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, "Em fila"),
+        (STATUS_RUNNING, "A gerar"),
+        (STATUS_DONE, "Concluído"),
+        (STATUS_FAILED, "Falhou"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    report_type = models.CharField(max_length=30)
+    params = models.JSONField()
+    params_hash = models.CharField(max_length=64)
+    inflight_key = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    # Parâmetros + marca d'água dos dados (ver services/report_cache.py):
+    # um pedido concluído com a mesma chave serve o mesmo PDF
+    cache_key = models.CharField(max_length=64, null=True, blank=True)
+    from_cache = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    file = models.FileField(upload_to="reports/%Y/%m/", null=True, blank=True)
+    file_size = models.BigIntegerField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    duration_ms = models.IntegerField(null=True, blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="report_jobs",
+    )
+    created_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        managed = False
+        db_table = "sl_report_jobs"
+
+    def __str__(self):
+        return f"Relatório #{self.id} · {self.report_type} · {self.status}"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
@@ -13,6 +13,18 @@ class Transaction(models.Model):
         (TX_TYPE_OUT, "Saída"),
     )
 
+    SOURCE_TYPE_LABELS = {
+        "income": "Rendimento",
+        "expense": "Despesa",
+        "manual": "Manual",
+        "loan_disbursement": "Desembolso de Empréstimo",
+        "loan_repayment": "Reembolso de Empréstimo",
+        "vehicle_lease_payment": "Pagamento Leasing de Veículo",
+        "tuktuk_lease_payment": "Pagamento Leasing de Veículo",
+        "opening_balance": "Saldo Inicial",
+        "adjustment": "Ajuste Manual",
+    }
+
     id = models.BigAutoField(primary_key=True)
     company_account = models.ForeignKey(
         CompanyAccount,
@@ -30,8 +42,9 @@ class Transaction(models.Model):
     tx_date = models.DateField()
     description = models.CharField(max_length=255)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
-    balance_before = models.DecimalField(max_digits=15, decimal_places=2)
-    balance_after = models.DecimalField(max_digits=15, decimal_places=2)
+    # NULL = lançamento do diário ainda não aplicado ao saldo da conta (modo "journal")
+    balance_before = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    balance_after = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField()
 
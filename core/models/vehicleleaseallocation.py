@@ -0,0 +1,47 @@
+# core/models/vehicleleaseallocation.py
+
+from django.db import models
+
+from .vehicleleasecontract import VehicleLeaseContract
+from .vehicleleasepayment import VehicleLeasePayment
+
+
+class VehicleLeaseAllocation(models.Model):
+    """
+    Parte de um pagamento de leasing imputada a uma semana do contrato.
+    Os pagamentos cobrem as semanas por ordem (FIFO): um pagamento pode
+    cobrir várias semanas (adiantamento) e uma semana pode ser coberta por
+    vários pagamentos (pagamentos parciais).
+
+    - `week`: nº da semana do contrato (1 = primeiro vencimento)
+    - `due_date`: vencimento dessa semana (services/lease_schedule.py)
+
+    Mantida por `create_vehicle_lease_payment` (services/lease_allocation.py)
+    e reconstruível com `manage.py rebuild_lease_allocations`.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+
+    contract = models.ForeignKey(
+        VehicleLeaseContract,
+        on_delete=models.CASCADE,
+        related_name="allocations",
+    )
+    payment = models.ForeignKey(
+        VehicleLeasePayment,
+        on_delete=models.CASCADE,
+        related_name="allocations",
+    )
+
+    week = models.PositiveIntegerField()
+    due_date = models.DateField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+
+    created_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_vehicle_lease_allocations"
+
+    def __str__(self):
+        return f"Contrato #{self.contract_id} · semana {self.week} · pagamento #{self.payment_id}"
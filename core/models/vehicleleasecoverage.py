@@ -0,0 +1,55 @@
+# core/models/vehicleleasecoverage.py
+
+from django.db import models
+
+from .vehicleleasecontract import VehicleLeaseContract
+from .vehicleleasepayment import VehicleLeasePayment
+
+
+class VehicleLeaseCoverage(models.Model):
+    """
+    Resumo desnormalizado das imputações de um contrato (1 linha por
+    VehicleLeaseContract): até onde as semanas estão pagas e qual a próxima
+    semana por cobrir, sem somar os pagamentos de novo.
+
+    - `weeks_covered`: semanas pagas por inteiro (1..weeks_covered)
+    - `partial_amount`: valor já pago da semana seguinte
+    - `unallocated_amount`: excesso depois da última semana do contrato
+    - `paid_until`: vencimento da última semana paga por inteiro
+    - `next_due_date`: vencimento da primeira semana por cobrir
+      (None se o contrato já está todo pago)
+    """
+
+    contract = models.OneToOneField(
+        VehicleLeaseContract,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="coverage",
+    )
+
+    weeks_covered = models.PositiveIntegerField(default=0)
+    partial_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    unallocated_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    paid_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    payments_count = models.PositiveIntegerField(default=0)
+
+    paid_until = models.DateField(null=True, blank=True)
+    next_due_date = models.DateField(null=True, blank=True)
+
+    last_payment = models.ForeignKey(
+        VehicleLeasePayment,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    last_payment_date = models.DateField(null=True, blank=True)
+
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_vehicle_lease_coverage"
+
+    def __str__(self):
+        return f"Cobertura Contrato #{self.contract_id}"
@@ -53,6 +53,9 @@ class VehicleLeasePayment(models.Model):
 
     notes = models.TextField("Notas", blank=True, null=True)
 
+    # Lote da cobrança semanal que registou o pagamento (ver lease_collection)
+    import_batch = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.PROTECT,
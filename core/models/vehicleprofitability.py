@@ -0,0 +1,49 @@
+# core/models/vehicleprofitability.py
+
+from django.db import models
+
+from .leasedvehicle import LeasedVehicle
+
+
+class VehicleProfitability(models.Model):
+    """
+    Resumo desnormalizado da rentabilidade de uma viatura ao longo de todos
+    os seus contratos (1 linha por LeasedVehicle). Mantido ao registar
+    pagamentos e contratos e reconstruível com
+    `manage.py rebuild_vehicle_profitability`.
+
+    - `revenue_total`: receita acumulada (pagamentos de todos os contratos)
+    - `closed_lease_days`: dias em leasing dos contratos já terminados
+    - `active_since` / `active_weekly_rent`: contrato activo (início e renda),
+      para contar os dias em curso e projectar o retorno
+    - `payback_date`: data em que a receita acumulada atingiu o custo de
+      aquisição (None enquanto não atingiu)
+    """
+
+    vehicle = models.OneToOneField(
+        LeasedVehicle,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="profitability",
+    )
+
+    revenue_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    payments_count = models.PositiveIntegerField(default=0)
+    last_payment_date = models.DateField(null=True, blank=True)
+
+    contracts_count = models.PositiveIntegerField(default=0)
+    first_lease_date = models.DateField(null=True, blank=True)
+    closed_lease_days = models.PositiveIntegerField(default=0)
+    active_since = models.DateField(null=True, blank=True)
+    active_weekly_rent = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    payback_date = models.DateField(null=True, blank=True)
+
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = "sl_vehicle_profitability"
+
+    def __str__(self):
+        return f"Rentabilidade Viatura #{self.vehicle_id}"
@@ -0,0 +1,5 @@
+# core/services/__init__.py
+#
+# Camada de serviços partilhada pelas views (cálculos de KPIs, motores de
+# saldos, etc.). As views continuam responsáveis por validar o pedido e
+# montar o contexto; aqui ficam as consultas e a lógica reutilizável.
@@ -0,0 +1,472 @@
+# core/services/amortization.py
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.utils import timezone
+
+
+METHOD_FLAT = "flat"
+METHOD_REDUCING = "reducing"
+METHOD_DAILY = "daily"
+
+CALCULATION_METHODS = {
+    METHOD_FLAT: "Taxa fixa sobre saldo (prestação constante)",
+    METHOD_REDUCING: "Saldo decrescente (amortização constante)",
+    METHOD_DAILY: "Juros diários sobre saldo (dias reais)",
+}
+
+PERIOD_MONTHLY = "monthly"
+PERIOD_DAILY = "daily"
+PERIOD_TYPES = (PERIOD_MONTHLY, PERIOD_DAILY)
+
+# Dias de um período mensal (taxa mensal convertida em diária nos juros diários)
+DAYS_PER_MONTH = 30
+
+# Taxa por período em décimas de milésima: ROUND(taxa / 100, 4) × 10 000,
+# o mesmo arredondamento dos juros do ciclo (repayment_state.cycle_interest)
+RATE_SCALE = 10000
+
+MAX_PERIODS = 3660
+
+# Empréstimos por chamada ao motor nos cálculos em lote (relatórios)
+SCHEDULE_BATCH_SIZE = 10000
+
+
+#=============================================================================
+#=============================================================================
+
+
+class ScheduleError(ValueError):
+    """
+    Condições de empréstimo inválidas para o quadro de amortização.
+    """
+
+
+@dataclass(frozen=True)
+class LoanTerms:
+    """
+    Condições de um empréstimo para o quadro de amortização.
+
+    - rate: % por período do tipo de juro (InterestType.rate)
+    - rate_period_type: período da taxa (InterestType.period_type); por
+      omissão, o do empréstimo
+    - payment: prestação indicada (flat / daily); None = prestação sugerida
+    - start_date: data de libertação; os vencimentos são start_date + k períodos
+    """
+
+    principal: Decimal
+    rate: Decimal
+    periods: int
+    period_type: str = PERIOD_MONTHLY
+    method: str = METHOD_FLAT
+    rate_period_type: str = None
+    payment: Decimal = None
+    start_date: date = None
+
+    @classmethod
+    def for_loan(cls, loan, interest_type=None):
+        interest_type = interest_type or loan.interest_type
+        return cls(
+            principal=loan.principal_amount,
+            rate=interest_type.rate,
+            periods=loan.term_periods,
+            period_type=loan.period_type or PERIOD_MONTHLY,
+            method=interest_type.calculation_method or METHOD_FLAT,
+            rate_period_type=interest_type.period_type,
+            payment=loan.payment_per_period,
+            start_date=_start_date(loan.release_date, loan.created_at),
+        )
+
+    def validate(self):
+        if self.method not in CALCULATION_METHODS:
+            raise ScheduleError(f"Método de cálculo desconhecido: {self.method}.")
+        if self.period_type not in PERIOD_TYPES or (self.rate_period_type or self.period_type) not in PERIOD_TYPES:
+            raise ScheduleError("Tipo de período inválido.")
+        if self.principal is None or self.principal <= 0:
+            raise ScheduleError("Valor do empréstimo deve ser maior que zero.")
+        if self.rate is None or self.rate < 0:
+            raise ScheduleError("Taxa de juro inválida.")
+        if not self.periods or not 0 < self.periods <= MAX_PERIODS:
+            raise ScheduleError(f"Número de períodos deve estar entre 1 e {MAX_PERIODS}.")
+        if self.payment is not None and self.payment <= 0:
+            raise ScheduleError("Pagamento por ciclo deve ser maior que zero.")
+        return self
+
+
+def _start_date(release_date, created_at):
+    if release_date is None and created_at is not None:
+        return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+    return release_date
+
+
+def _cents(value):
+    return int((Decimal(value) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def _money(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def _rate_units(rate):
+    return int(((Decimal(rate) / 100).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)) * RATE_SCALE)
+
+
+def _round_div(numerator, denominator):
+    """
+    numerator / denominator arredondado (metade para cima), em inteiros não negativos.
+    """
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass(frozen=True)
+class Schedule:
+    """
+    Quadro de amortização de um empréstimo (valores em MT, ao centavo).
+    """
+
+    terms: LoanTerms
+    payment: Decimal
+    due_dates: list
+    opening: list
+    interest: list
+    installments: list
+    principal: list
+    closing: list
+
+    @property
+    def total_interest(self):
+        return sum(self.interest, Decimal("0.00"))
+
+    @property
+    def total_paid(self):
+        return sum(self.installments, Decimal("0.00"))
+
+    @property
+    def remaining(self):
+        return self.closing[-1] if self.closing else self.terms.principal
+
+    def rows(self):
+        return [
+            {
+                "period": k + 1,
+                "due_date": self.due_dates[k],
+                "opening": self.opening[k],
+                "interest": self.interest[k],
+                "installment": self.installments[k],
+                "principal": self.principal[k],
+                "closing": self.closing[k],
+            }
+            for k in range(len(self.opening))
+        ]
+
+    def as_dict(self):
+        return {
+            "method": self.terms.method,
+            "method_label": CALCULATION_METHODS[self.terms.method],
+            "period_type": self.terms.period_type,
+            "principal": str(self.terms.principal),
+            "periods": self.terms.periods,
+            "payment": str(self.payment),
+            "total_interest": str(self.total_interest),
+            "total_paid": str(self.total_paid),
+            "remaining": str(self.remaining),
+            "rows": [
+                {**row, "due_date": row["due_date"].isoformat(), **{
+                    name: str(row[name]) for name in ("opening", "interest", "installment", "principal", "closing")
+                }}
+                for row in self.rows()
+            ],
+        }
+
+
+class ScheduleBatch:
+    """
+    Quadros de vários empréstimos calculados de uma vez: matrizes
+    (empréstimos × períodos) em centavos. `batch[i]` devolve o Schedule do
+    i-ésimo empréstimo; `total_interest()` os juros totais de todos.
+    """
+
+    def __init__(self, terms, payment, due, opening, interest, installment, principal, closing, active):
+        self.terms = terms
+        self.payment = payment
+        self.due = due
+        self.opening = opening
+        self.interest = interest
+        self.installment = installment
+        self.principal = principal
+        self.closing = closing
+        self.active = active
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __getitem__(self, i):
+        used = self.active[i]
+        return Schedule(
+            terms=self.terms[i],
+            payment=_money(self.payment[i]),
+            due_dates=list(self.due[i][used].astype(object)),
+            **{
+                name: [_money(c) for c in getattr(self, attr)[i][used]]
+                for name, attr in (
+                    ("opening", "opening"),
+                    ("interest", "interest"),
+                    ("installments", "installment"),
+                    ("principal", "principal"),
+                    ("closing", "closing"),
+                )
+            },
+        )
+
+    def total_interest(self):
+        return [_money(c) for c in self.interest.sum(axis=1)]
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _due_dates(np, start, n_max, monthly):
+    """
+    Vencimentos (empréstimos × períodos): start + k meses (dia limitado ao
+    fim do mês) ou start + k dias.
+    """
+    k = np.arange(1, n_max + 1)
+    if not monthly.any():
+        return start[:, None] + k[None, :]
+
+    start_month = start.astype("datetime64[M]")
+    day = (start - start_month.astype("datetime64[D]")).astype(np.int64)
+    due_month = start_month[:, None] + k[None, :]
+    first = due_month.astype("datetime64[D]")
+    length = ((due_month + 1).astype("datetime64[D]") - first).astype(np.int64)
+    by_month = first + np.minimum(day[:, None], length - 1)
+    return np.where(monthly[:, None], by_month, start[:, None] + k[None, :])
+
+
+def _annuity(np, principal, periods, payment, interest_at):
+    """
+    Prestação constante sobre o saldo (flat / daily): período a período,
+    vectorizado sobre os empréstimos. Se a prestação não cobre os juros, o
+    saldo não baixa; a última prestação (ou a que chega para liquidar)
+    paga saldo + juros.
+    """
+    count, n_max = len(principal), int(periods.max())
+    shape = (count, n_max)
+    opening, interest, installment, amort, closing = (np.zeros(shape, np.int64) for _ in range(5))
+    active = np.zeros(shape, bool)
+
+    balance = principal.copy()
+    for k in range(n_max):
+        on = (k < periods) & (balance > 0)
+        due = np.where(on, interest_at(balance, k), 0)
+        settle = (k == periods - 1) | (payment - due >= balance)
+        pay = np.where(settle, balance + due, payment)
+        paid_principal = np.where(settle, balance, np.maximum(pay - due, 0))
+
+        opening[:, k] = np.where(on, balance, 0)
+        interest[:, k] = due
+        installment[:, k] = np.where(on, pay, 0)
+        amort[:, k] = np.where(on, paid_principal, 0)
+        balance = balance - amort[:, k]
+        closing[:, k] = np.where(on, balance, 0)
+        active[:, k] = on
+
+    return opening, interest, installment, amort, closing, active
+
+
+def _reducing(np, principal, periods, rate):
+    """
+    Amortização constante (principal / n; resto na última) e juros sobre o
+    saldo — forma fechada, vectorizada sobre empréstimos e períodos.
+    """
+    n_max = int(periods.max())
+    k = np.arange(n_max)[None, :]
+    n = periods[:, None]
+    share = (principal // periods)[:, None]
+
+    active = k < n
+    opening = np.where(active, principal[:, None] - k * share, 0)
+    amort = np.where(k == n - 1, opening, np.where(active, share, 0))
+    interest = _round_div(opening * rate[:, None], RATE_SCALE)
+    installment = amort + interest
+    closing = opening - amort
+    return opening, interest, installment, amort, closing, active
+
+
+def build_schedules(terms_list, today=None):
+    """
+    Quadros de amortização de vários empréstimos de uma só vez (NumPy,
+    aritmética inteira em centavos). Devolve um ScheduleBatch pela mesma
+    ordem de `terms_list`. Lança ScheduleError.
+    """
+    import numpy as np
+
+    terms_list = [terms.validate() for terms in terms_list]
+    today = today or timezone.localdate()
+    count = len(terms_list)
+
+    principal = np.array([_cents(t.principal) for t in terms_list], np.int64)
+    rate = np.array([_rate_units(t.rate) for t in terms_list], np.int64)
+    periods = np.array([t.periods for t in terms_list], np.int64)
+    monthly = np.array([t.period_type == PERIOD_MONTHLY for t in terms_list], bool)
+    rate_monthly = np.array([(t.rate_period_type or t.period_type) == PERIOD_MONTHLY for t in terms_list], bool)
+    start = np.array([t.start_date or today for t in terms_list], "datetime64[D]")
+    methods = np.array([t.method for t in terms_list])
+    n_max = int(periods.max()) if count else 0
+
+    due = _due_dates(np, start, n_max, monthly) if count else np.zeros((0, 0), "datetime64[D]")
+    shape = (count, n_max)
+    out = [np.zeros(shape, np.int64) for _ in range(5)] + [np.zeros(shape, bool)]
+
+    # Taxa nominal por período do empréstimo (prestação sugerida): flat/reducing
+    # aplicam a taxa a cada período; daily converte-a pelos dias do período
+    period_days = np.where(monthly, DAYS_PER_MONTH, 1)
+    rate_days = np.where(rate_monthly, DAYS_PER_MONTH, 1)
+    nominal = rate / RATE_SCALE * np.where(methods == METHOD_DAILY, period_days / rate_days, 1.0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        suggested = np.where(
+            nominal > 0,
+            principal * nominal / (1 - (1 + nominal) ** (-periods.astype(float))),
+            principal / periods,
+        )
+    suggested = np.floor(suggested + 0.5).astype(np.int64)
+    given = np.array([_cents(t.payment) if t.payment is not None else 0 for t in terms_list], np.int64)
+    payment = np.where(given > 0, given, suggested)
+
+    for method in CALCULATION_METHODS:
+        rows = np.flatnonzero(methods == method)
+        if not len(rows):
+            continue
+        p, n, r = principal[rows], periods[rows], rate[rows]
+
+        if method == METHOD_REDUCING:
+            result = _reducing(np, p, n, r)
+        elif method == METHOD_FLAT:
+            result = _annuity(np, p, n, payment[rows], lambda b, k, r=r: _round_div(b * r, RATE_SCALE))
+        else:
+            previous = np.concatenate([start[rows, None], due[rows, :-1]], axis=1)
+            days = (due[rows] - previous).astype(np.int64)
+            basis = RATE_SCALE * rate_days[rows]
+            result = _annuity(
+                np, p, n, payment[rows],
+                lambda b, k, r=r, days=days, basis=basis: _round_div(b * r * days[:, k], basis),
+            )
+
+        width = result[0].shape[1]
+        for target, values in zip(out, result):
+            target[rows, :width] = values
+
+    # Na amortização constante a "prestação" mostrada é a primeira
+    reducing = methods == METHOD_REDUCING
+    if reducing.any():
+        payment = np.where(reducing, out[2][:, 0], payment)
+
+    return ScheduleBatch(terms_list, payment, due, *out)
+
+
+def build_schedule(terms, today=None):
+    """
+    Quadro de amortização de um empréstimo.
+    """
+    return build_schedules([terms], today)[0]
+
+
+#=============================================================================
+#=============================================================================
+
+
+# Colunas de Loan necessárias para LoanTerms (quadros em lote)
+LOAN_TERMS_FIELDS = (
+    "pk",
+    "principal_amount",
+    "term_periods",
+    "period_type",
+    "payment_per_period",
+    "release_date",
+    "created_at",
+    "interest_type__rate",
+    "interest_type__period_type",
+    "interest_type__calculation_method",
+)
+
+
+def _terms_from_row(row):
+    _, principal, periods, period_type, payment, release_date, created_at, rate, rate_period, method = row
+    return LoanTerms(
+        principal=principal,
+        rate=rate or Decimal("0"),
+        periods=periods,
+        period_type=period_type or PERIOD_MONTHLY,
+        method=method or METHOD_FLAT,
+        rate_period_type=rate_period,
+        payment=payment,
+        start_date=_start_date(release_date, created_at),
+    )
+
+
+def expected_interest_total(loans, batch_size=SCHEDULE_BATCH_SIZE):
+    """
+    Soma dos juros previstos pelos quadros de amortização de um queryset de
+    Loan, calculados em lotes de `batch_size` empréstimos (uma query e uma
+    chamada ao motor por lote). Empréstimos com condições inválidas não contam.
+    """
+    total = Decimal("0.00")
+    qs = loans.order_by("pk").values_list(*LOAN_TERMS_FIELDS)
+    last_pk = None
+    while True:
+        page = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+        rows = list(page[:batch_size])
+        terms = []
+        for row in rows:
+            candidate = _terms_from_row(row)
+            try:
+                terms.append(candidate.validate())
+            except (ScheduleError, TypeError, InvalidOperation):
+                continue
+        if terms:
+            total += sum(build_schedules(terms).total_interest(), Decimal("0.00"))
+        if len(rows) < batch_size:
+            return total
+        last_pk = rows[-1][0]
+
+
+def parse_terms(data, interest_type, today=None):
+    """
+    LoanTerms a partir de um formulário / query string (principal, periods,
+    period_type, payment, start_date) e do InterestType. Lança ScheduleError.
+    """
+    def number(name, label, cast=Decimal, required=True):
+        raw = (data.get(name) or "").strip()
+        if not raw:
+            if required:
+                raise ScheduleError(f"Informe {label}.")
+            return None
+        try:
+            return cast(raw)
+        except (InvalidOperation, ValueError):
+            raise ScheduleError(f"Valor inválido: {label}.")
+
+    start_raw = (data.get("start_date") or "").strip()
+    try:
+        start_date = datetime.strptime(start_raw, "%Y-%m-%d").date() if start_raw else (today or timezone.localdate())
+    except ValueError:
+        raise ScheduleError("Data de início inválida.")
+
+    return LoanTerms(
+        principal=number("principal", "o valor do empréstimo"),
+        rate=interest_type.rate,
+        periods=number("periods", "o número de períodos", int),
+        period_type=(data.get("period_type") or interest_type.period_type or PERIOD_MONTHLY).strip(),
+        method=interest_type.calculation_method or METHOD_FLAT,
+        rate_period_type=interest_type.period_type,
+        payment=number("payment", "o pagamento por ciclo", required=False),
+        start_date=start_date,
+    ).validate()
@@ -0,0 +1,313 @@
+# core/services/dashboard_metrics.py
+
+import json
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Count,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import (
+    Loan,
+    LoanRepayment,
+    LoanDisbursement,
+    VehicleLeaseContract,
+    VehicleLeasePayment,
+)
+from core.services.money import MONEY_FIELD
+from core.services.posting import company_accounts_balance
+
+
+ACTIVE_LOAN_STATUSES = ["approved", "disbursed"]
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _money_sum(expression, **filters):
+    """
+    Sum(...) condicional com Coalesce para 0 — base de todas as agregações
+    deste módulo (uma coluna por KPI, uma query por tabela).
+    """
+    condition = Q(**filters) if filters else None
+    return Coalesce(
+        Sum(expression, filter=condition),
+        Decimal("0"),
+        output_field=MONEY_FIELD,
+    )
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def next_month(month_start):
+    if month_start.month == 12:
+        return date(month_start.year + 1, 1, 1)
+    return date(month_start.year, month_start.month + 1, 1)
+
+
+def last_months(today, count=6):
+    """
+    Devolve uma lista de datas (1º dia de cada mês) dos últimos `count` meses,
+    incluindo o mês actual, em ordem cronológica.
+    """
+    months = [_month_start(today)]
+    for _ in range(count - 1):
+        first = months[0]
+        if first.month == 1:
+            months.insert(0, date(first.year - 1, 12, 1))
+        else:
+            months.insert(0, date(first.year, first.month - 1, 1))
+    return months
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass(frozen=True)
+class DashboardKPIs:
+    """
+    Fotografia (snapshot) dos KPIs do dashboard.
+    Os nomes do contexto do template são mantidos em `as_context()`.
+    """
+
+    today: date
+
+    # Carteira
+    portfolio_total: Decimal = Decimal("0")
+    outstanding_principal: Decimal = Decimal("0")
+    outstanding_loans_count: int = 0
+    interest_to_receive: Decimal = Decimal("0")
+
+    # Estado dos empréstimos
+    status_pending_count: int = 0
+    status_approved_count: int = 0
+    status_disbursed_count: int = 0
+    status_closed_count: int = 0
+    status_cancelled_count: int = 0
+
+    # Reembolsos / leasing
+    today_repayments_amount: Decimal = Decimal("0")
+    today_repayments_count: int = 0
+    mc_income_30d: Decimal = Decimal("0")
+    vehicle_active_contracts: int = 0
+    vehicle_month_income: Decimal = Decimal("0")
+    vehicle_income_30d: Decimal = Decimal("0")
+
+    # Contas da empresa
+    company_accounts_balance: Decimal = Decimal("0")
+
+    # Séries mensais (mesma ordem que `months`)
+    months: list = field(default_factory=list)
+    disbursed_by_month: list = field(default_factory=list)
+    repaid_by_month: list = field(default_factory=list)
+
+    @property
+    def status_active_count(self):
+        return self.status_approved_count + self.status_disbursed_count
+
+    @property
+    def this_month_disbursed(self):
+        return self.disbursed_by_month[-1] if self.disbursed_by_month else Decimal("0")
+
+    @property
+    def prev_month_disbursed(self):
+        return self.disbursed_by_month[-2] if len(self.disbursed_by_month) > 1 else Decimal("0")
+
+    @property
+    def portfolio_change_label(self):
+        prev = self.prev_month_disbursed
+        if prev > 0:
+            change = (float(self.this_month_disbursed) - float(prev)) / float(prev) * 100.0
+            return f"{change:+.1f}% vs mês anterior"
+        return "— vs mês anterior"
+
+    def as_context(self):
+        """
+        Chaves de contexto usadas pelo `dashboard.html` (KPIs + gráficos).
+        """
+        return {
+            # KPIs
+            "kpi_portfolio_total": self.portfolio_total,
+            "kpi_portfolio_change_label": self.portfolio_change_label,
+            "kpi_outstanding_principal": self.outstanding_principal,
+            "kpi_outstanding_loans_count": self.outstanding_loans_count,
+            "kpi_interest_to_receive": self.interest_to_receive,
+            "kpi_today_repayments": self.today_repayments_amount,
+            "kpi_today_repayments_count": self.today_repayments_count,
+            "kpi_vehicle_active_contracts": self.vehicle_active_contracts,
+            "kpi_vehicle_month_income": self.vehicle_month_income,
+            "kpi_company_accounts_balance": self.company_accounts_balance,
+            "kpi_status_active_count": self.status_active_count,
+            "kpi_status_pending_count": self.status_pending_count,
+            "kpi_status_closed_count": self.status_closed_count,
+            "kpi_status_cancelled_count": self.status_cancelled_count,
+            "kpi_mc_income_30d": self.mc_income_30d,
+            "kpi_vehicle_income_30d": self.vehicle_income_30d,
+
+            # Gráfico 1: Linha – Desembolsos vs Reembolsos
+            "chart_loan_cashflow_labels": json.dumps([m.strftime("%b/%Y") for m in self.months]),
+            "chart_loan_cashflow_disbursed": json.dumps([float(v) for v in self.disbursed_by_month]),
+            "chart_loan_cashflow_repaid": json.dumps([float(v) for v in self.repaid_by_month]),
+
+            # Gráfico 2: Doughnut – carteira por status
+            "chart_loan_status_labels": json.dumps(["Activos", "Pendentes", "Fechados", "Cancelados"]),
+            "chart_loan_status_values": json.dumps(
+                [
+                    self.status_active_count,
+                    self.status_pending_count,
+                    self.status_closed_count,
+                    self.status_cancelled_count,
+                ]
+            ),
+
+            # Gráfico 3: Barras – Microcrédito vs Leasing (últimos 30 dias)
+            "chart_mc_vs_leasing_labels": json.dumps(["Últimos 30 dias"]),
+            "chart_mc_vs_leasing_mc_values": json.dumps([float(self.mc_income_30d)]),
+            "chart_mc_vs_leasing_leasing_values": json.dumps([float(self.vehicle_income_30d)]),
+        }
+
+
+#=============================================================================
+#=============================================================================
+
+
+def loan_metrics():
+    """
+    1 query sobre sl_loans: carteira, principal em dívida, juros a receber
+    e contagens por status.
+    """
+    last_repayment_sub = (
+        LoanRepayment.objects.filter(loan_id=OuterRef("pk"))
+        .order_by("-payment_date", "-id")
+        .values("principal_balance_after")[:1]
+    )
+
+    active = Q(status__in=ACTIVE_LOAN_STATUSES)
+
+    row = (
+        Loan.objects
+        .annotate(
+            outstanding=Coalesce(
+                Subquery(last_repayment_sub),
+                F("principal_amount"),
+                output_field=MONEY_FIELD,
+            ),
+            interest_total=ExpressionWrapper(
+                Coalesce(F("payment_per_period"), 0) * Coalesce(F("term_periods"), 0)
+                - F("principal_amount"),
+                output_field=MONEY_FIELD,
+            ),
+        )
+        .aggregate(
+            portfolio_total=Coalesce(
+                Sum("principal_amount", filter=~Q(status="cancelled")),
+                Decimal("0"),
+                output_field=MONEY_FIELD,
+            ),
+            outstanding_principal=Coalesce(
+                Sum("outstanding", filter=active), Decimal("0"), output_field=MONEY_FIELD
+            ),
+            interest_to_receive=Coalesce(
+                Sum("interest_total", filter=active), Decimal("0"), output_field=MONEY_FIELD
+            ),
+            status_pending_count=Count("id", filter=Q(status="pending")),
+            status_approved_count=Count("id", filter=Q(status="approved")),
+            status_disbursed_count=Count("id", filter=Q(status="disbursed")),
+            status_closed_count=Count("id", filter=Q(status="closed")),
+            status_cancelled_count=Count("id", filter=Q(status="cancelled")),
+        )
+    )
+    row["outstanding_loans_count"] = row["status_approved_count"] + row["status_disbursed_count"]
+    return row
+
+
+def _monthly_sums(date_field, months, amount_field="amount"):
+    """
+    Uma coluna Sum(...) condicional por mês, para usar dentro de um único aggregate().
+    """
+    columns = {}
+    for i, month in enumerate(months):
+        columns[f"month_{i}"] = _money_sum(
+            amount_field,
+            **{f"{date_field}__gte": month, f"{date_field}__lt": next_month(month)},
+        )
+    return columns
+
+
+def _unpack_months(row, months):
+    return [row.pop(f"month_{i}") for i in range(len(months))]
+
+
+def compute_dashboard_kpis(today=None):
+    """
+    Calcula os KPIs do dashboard com agregação condicional:
+    uma query por tabela de origem (Loan, LoanRepayment, LoanDisbursement,
+    VehicleLeaseContract, VehicleLeasePayment, CompanyAccount).
+    """
+    today = today or timezone.localdate()
+    start_30d = today - timedelta(days=30)
+    start_month = _month_start(today)
+    months = last_months(today)
+
+    loans = loan_metrics()
+
+    # Reembolsos: hoje, últimos 30 dias e série mensal
+    repay = (
+        LoanRepayment.objects
+        .filter(payment_date__gte=min(months[0], start_30d))
+        .aggregate(
+            today_repayments_amount=_money_sum("amount", payment_date=today),
+            today_repayments_count=Count("id", filter=Q(payment_date=today)),
+            mc_income_30d=_money_sum("amount", payment_date__gte=start_30d),
+            **_monthly_sums("payment_date", months),
+        )
+    )
+    repaid_by_month = _unpack_months(repay, months)
+
+    # Desembolsos: série mensal (inclui mês actual e anterior)
+    disb = (
+        LoanDisbursement.objects
+        .filter(disburse_date__gte=months[0])
+        .aggregate(**_monthly_sums("disburse_date", months))
+    )
+    disbursed_by_month = _unpack_months(disb, months)
+
+    # Leasing: renda do mês e últimos 30 dias
+    vehicle = (
+        VehicleLeasePayment.objects
+        .filter(payment_date__gte=min(start_month, start_30d))
+        .aggregate(
+            vehicle_month_income=_money_sum(
+                "amount", payment_date__gte=start_month, payment_date__lte=today
+            ),
+            vehicle_income_30d=_money_sum("amount", payment_date__gte=start_30d),
+        )
+    )
+
+    vehicle_active_contracts = VehicleLeaseContract.objects.filter(status="active").count()
+
+    return DashboardKPIs(
+        today=today,
+        vehicle_active_contracts=vehicle_active_contracts,
+        company_accounts_balance=company_accounts_balance(),
+        months=months,
+        disbursed_by_month=disbursed_by_month,
+        repaid_by_month=repaid_by_month,
+        **loans,
+        **repay,
+        **vehicle,
+    )
@@ -0,0 +1,169 @@
+# core/services/datatables.py
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+MAX_PAGE_LENGTH = 500
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _int(value, default):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass(frozen=True)
+class DataTablesRequest:
+    """
+    Parâmetros do protocolo server-side do DataTables (GET), mais o cursor
+    de paginação por chave (keyset) enviado pelo template:
+    - cursor_start: índice da página a que o cursor se refere
+    - cursor_value / cursor_id: coluna de ordenação e id do último registo
+      da página anterior
+    """
+
+    draw: int
+    start: int
+    length: int
+    search: str
+    order_column: int
+    order_dir: str
+    cursor_value: str = None
+    cursor_id: int = None
+
+    @property
+    def descending(self):
+        return self.order_dir == "desc"
+
+    @property
+    def has_cursor(self):
+        return self.cursor_id is not None
+
+
+def parse_datatables_request(params, default_order_column=0, default_order_dir="desc"):
+    length = _int(params.get("length"), 10)
+    if length <= 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+
+    start = max(_int(params.get("start"), 0), 0)
+    order_dir = params.get("order[0][dir]", default_order_dir)
+
+    cursor_id = None
+    cursor_value = None
+    if _int(params.get("cursor_start"), -1) == start and params.get("cursor_id"):
+        cursor_id = _int(params.get("cursor_id"), None)
+        cursor_value = params.get("cursor_value")
+
+    return DataTablesRequest(
+        draw=_int(params.get("draw"), 0),
+        start=start,
+        length=length,
+        search=params.get("search[value]", "").strip(),
+        order_column=_int(params.get("order[0][column]"), default_order_column),
+        order_dir="asc" if order_dir == "asc" else "desc",
+        cursor_value=cursor_value,
+        cursor_id=cursor_id,
+    )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _lookup(obj, path):
+    for part in path.split("__"):
+        obj = getattr(obj, part, None) if obj is not None else None
+    return obj
+
+
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _cursor_value(value):
+    """
+    Valor da coluna de ordenação como vai no cursor (GET), ou None quando
+    não faz a ida e volta (nulo ou booleano).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    return _json_value(value)
+
+
+def keyset_page(queryset, dt, order_field):
+    """
+    Uma página ordenada por (order_field, id).
+
+    Com cursor (continuação da página anterior) usa paginação por chave:
+    WHERE (order_field, id) < (valor, id) — sem OFFSET, custo constante
+    em qualquer página. Sem cursor (salto directo para uma página) recorre
+    a OFFSET/LIMIT.
+
+    Os nulos ficam primeiro em ordem ascendente e por último em descendente
+    (a ordem do MySQL, explícita para ser igual nas outras bases); em
+    descendente, as linhas com a coluna a NULL seguem-se ao cursor. Um
+    cursor sobre um valor nulo ou booleano não é devolvido: a página
+    seguinte recorre a OFFSET.
+
+    Devolve (linhas, cursor para a página seguinte ou None).
+    """
+    op = "lt" if dt.descending else "gt"
+    prefix = "-" if dt.descending else ""
+    by_pk = order_field in ("id", "pk")
+
+    if by_pk:
+        qs = queryset.order_by(f"{prefix}pk")
+        page = qs.filter(**{f"pk__{op}": dt.cursor_id}) if dt.has_cursor else None
+    else:
+        if dt.descending:
+            qs = queryset.order_by(F(order_field).desc(nulls_last=True), f"{prefix}pk")
+        else:
+            qs = queryset.order_by(F(order_field).asc(nulls_first=True), f"{prefix}pk")
+        page = None
+        if dt.has_cursor and dt.cursor_value is not None:
+            after = (
+                Q(**{f"{order_field}__{op}": dt.cursor_value})
+                | Q(**{order_field: dt.cursor_value, f"pk__{op}": dt.cursor_id})
+            )
+            if dt.descending:
+                after |= Q(**{f"{order_field}__isnull": True})
+            try:
+                page = qs.filter(after)
+            except (ValueError, ValidationError):
+                # cursor adulterado: valor que a coluna não aceita
+                page = None
+
+    rows = list(page[: dt.length] if page is not None else qs[dt.start: dt.start + dt.length])
+
+    cursor = None
+    if rows:
+        last = rows[-1]
+        value = last.pk if by_pk else _cursor_value(_lookup(last, order_field))
+        if value is not None:
+            cursor = {"start": dt.start + len(rows), "value": value, "id": last.pk}
+    return rows, cursor
+
+
+def datatables_response(dt, records_total, records_filtered, data, **extra):
+    payload = {
+        "draw": dt.draw,
+        "recordsTotal": records_total,
+        "recordsFiltered": records_filtered,
+        "data": data,
+    }
+    payload.update(extra)
+    return payload
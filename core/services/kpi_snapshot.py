@@ -0,0 +1,242 @@
+# core/services/kpi_snapshot.py
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import (
+    DashboardKPISnapshot,
+    LoanRepayment,
+    LoanDisbursement,
+    VehicleLeaseContract,
+    VehicleLeasePayment,
+)
+from core.services.dashboard_metrics import (
+    DashboardKPIs,
+    compute_dashboard_kpis,
+    last_months,
+    loan_metrics,
+    next_month,
+)
+from core.services.money import MONEY_FIELD
+from core.services.posting import company_accounts_balance
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _snapshot_exists():
+    return DashboardKPISnapshot.objects.exists()
+
+
+def _ensure_row(day):
+    """
+    Garante que existe a linha de `day`. As colunas de stock são copiadas da
+    última fotografia anterior (com stocks conhecidos).
+    """
+    if DashboardKPISnapshot.objects.filter(snapshot_date=day).exists():
+        return
+
+    previous = (
+        DashboardKPISnapshot.objects
+        .filter(snapshot_date__lt=day, portfolio_total__isnull=False)
+        .order_by("-snapshot_date")
+        .values(*DashboardKPISnapshot.STOCK_FIELDS)
+        .first()
+    ) or {}
+
+    try:
+        with db_transaction.atomic():
+            DashboardKPISnapshot.objects.create(
+                snapshot_date=day,
+                updated_at=timezone.now(),
+                **previous,
+            )
+    except IntegrityError:
+        # Criada por outra transacção em paralelo
+        pass
+
+
+def apply_kpi_delta(flow_date=None, **deltas):
+    """
+    Aplica variações incrementais à fotografia de KPIs.
+    Deve ser chamada dentro da mesma transacção (atomic) da operação de negócio.
+
+    - Campos de stock: aplicados ao dia actual e a quaisquer linhas futuras.
+    - Campos de fluxo: aplicados à linha de `flow_date` (data de negócio).
+
+    Se a fotografia nunca foi construída (`rebuild_kpi_snapshot`), não faz nada:
+    o dashboard continua a calcular os KPIs a partir das tabelas.
+    """
+    deltas = {name: value for name, value in deltas.items() if value}
+    if not deltas or not _snapshot_exists():
+        return
+
+    now = timezone.now()
+    today = timezone.localdate()
+
+    stock = {n: v for n, v in deltas.items() if n in DashboardKPISnapshot.STOCK_FIELDS}
+    flow = {n: v for n, v in deltas.items() if n in DashboardKPISnapshot.FLOW_FIELDS}
+    unknown = set(deltas) - set(stock) - set(flow)
+    if unknown:
+        raise ValueError(f"Campos de KPI desconhecidos: {', '.join(sorted(unknown))}")
+
+    if stock:
+        _ensure_row(today)
+        DashboardKPISnapshot.objects.filter(snapshot_date__gte=today).update(
+            updated_at=now,
+            **{name: F(name) + value for name, value in stock.items()},
+        )
+
+    if flow:
+        flow_date = flow_date or today
+        _ensure_row(flow_date)
+        DashboardKPISnapshot.objects.filter(snapshot_date=flow_date).update(
+            updated_at=now,
+            **{name: F(name) + value for name, value in flow.items()},
+        )
+
+
+def loan_interest_total(loan):
+    """
+    Juros previstos de um empréstimo (mesma fórmula do KPI "juros a receber").
+    """
+    return (loan.payment_per_period or Decimal("0")) * (loan.term_periods or 0) - loan.principal_amount
+
+
+#=============================================================================
+#=============================================================================
+
+
+@db_transaction.atomic
+def rebuild_kpi_snapshot():
+    """
+    Reconstrói a fotografia a partir das tabelas de origem:
+    - stocks actuais na linha de hoje;
+    - fluxos de todas as datas (agrupados por data de negócio).
+    Stocks de datas passadas não são reconstituíveis e ficam a NULL.
+    Devolve o número de linhas escritas.
+    """
+    today = timezone.localdate()
+    now = timezone.now()
+
+    rows = {}
+
+    def row(day):
+        if day not in rows:
+            rows[day] = DashboardKPISnapshot(snapshot_date=day, updated_at=now)
+        return rows[day]
+
+    repayments = (
+        LoanRepayment.objects.values("payment_date")
+        .annotate(total=Sum("amount"), n=Count("id"))
+    )
+    for r in repayments:
+        snap = row(r["payment_date"])
+        snap.repayments_amount = r["total"] or Decimal("0")
+        snap.repayments_count = r["n"]
+
+    disbursements = LoanDisbursement.objects.values("disburse_date").annotate(total=Sum("amount"))
+    for r in disbursements:
+        row(r["disburse_date"]).disbursements_amount = r["total"] or Decimal("0")
+
+    lease_payments = VehicleLeasePayment.objects.values("payment_date").annotate(total=Sum("amount"))
+    for r in lease_payments:
+        row(r["payment_date"]).vehicle_lease_amount = r["total"] or Decimal("0")
+
+    loans = loan_metrics()
+    stocks = {
+        "portfolio_total": loans["portfolio_total"],
+        "outstanding_principal": loans["outstanding_principal"],
+        "interest_to_receive": loans["interest_to_receive"],
+        "loans_pending": loans["status_pending_count"],
+        "loans_approved": loans["status_approved_count"],
+        "loans_disbursed": loans["status_disbursed_count"],
+        "loans_closed": loans["status_closed_count"],
+        "loans_cancelled": loans["status_cancelled_count"],
+    }
+    for day in [d for d in rows if d > today] + [today]:
+        for name, value in stocks.items():
+            setattr(row(day), name, value)
+
+    DashboardKPISnapshot.objects.all().delete()
+    DashboardKPISnapshot.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def load_dashboard_kpis(today=None):
+    """
+    KPIs do dashboard lidos da fotografia (1 linha de stocks + 1 agregação
+    sobre as linhas de fluxo dos últimos meses). Se a fotografia ainda não
+    existir, calcula a partir das tabelas de origem.
+    """
+    today = today or timezone.localdate()
+
+    stocks = (
+        DashboardKPISnapshot.objects
+        .filter(snapshot_date__lte=today, portfolio_total__isnull=False)
+        .order_by("-snapshot_date")
+        .first()
+    )
+    if stocks is None:
+        return compute_dashboard_kpis(today)
+
+    start_30d = today - timedelta(days=30)
+    start_month = today.replace(day=1)
+    months = last_months(today)
+
+    def flow_sum(name, **filters):
+        return Coalesce(Sum(name, filter=Q(**filters)), Decimal("0"), output_field=MONEY_FIELD)
+
+    month_columns = {}
+    for i, month in enumerate(months):
+        month_q = {"snapshot_date__gte": month, "snapshot_date__lt": next_month(month)}
+        month_columns[f"disb_{i}"] = flow_sum("disbursements_amount", **month_q)
+        month_columns[f"repay_{i}"] = flow_sum("repayments_amount", **month_q)
+
+    flows = (
+        DashboardKPISnapshot.objects
+        .filter(snapshot_date__gte=min(months[0], start_30d))
+        .aggregate(
+            today_repayments_amount=flow_sum("repayments_amount", snapshot_date=today),
+            today_repayments_count=Coalesce(
+                Sum("repayments_count", filter=Q(snapshot_date=today)), 0
+            ),
+            mc_income_30d=flow_sum("repayments_amount", snapshot_date__gte=start_30d),
+            vehicle_month_income=flow_sum(
+                "vehicle_lease_amount", snapshot_date__gte=start_month, snapshot_date__lte=today
+            ),
+            vehicle_income_30d=flow_sum("vehicle_lease_amount", snapshot_date__gte=start_30d),
+            **month_columns,
+        )
+    )
+    disbursed_by_month = [flows.pop(f"disb_{i}") for i in range(len(months))]
+    repaid_by_month = [flows.pop(f"repay_{i}") for i in range(len(months))]
+
+    return DashboardKPIs(
+        today=today,
+        portfolio_total=stocks.portfolio_total,
+        outstanding_principal=stocks.outstanding_principal,
+        outstanding_loans_count=(stocks.loans_approved or 0) + (stocks.loans_disbursed or 0),
+        interest_to_receive=stocks.interest_to_receive,
+        status_pending_count=stocks.loans_pending or 0,
+        status_approved_count=stocks.loans_approved or 0,
+        status_disbursed_count=stocks.loans_disbursed or 0,
+        status_closed_count=stocks.loans_closed or 0,
+        status_cancelled_count=stocks.loans_cancelled or 0,
+        vehicle_active_contracts=VehicleLeaseContract.objects.filter(status="active").count(),
+        company_accounts_balance=company_accounts_balance(),
+        months=months,
+        disbursed_by_month=disbursed_by_month,
+        repaid_by_month=repaid_by_month,
+        **flows,
+    )
@@ -0,0 +1,239 @@
+# core/services/lease_allocation.py
+
+from decimal import Decimal
+
+from django.utils import timezone
+
+from core.models import (
+    VehicleLeaseAllocation,
+    VehicleLeaseContract,
+    VehicleLeaseCoverage,
+    VehicleLeasePayment,
+)
+from core.services.lease_schedule import contract_weeks, first_due_date, week_due_date
+
+
+ZERO = Decimal("0")
+
+# Contratos por lote na reconstrução (uma query de pagamentos por lote)
+REBUILD_BATCH_SIZE = 500
+
+COVERAGE_FIELDS = [
+    "weeks_covered",
+    "partial_amount",
+    "unallocated_amount",
+    "paid_total",
+    "payments_count",
+    "paid_until",
+    "next_due_date",
+    "last_payment",
+    "last_payment_date",
+    "updated_at",
+]
+
+
+#=============================================================================
+#=============================================================================
+
+
+def split_payment(amount, weekly_rent, weeks_covered, partial, max_weeks=None):
+    """
+    Imputa `amount` às semanas a seguir à posição actual (FIFO): primeiro o
+    que falta da semana parcialmente paga, depois semanas inteiras, e o
+    resto como pagamento parcial da semana seguinte. Com `max_weeks`, o que
+    passar da última semana do contrato fica como excedente.
+
+    Devolve ([(semana, valor)], semanas cobertas, parcial, excedente).
+    """
+    parts = []
+    while amount > 0 and weekly_rent > 0 and (max_weeks is None or weeks_covered < max_weeks):
+        week = weeks_covered + 1
+        take = min(amount, weekly_rent - partial)
+        parts.append((week, take))
+        amount -= take
+        partial += take
+        if partial >= weekly_rent:
+            weeks_covered, partial = week, ZERO
+    return parts, weeks_covered, partial, amount
+
+
+def _set_dates(contract, coverage):
+    weeks = coverage.weeks_covered
+    total = contract_weeks(contract)
+    coverage.paid_until = week_due_date(contract, weeks) if weeks else None
+    coverage.next_due_date = None if total is not None and weeks >= total else week_due_date(contract, weeks + 1)
+
+
+def _apply(contract, coverage, payment, now):
+    """
+    Imputa `payment` a partir da posição de `coverage` (actualizada aqui).
+    Devolve as VehicleLeaseAllocation por gravar.
+    """
+    parts, coverage.weeks_covered, coverage.partial_amount, excess = split_payment(
+        payment.amount,
+        contract.weekly_rent,
+        coverage.weeks_covered,
+        coverage.partial_amount,
+        contract_weeks(contract),
+    )
+    coverage.unallocated_amount += excess
+    coverage.paid_total += payment.amount
+    coverage.payments_count += 1
+    coverage.last_payment_id = payment.id
+    coverage.last_payment_date = payment.payment_date
+    _set_dates(contract, coverage)
+
+    return [
+        VehicleLeaseAllocation(
+            contract_id=contract.id,
+            payment_id=payment.id,
+            week=week,
+            due_date=week_due_date(contract, week),
+            amount=amount,
+            created_at=now,
+        )
+        for week, amount in parts
+    ]
+
+
+def _empty_coverage(contract, now):
+    coverage = VehicleLeaseCoverage(
+        contract_id=contract.id,
+        weeks_covered=0,
+        partial_amount=ZERO,
+        unallocated_amount=ZERO,
+        paid_total=ZERO,
+        payments_count=0,
+        last_payment=None,
+        last_payment_date=None,
+        updated_at=now,
+    )
+    _set_dates(contract, coverage)
+    return coverage
+
+
+#=============================================================================
+#=============================================================================
+
+
+def rebuild_lease_allocations(contract_ids=None):
+    """
+    Refaz as imputações (e a linha de cobertura) dos contratos a partir dos
+    pagamentos, por ordem de data de pagamento. Sem `contract_ids`, todos.
+    Lotes de REBUILD_BATCH_SIZE contratos: uma query de pagamentos, um
+    DELETE e dois bulk_create por lote. Devolve o número de contratos.
+    """
+    contracts = (
+        VehicleLeaseContract.objects
+        .only("start_date", "end_date", "weekly_rent", "payment_weekday")
+        .order_by("pk")
+    )
+    if contract_ids is not None:
+        contracts = contracts.filter(pk__in=contract_ids)
+
+    now = timezone.now()
+    total = 0
+    last_pk = None
+    while True:
+        page = contracts if last_pk is None else contracts.filter(pk__gt=last_pk)
+        batch = {contract.id: contract for contract in page[:REBUILD_BATCH_SIZE]}
+        if not batch:
+            return total
+
+        coverages = {pk: _empty_coverage(contract, now) for pk, contract in batch.items()}
+        payments = (
+            VehicleLeasePayment.objects
+            .filter(contract_id__in=list(batch))
+            .only("contract_id", "payment_date", "amount")
+            .order_by("contract_id", "payment_date", "pk")
+        )
+        allocations = []
+        for payment in payments:
+            allocations += _apply(batch[payment.contract_id], coverages[payment.contract_id], payment, now)
+
+        VehicleLeaseAllocation.objects.filter(contract_id__in=list(batch)).delete()
+        VehicleLeaseAllocation.objects.bulk_create(allocations, batch_size=1000)
+        VehicleLeaseCoverage.objects.bulk_create(
+            list(coverages.values()),
+            batch_size=1000,
+            update_conflicts=True,
+            update_fields=COVERAGE_FIELDS,
+        )
+
+        total += len(batch)
+        if len(batch) < REBUILD_BATCH_SIZE:
+            return total
+        last_pk = max(batch)
+
+
+def open_lease_coverage(contract):
+    """
+    Cria a linha de cobertura de um contrato novo (nenhuma semana paga).
+    """
+    _empty_coverage(contract, timezone.now()).save(force_insert=True)
+
+
+def record_lease_payment(contract, payment):
+    """
+    Imputa incrementalmente um pagamento novo às semanas do contrato.
+    Chamar depois de gravar o VehicleLeasePayment, dentro da mesma transacção.
+    """
+    record_lease_payments([(contract, payment)])
+
+
+def record_lease_payments(payments):
+    """
+    Versão em lote de record_lease_payment(): `payments` = [(contrato,
+    pagamento)], no máximo um pagamento por contrato. Bloqueia as linhas de
+    cobertura de uma vez e grava com um bulk_create e um bulk_update.
+
+    Um pagamento com data anterior ao último já imputado (registo
+    retroactivo) muda a ordem FIFO: nesse caso — ou se a linha de cobertura
+    ainda não existe — refaz as imputações desse contrato.
+    """
+    coverages = VehicleLeaseCoverage.objects.select_for_update().in_bulk(
+        [contract.id for contract, _ in payments]
+    )
+
+    now = timezone.now()
+    allocations = []
+    changed = []
+    rebuild = []
+    for contract, payment in payments:
+        coverage = coverages.get(contract.id)
+        if coverage is None or (
+            coverage.last_payment_date is not None and payment.payment_date < coverage.last_payment_date
+        ):
+            rebuild.append(contract.id)
+            continue
+        allocations += _apply(contract, coverage, payment, now)
+        coverage.updated_at = now
+        changed.append(coverage)
+
+    VehicleLeaseAllocation.objects.bulk_create(allocations, batch_size=1000)
+    VehicleLeaseCoverage.objects.bulk_update(changed, COVERAGE_FIELDS, batch_size=1000)
+    if rebuild:
+        rebuild_lease_allocations(rebuild)
+
+
+def coverage_summary(contract, coverage=None):
+    """
+    Posição do contrato para mostrar ao registar um pagamento: pago até,
+    próxima semana por cobrir e quanto falta dela. Sem linha de cobertura,
+    nenhuma semana está paga.
+    """
+    if coverage is None:
+        coverage = VehicleLeaseCoverage.objects.filter(contract=contract).first()
+    if coverage is None:
+        return {
+            "weeks_covered": 0,
+            "paid_until": None,
+            "next_due_date": first_due_date(contract),
+            "next_due_missing": contract.weekly_rent,
+        }
+    return {
+        "weeks_covered": coverage.weeks_covered,
+        "paid_until": coverage.paid_until,
+        "next_due_date": coverage.next_due_date,
+        "next_due_missing": contract.weekly_rent - coverage.partial_amount if coverage.next_due_date else ZERO,
+    }
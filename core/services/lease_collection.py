@@ -0,0 +1,233 @@
+# core/services/lease_collection.py
+
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from core.models import CompanyAccount, PnlMonthly, Transaction, VehicleLeaseContract, VehicleLeasePayment
+from core.services.kpi_snapshot import apply_kpi_delta
+from core.services.lease_allocation import record_lease_payments
+from core.services.lease_schedule import lease_schedule_queryset
+from core.services.pnl import apply_pnl_delta
+from core.services.posting import post_transactions
+from core.services.vehicle_profitability import record_vehicle_revenues
+
+
+METHODS = {code for code, _ in VehicleLeasePayment.METHOD_CHOICES}
+
+BULK_BATCH_SIZE = 1000
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass
+class CollectionRow:
+    """
+    Uma linha da grelha de cobrança (um contrato) e o respectivo resultado.
+    """
+
+    contract_id: int
+    amount: Decimal = None
+    company_account_id: int = None
+    error: str = ""
+
+    @property
+    def ok(self):
+        return not self.error
+
+    def as_dict(self):
+        return {
+            "contract_id": self.contract_id,
+            "amount": str(self.amount) if self.amount is not None else None,
+            "company_account_id": self.company_account_id,
+            "ok": self.ok,
+            "message": self.error,
+        }
+
+
+@dataclass
+class CollectionResult:
+    batch: str
+    payment_date: object
+    rows: list = field(default_factory=list)
+    posted: bool = False
+
+    @property
+    def error_rows(self):
+        return [r for r in self.rows if not r.ok]
+
+    @property
+    def total_amount(self):
+        return sum((r.amount for r in self.rows if r.ok), Decimal("0.00"))
+
+    @property
+    def summary(self):
+        if self.posted:
+            return (
+                f"Cobrança de {self.payment_date:%d/%m/%Y}: {len(self.rows)} pagamentos registados "
+                f"(total MT {self.total_amount:,.2f})."
+            )
+        return f"Cobrança não registada: {len(self.error_rows)} linhas com erro."
+
+
+#=============================================================================
+#=============================================================================
+
+
+def collection_sheet(as_of=None, company_account_id=None):
+    """
+    Contratos activos para a grelha de cobrança semanal, com o plano
+    semanal anotado (atraso à data `as_of`) e a cobertura de cada contrato.
+    A renda a pré-preencher é `weekly_rent`.
+    """
+    return (
+        lease_schedule_queryset(as_of, company_account_id=company_account_id)
+        .select_related("leased_vehicle", "driver", "company_account", "coverage")
+        .order_by("leased_vehicle__plate_number", "pk")
+    )
+
+
+def parse_amount(value):
+    """
+    Valor de uma célula da grelha: vazio ou zero = não cobrado (None).
+    Aceita vírgula como separador decimal.
+    """
+    value = (value or "").strip().replace(" ", "").replace(",", ".")
+    if not value:
+        return None
+    amount = Decimal(value).quantize(Decimal("0.01"))
+    if amount < 0:
+        raise InvalidOperation
+    return amount or None
+
+
+def _description(contract):
+    return f"Leasing Viatura · Contrato #{contract.id} · {contract.leased_vehicle.plate_number}"
+
+
+def _validate(rows, contracts, accounts):
+    seen = set()
+    for row in rows:
+        contract = contracts.get(row.contract_id)
+        if contract is None:
+            row.error = f"Contrato #{row.contract_id} não encontrado ou não está activo."
+        elif row.contract_id in seen:
+            row.error = f"Contrato #{row.contract_id} repetido na cobrança."
+        elif row.amount is None or row.amount <= 0:
+            row.error = f"Contrato #{row.contract_id}: valor inválido."
+        else:
+            row.company_account_id = row.company_account_id or contract.company_account_id
+            if row.company_account_id not in accounts:
+                row.error = f"Contrato #{row.contract_id}: conta da empresa inválida."
+        seen.add(row.contract_id)
+
+
+def _write(batch, rows, payment_date, method, contracts, user):
+    """
+    Grava a cobrança: VehicleLeasePayment com bulk_create, lançamentos nas
+    contas (`post_transactions`), imputação às semanas, rentabilidade das
+    viaturas, KPIs e P&L.
+    """
+    VehicleLeasePayment.objects.bulk_create(
+        [
+            VehicleLeasePayment(
+                contract_id=row.contract_id,
+                driver_id=contracts[row.contract_id].driver_id,
+                company_account_id=row.company_account_id,
+                payment_date=payment_date,
+                amount=row.amount,
+                method=method,
+                import_batch=batch,
+                created_by=user,
+            )
+            for row in rows
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+    # MySQL não devolve os IDs do bulk_create: recuperá-los pelo lote
+    # (um pagamento por contrato em cada cobrança)
+    payments = {
+        payment.contract_id: payment
+        for payment in VehicleLeasePayment.objects.filter(import_batch=batch).only(
+            "id", "contract_id", "payment_date", "amount"
+        )
+    }
+
+    post_transactions(
+        Transaction(
+            company_account_id=row.company_account_id,
+            tx_type=Transaction.TX_TYPE_IN,
+            source_type="vehicle_lease_payment",
+            source_id=payments[row.contract_id].id,
+            tx_date=payment_date,
+            description=_description(contracts[row.contract_id]),
+            amount=row.amount,
+            created_by=user,
+        )
+        for row in rows
+    )
+
+    pairs = [(contracts[row.contract_id], payments[row.contract_id]) for row in rows]
+    record_lease_payments(pairs)
+    record_vehicle_revenues(pairs)
+
+    apply_kpi_delta(flow_date=payment_date, vehicle_lease_amount=sum((row.amount for row in rows), Decimal("0")))
+
+    revenue = defaultdict(lambda: [Decimal("0"), 0])
+    for row in rows:
+        totals = revenue[row.company_account_id]
+        totals[0] += row.amount
+        totals[1] += 1
+    for account_id, (amount, entries) in revenue.items():
+        apply_pnl_delta(PnlMonthly.LINE_LEASE_REVENUE, payment_date, amount, account_id, entries=entries)
+
+
+def post_lease_collection(entries, payment_date, method="cash", user=None):
+    """
+    Regista de uma vez a cobrança semanal de vários contratos.
+
+    `entries`: [(contract_id, valor, company_account_id ou None)] — sem conta,
+    usa a conta do contrato. Tudo numa única transacção, com os mesmos
+    efeitos de create_vehicle_lease_payment() para cada linha. Se alguma
+    linha tiver erro, nada é gravado e os erros vêm no resultado.
+    """
+    batch = f"{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+    result = CollectionResult(batch=batch, payment_date=payment_date)
+    result.rows = [
+        CollectionRow(contract_id=int(contract_id), amount=amount, company_account_id=account_id)
+        for contract_id, amount, account_id in entries
+    ]
+    if not result.rows:
+        return result
+    if method not in METHODS:
+        for row in result.rows:
+            row.error = f"Método de pagamento inválido: {method}."
+        return result
+
+    with db_transaction.atomic():
+        contracts = (
+            VehicleLeaseContract.objects
+            .select_related("leased_vehicle")
+            .filter(status="active")
+            .in_bulk([row.contract_id for row in result.rows])
+        )
+        account_ids = {row.company_account_id for row in result.rows if row.company_account_id}
+        account_ids |= {contract.company_account_id for contract in contracts.values()}
+
+        # as contas são bloqueadas por post_transactions, conforme o modo de lançamento
+        accounts = CompanyAccount.objects.filter(is_active=True).in_bulk(account_ids)
+        _validate(result.rows, contracts, accounts)
+        if result.error_rows:
+            return result
+
+        _write(batch, result.rows, payment_date, method, contracts, user)
+        result.posted = True
+
+    return result
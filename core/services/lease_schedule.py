@@ -0,0 +1,208 @@
+# core/services/lease_schedule.py
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Count,
+    DateField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Q,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, ExtractIsoWeekDay, Floor, Greatest, Least, Mod
+from django.utils import timezone
+
+from core.models import VehicleLeaseContract
+from core.services.money import MONEY_FIELD
+from core.services.loan_aging import DateDiff
+
+
+LEASE_WEEK_DAYS = 7
+
+# Situação de um contrato face ao plano semanal: {valor: (rótulo, condição)}
+LEASE_STATES = {
+    "overdue": ("Em atraso", Q(lease_balance__gt=0)),
+    "current": ("Em dia", Q(lease_balance=0)),
+    "advance": ("Adiantado", Q(lease_balance__lt=0)),
+}
+
+ZERO = Value(Decimal("0"), output_field=MONEY_FIELD)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def first_due_date(contract):
+    """
+    1º vencimento do contrato: o primeiro `payment_weekday` a partir de
+    start_date (ou o próprio start_date, sem dia definido) — o mesmo que
+    `lease_first_due` em annotate_lease_schedule().
+    """
+    start = contract.start_date
+    weekday = contract.payment_weekday or start.isoweekday()
+    return start + timedelta(days=(weekday - start.isoweekday()) % LEASE_WEEK_DAYS)
+
+
+def week_due_date(contract, week):
+    """
+    Vencimento da semana `week` (1 = primeiro vencimento).
+    """
+    return first_due_date(contract) + timedelta(days=LEASE_WEEK_DAYS * (week - 1))
+
+
+def contract_weeks(contract):
+    """
+    Nº de semanas do contrato até end_date; None se não tem data de fim.
+    """
+    if contract.end_date is None:
+        return None
+    first = first_due_date(contract)
+    if contract.end_date < first:
+        return 0
+    return (contract.end_date - first).days // LEASE_WEEK_DAYS + 1
+
+
+def annotate_lease_schedule(queryset, as_of=None):
+    """
+    Acrescenta a um queryset de VehicleLeaseContract o plano semanal à data
+    `as_of` (por omissão, hoje):
+    - lease_weeks_due: semanas vencidas — a 1ª no primeiro `payment_weekday`
+      a partir de start_date (ou no próprio start_date, sem dia definido),
+      depois de 7 em 7 dias, sem passar de end_date;
+    - lease_expected / lease_received: rendas vencidas e pagamentos até `as_of`;
+    - lease_balance: esperado - recebido (>0 em atraso, <0 adiantado);
+    - lease_arrears: valor em atraso (nunca negativo);
+    - lease_weeks_paid / lease_weeks_overdue: semanas cobertas e em falta.
+
+    Tudo numa só query (os pagamentos entram por JOIN, agrupados por
+    contrato), por isso pode ser ordenado, filtrado e paginado em SQL.
+    """
+    as_of = as_of or timezone.localdate()
+    day = Value(as_of, output_field=DateField())
+    week = Value(LEASE_WEEK_DAYS)
+    start_weekday = ExtractIsoWeekDay("start_date")
+
+    return (
+        queryset
+        .annotate(
+            # dias entre start_date e o 1º vencimento (0–6)
+            lease_first_due=Mod(
+                Coalesce("payment_weekday", start_weekday) - start_weekday + week,
+                week,
+                output_field=IntegerField(),
+            ),
+            lease_days=DateDiff(Least(day, Coalesce("end_date", day), output_field=DateField()), F("start_date")),
+            lease_received=Coalesce(
+                Sum("payments__amount", filter=Q(payments__payment_date__lte=as_of)),
+                ZERO,
+                output_field=MONEY_FIELD,
+            ),
+        )
+        .annotate(
+            lease_weeks_due=Greatest(
+                Floor((F("lease_days") - F("lease_first_due") + week) / week),
+                Value(0),
+                output_field=IntegerField(),
+            ),
+        )
+        .annotate(
+            lease_expected=ExpressionWrapper(F("lease_weeks_due") * F("weekly_rent"), output_field=MONEY_FIELD),
+            lease_weeks_paid=Floor(F("lease_received") / F("weekly_rent"), output_field=IntegerField()),
+        )
+        .annotate(
+            lease_balance=ExpressionWrapper(F("lease_expected") - F("lease_received"), output_field=MONEY_FIELD),
+            lease_weeks_overdue=Greatest(
+                F("lease_weeks_due") - F("lease_weeks_paid"),
+                Value(0),
+                output_field=IntegerField(),
+            ),
+        )
+        .annotate(lease_arrears=Greatest(F("lease_balance"), ZERO, output_field=MONEY_FIELD))
+    )
+
+
+def filter_lease_state(queryset, state):
+    """
+    Filtra um queryset anotado por situação (chave de LEASE_STATES);
+    valores desconhecidos são ignorados.
+    """
+    if state not in LEASE_STATES:
+        return queryset
+    return queryset.filter(LEASE_STATES[state][1])
+
+
+def lease_schedule_queryset(as_of=None, status="active", company_account_id=None, driver_id=None, state=None):
+    """
+    Contratos (por omissão, os activos) com o plano semanal anotado — a base
+    comum do dashboard, da lista de contratos e do relatório de atrasos.
+    """
+    qs = VehicleLeaseContract.objects.all()
+    if status:
+        qs = qs.filter(status=status)
+    if company_account_id:
+        qs = qs.filter(company_account_id=company_account_id)
+    if driver_id:
+        qs = qs.filter(driver_id=driver_id)
+    return filter_lease_state(annotate_lease_schedule(qs, as_of), state)
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass(frozen=True)
+class FleetArrears:
+    """
+    Totais do plano semanal de um conjunto de contratos.
+    """
+
+    as_of: date
+    contracts: int
+    overdue_contracts: int
+    advance_contracts: int
+    expected: Decimal
+    received: Decimal
+    arrears: Decimal
+    weeks_overdue: int
+
+    def as_dict(self):
+        return {
+            "as_of": self.as_of.isoformat(),
+            "contracts": self.contracts,
+            "overdue_contracts": self.overdue_contracts,
+            "advance_contracts": self.advance_contracts,
+            "expected": float(self.expected),
+            "received": float(self.received),
+            "arrears": float(self.arrears),
+            "weeks_overdue": self.weeks_overdue,
+        }
+
+
+def fleet_arrears(as_of=None, queryset=None, **filters):
+    """
+    Totais da frota (ou de `queryset`, já anotado) numa só agregação.
+    `filters`: os de lease_schedule_queryset().
+    """
+    as_of = as_of or timezone.localdate()
+    if queryset is None:
+        queryset = lease_schedule_queryset(as_of, **filters)
+
+    def money(field):
+        return Coalesce(Sum(field), ZERO, output_field=MONEY_FIELD)
+
+    row = queryset.order_by().aggregate(
+        contracts=Count("pk"),
+        overdue_contracts=Count("pk", filter=LEASE_STATES["overdue"][1]),
+        advance_contracts=Count("pk", filter=LEASE_STATES["advance"][1]),
+        expected=money("lease_expected"),
+        received=money("lease_received"),
+        arrears=money("lease_arrears"),
+        weeks_overdue=Coalesce(Sum("lease_weeks_overdue"), Value(0)),
+    )
+    return FleetArrears(as_of=as_of, **row)
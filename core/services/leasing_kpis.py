@@ -0,0 +1,115 @@
+# core/services/leasing_kpis.py
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import LeasedVehicle, VehicleLeaseContract, VehicleLeasePayment
+from core.services.money import MONEY_FIELD
+
+
+ZERO = Value(Decimal("0"), output_field=MONEY_FIELD)
+
+KPI_BLOCKS = ("fleet", "contracts", "payments")
+
+
+#=============================================================================
+#=============================================================================
+
+
+def kpi_cache_seconds():
+    """
+    Validade dos KPIs das páginas de leasing em cache (LEASING_KPI_CACHE_SECONDS);
+    0 = sem cache. Os registos feitos pelas próprias páginas limpam a cache
+    (invalidate_leasing_kpis), por isso a validade só cobre alterações
+    feitas por outras vias (admin, comandos).
+    """
+    return getattr(settings, "LEASING_KPI_CACHE_SECONDS", 0)
+
+
+def _cache_key(block, today):
+    # os KPIs de pagamentos dependem do mês corrente
+    return f"leasing_kpis:{block}:{today:%Y-%m}"
+
+
+def _cached(block, compute, today):
+    seconds = kpi_cache_seconds()
+    if not seconds:
+        return compute()
+    key = _cache_key(block, today)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, seconds)
+    return value
+
+
+def invalidate_leasing_kpis(today=None):
+    """
+    Limpa os KPIs em cache. Chamar depois de registar viaturas, contratos
+    ou pagamentos.
+    """
+    today = today or timezone.localdate()
+    cache.delete_many([_cache_key(block, today) for block in KPI_BLOCKS])
+
+
+def _money(field, **extra):
+    return Coalesce(Sum(field, **extra), ZERO, output_field=MONEY_FIELD)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def fleet_kpis(today=None):
+    """
+    Viaturas por status (lista da frota) — uma query.
+    """
+    def compute():
+        return LeasedVehicle.objects.aggregate(
+            total=Count("pk"),
+            available=Count("pk", filter=Q(status="available")),
+            leased=Count("pk", filter=Q(status="leased")),
+            maintenance=Count("pk", filter=Q(status="maintenance")),
+        )
+
+    return _cached("fleet", compute, today or timezone.localdate())
+
+
+def contract_kpis(today=None):
+    """
+    Contratos (lista de contratos): total, activos, renda semanal dos
+    activos e viaturas distintas em leasing — uma query.
+    """
+    active = Q(status="active")
+
+    def compute():
+        return VehicleLeaseContract.objects.aggregate(
+            total=Count("pk"),
+            active=Count("pk", filter=active),
+            weekly_sum=_money("weekly_rent", filter=active),
+            vehicles_in_leasing=Count("leased_vehicle_id", filter=active, distinct=True),
+        )
+
+    return _cached("contracts", compute, today or timezone.localdate())
+
+
+def payment_kpis(today=None):
+    """
+    Pagamentos (lista de pagamentos): número, valor total e valor do mês
+    corrente — uma query.
+    """
+    today = today or timezone.localdate()
+
+    def compute():
+        return VehicleLeasePayment.objects.aggregate(
+            total=Count("pk"),
+            total_amount=_money("amount"),
+            month_amount=_money("amount", filter=Q(payment_date__gte=today.replace(day=1))),
+        )
+
+    return _cached("payments", compute, today)
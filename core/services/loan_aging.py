@@ -0,0 +1,260 @@
+# core/services/loan_aging.py
+
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth.models import User
+from django.db.models import (
+    Count,
+    DateField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Ceil, Coalesce, Greatest, Least
+from django.utils import timezone
+
+from core.models import Loan, LoanPaymentRequest, LoanRepayment
+from core.services.money import MONEY_FIELD
+
+
+# Escalões de atraso (dias): índice = CEIL(dias / 30), limitado a 4
+AGING_BUCKETS = (
+    ("current", "Em dia"),
+    ("1_30", "1–30 dias"),
+    ("31_60", "31–60 dias"),
+    ("61_90", "61–90 dias"),
+    ("90_plus", "Mais de 90 dias"),
+)
+AGING_BUCKET_DAYS = 30
+
+# PAR n = principal em dívida com mais de n dias de atraso / principal em dívida
+PAR_DAYS = (30, 60, 90)
+
+# Data "sem vencimento" (LEAST com NULL dá NULL no MySQL)
+NO_DUE_DATE = date(9999, 12, 31)
+
+ZERO = Value(Decimal("0"), output_field=MONEY_FIELD)
+
+
+#=============================================================================
+#=============================================================================
+
+
+class DateDiff(Func):
+    function = "DATEDIFF"
+    output_field = IntegerField()
+
+
+def _principal_repaid():
+    """
+    Soma do capital reembolsado do empréstimo, lida dos reembolsos — para
+    empréstimos ainda sem linha em sl_loan_balances.
+    """
+    return Subquery(
+        LoanRepayment.objects
+        .filter(loan_id=OuterRef("pk"))
+        .order_by()
+        .values("loan_id")
+        .annotate(total=Sum("principal_amount"))
+        .values("total"),
+        output_field=MONEY_FIELD,
+    )
+
+
+def annotate_aging(queryset, today=None):
+    """
+    Acrescenta a um queryset de Loan:
+    - aging_overdue_since: vencimento mais antigo por pagar — a validade do
+      ciclo (first_payment_date) ou o LoanPaymentRequest pendente mais antigo;
+    - aging_days: dias de atraso (0 se nada venceu);
+    - aging_bucket: índice em AGING_BUCKETS;
+    - aging_outstanding: principal em dívida (sl_loan_balances; sem linha
+      de saldo, a soma dos reembolsos).
+
+    Tudo numa só query: o pedido pendente mais antigo é uma subquery
+    (loan_id, status, due_date) com LIMIT 1 sobre o índice da migração 0010.
+    """
+    today = today or timezone.localdate()
+
+    oldest_request = (
+        LoanPaymentRequest.objects
+        .filter(loan_id=OuterRef("pk"), status="pending")
+        .order_by("due_date")
+        .values("due_date")[:1]
+    )
+    no_due = Value(NO_DUE_DATE, output_field=DateField())
+
+    return (
+        queryset
+        .annotate(
+            aging_overdue_since=Least(
+                Coalesce("first_payment_date", no_due),
+                Coalesce(Subquery(oldest_request, output_field=DateField()), no_due),
+                output_field=DateField(),
+            ),
+            aging_outstanding=ExpressionWrapper(
+                Greatest(
+                    F("principal_amount")
+                    - Coalesce("balance_summary__principal_paid_total", _principal_repaid(), ZERO),
+                    ZERO,
+                ),
+                output_field=MONEY_FIELD,
+            ),
+        )
+        .annotate(
+            aging_days=Greatest(
+                DateDiff(Value(today, output_field=DateField()), F("aging_overdue_since")),
+                Value(0),
+                output_field=IntegerField(),
+            ),
+        )
+        .annotate(
+            aging_bucket=Least(
+                Ceil(F("aging_days") / Value(AGING_BUCKET_DAYS)),
+                Value(len(AGING_BUCKETS) - 1),
+                output_field=IntegerField(),
+            ),
+        )
+    )
+
+
+def _ratio(part, whole):
+    if not whole:
+        return Decimal("0")
+    return (part * 100 / whole).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass(frozen=True)
+class AgingRow:
+    """
+    Totais de um conjunto de empréstimos (carteira ou gestor) por escalão.
+    `loans` / `outstanding`: listas na ordem de AGING_BUCKETS.
+    """
+
+    label: str
+    loans: list
+    outstanding: list
+    manager_id: int = None
+
+    @property
+    def loans_total(self):
+        return sum(self.loans)
+
+    @property
+    def outstanding_total(self):
+        return sum(self.outstanding, Decimal("0"))
+
+    def par(self, days):
+        """
+        PAR `days` em %: escalões com mais de `days` dias de atraso.
+        """
+        first = days // AGING_BUCKET_DAYS + 1
+        return _ratio(sum(self.outstanding[first:], Decimal("0")), self.outstanding_total)
+
+    @property
+    def par_values(self):
+        return [(days, self.par(days)) for days in PAR_DAYS]
+
+    @property
+    def buckets(self):
+        return [
+            {
+                "key": key,
+                "label": label,
+                "loans": self.loans[i],
+                "outstanding": self.outstanding[i],
+                "share": _ratio(self.outstanding[i], self.outstanding_total),
+            }
+            for i, (key, label) in enumerate(AGING_BUCKETS)
+        ]
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "manager_id": self.manager_id,
+            "loans": self.loans_total,
+            "outstanding": float(self.outstanding_total),
+            "par": {str(days): float(value) for days, value in self.par_values},
+            "buckets": [
+                {**bucket, "outstanding": float(bucket["outstanding"]), "share": float(bucket["share"])}
+                for bucket in self.buckets
+            ],
+        }
+
+
+@dataclass(frozen=True)
+class PortfolioAging:
+    today: date
+    portfolio: AgingRow
+    managers: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            "today": self.today.isoformat(),
+            **self.portfolio.as_dict(),
+            "managers": [row.as_dict() for row in self.managers],
+        }
+
+
+def portfolio_aging(today=None, company_account_id=None):
+    """
+    Antiguidade dos atrasos de todos os empréstimos desembolsados: totais
+    por escalão, PAR 30/60/90 e o mesmo por gestor (Member.manager).
+
+    Uma query agrupada por (gestor, escalão) sobre sl_loans — o resultado
+    tem no máximo gestores × 5 linhas — mais uma para os nomes dos gestores.
+    """
+    today = today or timezone.localdate()
+
+    loans = Loan.objects.filter(status="disbursed")
+    if company_account_id:
+        loans = loans.filter(company_account_id=company_account_id)
+
+    rows = (
+        annotate_aging(loans, today)
+        .values("member__manager_id", "aging_bucket")
+        .annotate(n=Count("pk"), outstanding=Sum("aging_outstanding"))
+        .order_by()
+    )
+
+    size = len(AGING_BUCKETS)
+    totals = {"loans": [0] * size, "outstanding": [Decimal("0")] * size}
+    by_manager = {}
+    for r in rows:
+        bucket = int(r["aging_bucket"] or 0)
+        manager = by_manager.setdefault(
+            r["member__manager_id"], {"loans": [0] * size, "outstanding": [Decimal("0")] * size}
+        )
+        for target in (totals, manager):
+            target["loans"][bucket] += r["n"]
+            target["outstanding"][bucket] += r["outstanding"] or Decimal("0")
+
+    names = {
+        user.id: user.get_full_name() or user.username
+        for user in User.objects.filter(pk__in=list(by_manager)).only("first_name", "last_name", "username")
+    }
+    managers = sorted(
+        (
+            AgingRow(label=names.get(pk, f"Gestor #{pk}"), manager_id=pk, **values)
+            for pk, values in by_manager.items()
+        ),
+        key=lambda row: row.outstanding_total,
+        reverse=True,
+    )
+
+    return PortfolioAging(
+        today=today,
+        portfolio=AgingRow(label="Carteira", **totals),
+        managers=managers,
+    )
@@ -0,0 +1,187 @@
+# core/services/loan_balances.py
+
+from decimal import Decimal
+
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from core.models import Loan, LoanBalance, LoanRepayment
+from core.services.repayment_state import RepaymentState, annotate_repayment_state, cycle_interest
+
+
+#=============================================================================
+#=============================================================================
+
+
+def cycle_bounds(loan):
+    """
+    Ciclo actual do empréstimo:
+    - início = release_date (ou data de criação)
+    - validade = first_payment_date
+    """
+    return loan.release_date or loan.created_at.date(), loan.first_payment_date
+
+
+def _last_repayment_id():
+    return Subquery(
+        LoanRepayment.objects.filter(loan_id=OuterRef("pk"))
+        .order_by("-payment_date", "-id")
+        .values("id")[:1]
+    )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def rebuild_loan_balances(loan_ids=None):
+    """
+    Recalcula as linhas de LoanBalance com o motor de estado de reembolso
+    (uma única query agrupada) e grava-as com um upsert.
+    Sem `loan_ids`, processa todos os empréstimos desembolsados ou fechados.
+    Devolve o número de linhas gravadas.
+    """
+    loans = Loan.objects.all()
+    if loan_ids is None:
+        loans = loans.filter(status__in=["disbursed", "closed"])
+    else:
+        loans = loans.filter(pk__in=loan_ids)
+
+    rows = (
+        annotate_repayment_state(loans.order_by())
+        .annotate(last_repayment_id_=_last_repayment_id())
+        .values(
+            "id",
+            "rs_principal_paid_total",
+            "rs_repayments_count",
+            "rs_cycle_start",
+            "rs_cycle_due",
+            "rs_principal_paid_before_cycle",
+            "rs_interest_paid_cycle",
+            "rs_last_repayment_date",
+            "last_repayment_id_",
+        )
+    )
+
+    now = timezone.now()
+    balances = [
+        LoanBalance(
+            loan_id=r["id"],
+            principal_paid_total=r["rs_principal_paid_total"],
+            repayments_count=r["rs_repayments_count"],
+            cycle_start=r["rs_cycle_start"],
+            cycle_due=r["rs_cycle_due"],
+            principal_paid_before_cycle=r["rs_principal_paid_before_cycle"],
+            interest_paid_cycle=r["rs_interest_paid_cycle"],
+            last_repayment_id=r["last_repayment_id_"],
+            last_repayment_date=r["rs_last_repayment_date"],
+            updated_at=now,
+        )
+        for r in rows
+    ]
+
+    LoanBalance.objects.bulk_create(
+        balances,
+        batch_size=1000,
+        update_conflicts=True,
+        update_fields=[
+            "principal_paid_total",
+            "repayments_count",
+            "cycle_start",
+            "cycle_due",
+            "principal_paid_before_cycle",
+            "interest_paid_cycle",
+            "last_repayment",
+            "last_repayment_date",
+            "updated_at",
+        ],
+    )
+    return len(balances)
+
+
+def open_loan_balance(loan):
+    """
+    Cria (ou reinicia) a linha de saldo no momento do desembolso.
+    """
+    cycle_start, cycle_due = cycle_bounds(loan)
+    LoanBalance.objects.update_or_create(
+        loan=loan,
+        defaults={
+            "principal_paid_total": Decimal("0"),
+            "repayments_count": 0,
+            "cycle_start": cycle_start,
+            "cycle_due": cycle_due,
+            "principal_paid_before_cycle": Decimal("0"),
+            "interest_paid_cycle": Decimal("0"),
+            "last_repayment": None,
+            "last_repayment_date": None,
+            "updated_at": timezone.now(),
+        },
+    )
+
+
+def record_repayment(loan, repayment):
+    """
+    Actualiza incrementalmente o saldo do empréstimo após um reembolso.
+    Chamar depois de gravar o LoanRepayment e de actualizar o ciclo do Loan,
+    dentro da mesma transacção.
+
+    Se o ciclo do empréstimo mudou (pagamento "apenas juros" renova a
+    validade) ou a linha ainda não existe, recalcula a linha deste empréstimo.
+    """
+    balance = LoanBalance.objects.select_for_update().filter(loan=loan).first()
+    cycle_start, cycle_due = cycle_bounds(loan)
+
+    if balance is None or (balance.cycle_start, balance.cycle_due) != (cycle_start, cycle_due):
+        rebuild_loan_balances([loan.id])
+        return
+
+    balance.principal_paid_total += repayment.principal_amount
+    balance.repayments_count += 1
+
+    if repayment.payment_date < cycle_start:
+        balance.principal_paid_before_cycle += repayment.principal_amount
+    elif cycle_due is None or repayment.payment_date <= cycle_due:
+        balance.interest_paid_cycle += repayment.interest_amount
+
+    if balance.last_repayment_date is None or repayment.payment_date >= balance.last_repayment_date:
+        balance.last_repayment = repayment
+        balance.last_repayment_date = repayment.payment_date
+
+    balance.updated_at = timezone.now()
+    balance.save()
+
+
+def state_from_balance(loan, balance):
+    """
+    RepaymentState a partir da linha de LoanBalance, sem ler os reembolsos:
+    os juros do ciclo saem da base do ciclo, com o mesmo arredondamento do SQL.
+    """
+    rate = loan.interest_type.rate if loan.interest_type_id else None
+    base = max(loan.principal_amount - balance.principal_paid_before_cycle, Decimal("0"))
+    interest_total = cycle_interest(base, rate)
+    return RepaymentState(
+        loan_id=loan.id,
+        principal_amount=loan.principal_amount,
+        cycle_start=balance.cycle_start,
+        cycle_due=balance.cycle_due,
+        principal_paid_total=balance.principal_paid_total,
+        principal_paid_before_cycle=balance.principal_paid_before_cycle,
+        interest_paid_cycle=balance.interest_paid_cycle,
+        outstanding_principal=max(loan.principal_amount - balance.principal_paid_total, Decimal("0")),
+        cycle_base_principal=base,
+        cycle_interest_total=interest_total,
+        interest_remaining=max(interest_total - balance.interest_paid_cycle, Decimal("0")),
+        repayments_count=balance.repayments_count,
+        last_repayment_date=balance.last_repayment_date,
+    )
+
+
+def last_repayments_for(loan_ids):
+    """
+    Último reembolso de cada empréstimo ({loan_id: LoanRepayment}), lido das
+    tabelas de origem — para empréstimos ainda sem linha de LoanBalance.
+    Só leitura, uma query.
+    """
+    last_ids = Loan.objects.filter(pk__in=loan_ids).annotate(last_id=_last_repayment_id()).values("last_id")
+    return {repayment.loan_id: repayment for repayment in LoanRepayment.objects.filter(pk__in=last_ids)}
@@ -0,0 +1,8 @@
+# core/services/money.py
+
+from django.db.models import DecimalField
+
+
+# output_field dos agregados/expressões monetários (mesma precisão das
+# colunas de valores: decimal(15,2))
+MONEY_FIELD = DecimalField(max_digits=15, decimal_places=2)
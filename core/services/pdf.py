@@ -0,0 +1,186 @@
+# core/services/pdf.py
+
+import threading
+import time
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+
+# Folhas de estilo aplicadas a todos os PDFs (caminhos em static/)
+PDF_STYLESHEETS = ["assets/css/report_pdf.css"]
+
+# base_url dos documentos: os URLs relativos ("/static/...", "/media/...")
+# ficam file:///static/... e são resolvidos no disco por local_url_fetcher
+PDF_BASE_URL = "file:///"
+
+# Um renderer por thread (a configuração de fontes do Pango não é partilhável entre threads)
+_local = threading.local()
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _static_file(name):
+    """
+    Caminho de um ficheiro estático: STATICFILES_DIRS/apps (finders) ou STATIC_ROOT.
+    """
+    return finders.find(name) or str(Path(settings.STATIC_ROOT) / name)
+
+
+@lru_cache(maxsize=256)
+def _local_path(url_path):
+    """
+    Ficheiro local de um caminho "/static/..." ou "/media/...", ou None.
+    """
+    static_prefix = "/" + settings.STATIC_URL.strip("/") + "/"
+    media_prefix = "/" + settings.MEDIA_URL.strip("/") + "/"
+
+    if url_path.startswith(static_prefix):
+        candidate = Path(_static_file(url_path[len(static_prefix):]))
+    elif url_path.startswith(media_prefix):
+        candidate = Path(settings.MEDIA_ROOT) / url_path[len(media_prefix):]
+    else:
+        return None
+
+    return str(candidate) if candidate.is_file() else None
+
+
+def local_url_fetcher(url, *args, **kwargs):
+    """
+    url_fetcher do WeasyPrint: ficheiros estáticos e de media são lidos do
+    disco, sem pedidos HTTP ao próprio servidor (nem dependência do host
+    do pedido original).
+    """
+    from weasyprint import default_url_fetcher
+
+    parts = urlsplit(url)
+    if parts.scheme == "file":
+        local = _local_path(unquote(parts.path))
+        if local:
+            url = Path(local).as_uri()
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+@dataclass
+class RenderStats:
+    """
+    Tempos acumulados do renderer deste processo (ms).
+    layout = parse do HTML + cálculo das páginas; write = escrita do PDF.
+    """
+
+    warmup_ms: float = 0.0
+    renders: int = 0
+    pages: int = 0
+    last_pages: int = 0
+    layout_ms: float = 0.0
+    write_ms: float = 0.0
+    last_ms: float = 0.0
+    max_ms: float = 0.0
+
+    @property
+    def avg_ms(self):
+        return (self.layout_ms + self.write_ms) / self.renders if self.renders else 0.0
+
+    def as_dict(self):
+        return {**asdict(self), "avg_ms": round(self.avg_ms, 1)}
+
+
+class PdfRenderer:
+    """
+    Renderer de PDFs de longa duração (um por processo/thread).
+
+    As folhas de estilo são lidas e processadas uma única vez e a
+    configuração de fontes é partilhada por todos os documentos; em cada PDF
+    só é feito o parse do HTML, o layout e a escrita.
+    """
+
+    def __init__(self, stylesheets=None):
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        start = time.perf_counter()
+        self.font_config = FontConfiguration()
+        self.stylesheets = [
+            CSS(
+                filename=_static_file(name),
+                font_config=self.font_config,
+                url_fetcher=local_url_fetcher,
+            )
+            for name in (PDF_STYLESHEETS if stylesheets is None else stylesheets)
+        ]
+        self.stats = RenderStats()
+        self.stats.warmup_ms = (time.perf_counter() - start) * 1000
+
+    def warm_up(self):
+        """
+        Gera um documento mínimo para carregar as fontes e o Pango antes do
+        primeiro pedido real.
+        """
+        start = time.perf_counter()
+        self._document("<p>Salama</p>").write_pdf()
+        self.stats.warmup_ms += (time.perf_counter() - start) * 1000
+
+    def _document(self, html_string, base_url=None):
+        from weasyprint import HTML
+
+        return HTML(
+            string=html_string,
+            base_url=base_url or PDF_BASE_URL,
+            url_fetcher=local_url_fetcher,
+        ).render(stylesheets=self.stylesheets, font_config=self.font_config)
+
+    def render(self, html_string, base_url=None):
+        start = time.perf_counter()
+        document = self._document(html_string, base_url)
+        laid_out = time.perf_counter()
+        pdf_bytes = document.write_pdf()
+        end = time.perf_counter()
+
+        stats = self.stats
+        stats.renders += 1
+        stats.last_pages = len(document.pages)
+        stats.pages += stats.last_pages
+        stats.layout_ms += (laid_out - start) * 1000
+        stats.write_ms += (end - laid_out) * 1000
+        stats.last_ms = (end - start) * 1000
+        stats.max_ms = max(stats.max_ms, stats.last_ms)
+        return pdf_bytes
+
+
+def get_renderer():
+    """
+    Renderer desta thread, criado na primeira utilização.
+
+    O WeasyPrint (e cffi/fonttools/pydyf) só é importado aqui: importá-lo ao
+    carregar o URLconf custava esse tempo em cada worker e em cada
+    `manage.py`, mesmo sem relatórios.
+    """
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None:
+        renderer = _local.renderer = PdfRenderer()
+    return renderer
+
+
+def render_stats():
+    """
+    Métricas do renderer desta thread (None se ainda não foi criado).
+    """
+    renderer = getattr(_local, "renderer", None)
+    return renderer.stats.as_dict() if renderer is not None else None
+
+
+#=============================================================================
+#=============================================================================
+
+
+def html_to_pdf(html_string, base_url=None):
+    """
+    Converte HTML em PDF (bytes) com o renderer da thread.
+    """
+    return get_renderer().render(html_string, base_url=base_url)
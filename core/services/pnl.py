@@ -0,0 +1,318 @@
+# core/services/pnl.py
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from core.models import (
+    Expense,
+    ExpenseCategory,
+    Income,
+    IncomeCategory,
+    LoanRepayment,
+    PnlMonthly,
+    VehicleLeasePayment,
+)
+from core.services.dashboard_metrics import next_month
+
+
+ZERO = Decimal("0")
+
+# Rubricas do P&L, pela ordem da demonstração: (linha, rótulo, é receita?)
+PNL_LINES = (
+    (PnlMonthly.LINE_INCOME, "Rendimentos", True),
+    (PnlMonthly.LINE_LOAN_INTEREST, "Juros de empréstimos", True),
+    (PnlMonthly.LINE_LEASE_REVENUE, "Receitas de leasing", True),
+    (PnlMonthly.LINE_EXPENSE, "Despesas", False),
+)
+
+# Origem de cada rubrica: (modelo, campo de data, campo de valor, modelo da categoria, filtros)
+PNL_SOURCES = {
+    PnlMonthly.LINE_INCOME: (Income, "income_date", "amount", IncomeCategory, {"is_active": True}),
+    PnlMonthly.LINE_EXPENSE: (Expense, "expense_date", "amount", ExpenseCategory, {"is_active": True}),
+    PnlMonthly.LINE_LOAN_INTEREST: (LoanRepayment, "payment_date", "interest_amount", None, {}),
+    PnlMonthly.LINE_LEASE_REVENUE: (VehicleLeasePayment, "payment_date", "amount", None, {}),
+}
+
+# Máximo de queries de pnl_pivot(): agregado existe? + agregado mensal +
+# uma por rubrica (meses incompletos) + nomes das categorias (2)
+PNL_MAX_QUERIES = 2 + len(PNL_SOURCES) + 2
+
+# Meses por tabela no PDF (A4 ao alto)
+PNL_PDF_MONTHS_PER_TABLE = 6
+
+
+#=============================================================================
+#=============================================================================
+
+
+def pnl_rollup_built():
+    return PnlMonthly.objects.exists()
+
+
+def apply_pnl_delta(line, day, amount, company_account_id, category_id=0, entries=1):
+    """
+    Soma `amount` à linha (mês de `day`, rubrica, categoria, conta) do
+    agregado mensal. Deve ser chamada dentro da transacção (atomic) do
+    lançamento.
+
+    Se o agregado nunca foi construído (`rebuild_pnl_rollup`), não faz nada:
+    o P&L continua a ser calculado a partir das tabelas.
+    """
+    if line not in PNL_SOURCES:
+        raise ValueError(f"Rubrica de P&L desconhecida: {line}")
+    if not amount or not pnl_rollup_built():
+        return
+
+    now = timezone.now()
+    key = {
+        "month": day.replace(day=1),
+        "line": line,
+        "category_id": category_id or 0,
+        "company_account_id": company_account_id,
+    }
+    changes = {"amount": F("amount") + amount, "entries": F("entries") + entries, "updated_at": now}
+
+    if PnlMonthly.objects.filter(**key).update(**changes):
+        return
+    try:
+        with db_transaction.atomic():
+            PnlMonthly.objects.create(amount=amount, entries=entries, updated_at=now, **key)
+    except IntegrityError:
+        # Criada por outra transacção em paralelo
+        PnlMonthly.objects.filter(**key).update(**changes)
+
+
+def _grouped(line, periods=None, company_account_id=None, by_account=False):
+    """
+    Totais de uma rubrica agrupados por mês (e categoria / conta) — um só
+    GROUP BY. `periods`: [(início, fim)] a incluir; None = todas as datas.
+    """
+    model, date_field, amount_field, category_model, filters = PNL_SOURCES[line]
+    qs = model.objects.filter(**filters)
+    if periods is not None:
+        period_q = Q()
+        for start, end in periods:
+            period_q |= Q(**{f"{date_field}__range": (start, end)})
+        qs = qs.filter(period_q)
+    if company_account_id:
+        qs = qs.filter(company_account_id=company_account_id)
+
+    fields = ["month"]
+    if category_model is not None:
+        fields.append("category_id")
+    if by_account:
+        fields.append("company_account_id")
+    return (
+        qs.annotate(month=TruncMonth(date_field))
+        .values(*fields)
+        .annotate(total=Sum(amount_field), n=Count("pk"))
+        .order_by()
+    )
+
+
+@db_transaction.atomic
+def rebuild_pnl_rollup():
+    """
+    Reconstrói o agregado mensal a partir das tabelas de origem (um GROUP BY
+    por rubrica). Devolve o número de linhas escritas.
+    """
+    now = timezone.now()
+    rows = []
+    for line in PNL_SOURCES:
+        for r in _grouped(line, by_account=True):
+            rows.append(PnlMonthly(
+                month=r["month"],
+                line=line,
+                category_id=r.get("category_id") or 0,
+                company_account_id=r["company_account_id"],
+                amount=r["total"] or ZERO,
+                entries=r["n"],
+                updated_at=now,
+            ))
+
+    PnlMonthly.objects.all().delete()
+    PnlMonthly.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def pnl_months(start_date, end_date):
+    """
+    1º dia de cada mês entre `start_date` e `end_date`, em ordem cronológica.
+    """
+    months = []
+    month = start_date.replace(day=1)
+    while month <= end_date:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def pnl_pivot(start_date, end_date, company_account_id=None):
+    """
+    P&L por mês: rendimentos por categoria, juros de empréstimos, receitas
+    de leasing e despesas por categoria, com totais por rubrica e o
+    resultado (receitas - despesas) de cada mês.
+
+    Os meses completos vêm do agregado sl_pnl_monthly (quando construído);
+    os meses incompletos nas pontas do período — ou tudo, sem agregado —
+    são calculados das tabelas com um GROUP BY por rubrica. No máximo
+    PNL_MAX_QUERIES queries, qualquer que seja o período.
+    """
+    months = pnl_months(start_date, end_date)
+    cells = {}
+
+    def add(line, category_id, month, amount):
+        key = (line, category_id, month)
+        cells[key] = cells.get(key, ZERO) + (amount or ZERO)
+
+    periods = [(start_date, end_date)] if months else []
+    full_start = start_date if start_date.day == 1 else next_month(start_date.replace(day=1))
+    full_end = end_date.replace(day=1)
+    if (end_date + timedelta(days=1)).day == 1:
+        full_end = next_month(full_end)
+
+    if full_start < full_end and pnl_rollup_built():
+        rollup = PnlMonthly.objects.filter(month__gte=full_start, month__lt=full_end)
+        if company_account_id:
+            rollup = rollup.filter(company_account_id=company_account_id)
+        for r in rollup.values("month", "line", "category_id").annotate(total=Sum("amount")).order_by():
+            add(r["line"], r["category_id"], r["month"], r["total"])
+
+        periods = [
+            (start, end)
+            for start, end in ((start_date, full_start - timedelta(days=1)), (full_end, end_date))
+            if start <= end
+        ]
+
+    if periods:
+        for line in PNL_SOURCES:
+            for r in _grouped(line, periods, company_account_id):
+                add(line, r.get("category_id") or 0, r["month"], r["total"])
+
+    names = {}
+    for line, (_, _, _, category_model, _) in PNL_SOURCES.items():
+        ids = {category_id for (l, category_id, _) in cells if l == line and category_id}
+        if category_model is not None and ids:
+            for pk, name in category_model.objects.filter(pk__in=ids).values_list("id", "name"):
+                names[(line, pk)] = name
+
+    sections = []
+    revenue = [ZERO] * len(months)
+    expenses = [ZERO] * len(months)
+    for line, label, is_revenue in PNL_LINES:
+        if PNL_SOURCES[line][3] is None:
+            category_ids = [0]
+        else:
+            category_ids = sorted(
+                {category_id for (l, category_id, _) in cells if l == line},
+                key=lambda pk: (names.get((line, pk)) or "").lower(),
+            )
+
+        rows = []
+        for category_id in category_ids:
+            values = [cells.get((line, category_id, month), ZERO) for month in months]
+            rows.append({
+                "category_id": category_id or None,
+                "name": names.get((line, category_id)) or label,
+                "values": values,
+                "total": sum(values, ZERO),
+            })
+
+        totals = [sum(column, ZERO) for column in zip(*(r["values"] for r in rows))] or [ZERO] * len(months)
+        target = revenue if is_revenue else expenses
+        for i, value in enumerate(totals):
+            target[i] += value
+
+        sections.append({
+            "key": line,
+            "label": label,
+            "is_revenue": is_revenue,
+            "rows": rows,
+            "totals": totals,
+            "total": sum(totals, ZERO),
+        })
+
+    net = [r - e for r, e in zip(revenue, expenses)]
+    return {
+        "months": months,
+        "sections": sections,
+        "revenue": revenue,
+        "expenses": expenses,
+        "net": net,
+        "total_revenue": sum(revenue, ZERO),
+        "total_expenses": sum(expenses, ZERO),
+        "total_net": sum(net, ZERO),
+    }
+
+
+def pnl_tables(pivot, months_per_table=PNL_PDF_MONTHS_PER_TABLE):
+    """
+    Divide o pivot em tabelas de `months_per_table` meses para o PDF
+    (a coluna do total só na última).
+    """
+    count = len(pivot["months"])
+    tables = []
+    for start in range(0, count, months_per_table) or [0]:
+        cols = slice(start, start + months_per_table)
+        tables.append({
+            "months": pivot["months"][cols],
+            "last": start + months_per_table >= count,
+            "sections": [
+                {
+                    **section,
+                    "rows": [{**row, "values": row["values"][cols]} for row in section["rows"]],
+                    "totals": section["totals"][cols],
+                }
+                for section in pivot["sections"]
+            ],
+            "revenue": pivot["revenue"][cols],
+            "expenses": pivot["expenses"][cols],
+            "net": pivot["net"][cols],
+        })
+    return tables
+
+
+def pnl_chart_data(pivot):
+    """
+    Pivot em formato JSON para gráficos: meses "AAAA-MM" e valores numéricos.
+    """
+    def numbers(values):
+        return [float(value) for value in values]
+
+    return {
+        "months": [month.strftime("%Y-%m") for month in pivot["months"]],
+        "sections": [
+            {
+                "key": section["key"],
+                "label": section["label"],
+                "is_revenue": section["is_revenue"],
+                "rows": [
+                    {
+                        "category_id": row["category_id"],
+                        "name": row["name"],
+                        "values": numbers(row["values"]),
+                        "total": float(row["total"]),
+                    }
+                    for row in section["rows"]
+                ],
+                "totals": numbers(section["totals"]),
+                "total": float(section["total"]),
+            }
+            for section in pivot["sections"]
+        ],
+        "revenue": numbers(pivot["revenue"]),
+        "expenses": numbers(pivot["expenses"]),
+        "net": numbers(pivot["net"]),
+        "total_revenue": float(pivot["total_revenue"]),
+        "total_expenses": float(pivot["total_expenses"]),
+        "total_net": float(pivot["total_net"]),
+    }
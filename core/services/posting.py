@@ -0,0 +1,366 @@
+# core/services/posting.py
+
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import CompanyAccount, CompanyAccountCheckpoint, Transaction
+from core.services.money import MONEY_FIELD
+
+
+POSTING_MODE_LOCKED = "locked"
+POSTING_MODE_JOURNAL = "journal"
+
+BULK_BATCH_SIZE = 1000
+
+
+#=============================================================================
+#=============================================================================
+
+
+class InsufficientFunds(ValueError):
+    """
+    Saída que deixaria a conta da empresa com saldo negativo.
+    """
+
+
+@dataclass(frozen=True)
+class Posting:
+    """
+    Resultado de um lançamento: transacção criada e saldos exactos
+    (lidos e escritos sob o mesmo lock da linha da conta).
+    No modo diário os saldos ficam a None até o diário ser aplicado.
+    """
+
+    transaction: Transaction
+    balance_before: Decimal
+    balance_after: Decimal
+
+    @property
+    def pending(self):
+        return self.balance_after is None
+
+
+def posting_mode(account_id):
+    """
+    Modo de lançamento da conta, conforme ACCOUNT_POSTING_MODE /
+    ACCOUNT_JOURNAL_ACCOUNTS.
+    """
+    if getattr(settings, "ACCOUNT_POSTING_MODE", POSTING_MODE_LOCKED) != POSTING_MODE_JOURNAL:
+        return POSTING_MODE_LOCKED
+    journal_accounts = getattr(settings, "ACCOUNT_JOURNAL_ACCOUNTS", [])
+    if journal_accounts and int(account_id) not in journal_accounts:
+        return POSTING_MODE_LOCKED
+    return POSTING_MODE_JOURNAL
+
+
+def _signed_amount():
+    return Case(
+        When(tx_type=Transaction.TX_TYPE_OUT, then=-F("amount")),
+        default=F("amount"),
+        output_field=MONEY_FIELD,
+    )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _apply_pending(account):
+    """
+    Aplica ao saldo de `account` (já bloqueada) os lançamentos pendentes do
+    diário, pela ordem do id, preenchendo balance_before/balance_after.
+    Devolve o número de lançamentos aplicados.
+    """
+    pending = list(
+        Transaction.objects
+        .filter(company_account_id=account.pk, balance_after__isnull=True)
+        .order_by("id")
+        .only("id", "tx_type", "amount")
+    )
+    if not pending:
+        return 0
+
+    balance = account.balance or Decimal("0")
+    for tx in pending:
+        tx.balance_before = balance
+        balance += tx.amount if tx.tx_type == Transaction.TX_TYPE_IN else -tx.amount
+        tx.balance_after = balance
+    Transaction.objects.bulk_update(pending, ["balance_before", "balance_after"], batch_size=1000)
+
+    CompanyAccount.objects.filter(pk=account.pk).update(balance=balance)
+    account.balance = balance
+
+    now = timezone.now()
+    last_id = pending[-1].id
+    updated = CompanyAccountCheckpoint.objects.filter(account_id=account.pk).update(
+        last_transaction_id=last_id,
+        transactions_applied=F("transactions_applied") + len(pending),
+        applied_at=now,
+    )
+    if not updated:
+        CompanyAccountCheckpoint.objects.create(
+            account_id=account.pk,
+            last_transaction_id=last_id,
+            transactions_applied=len(pending),
+            applied_at=now,
+        )
+    return len(pending)
+
+
+def lock_accounts(account_ids, active_only=True):
+    """
+    SELECT ... FOR UPDATE sobre as contas da empresa, sempre pela ordem do id
+    (evita deadlocks entre lançamentos em várias contas). Lançamentos do
+    diário ainda pendentes são aplicados, para que `balance` seja exacto.
+    Devolve {id: CompanyAccount}. Chamar dentro de uma transacção.
+    """
+    qs = CompanyAccount.objects.select_for_update().filter(pk__in=account_ids).order_by("pk")
+    if active_only:
+        qs = qs.filter(is_active=True)
+    accounts = {account.pk: account for account in qs}
+    for account in accounts.values():
+        _apply_pending(account)
+    return accounts
+
+
+def lock_account(account_id, active_only=True):
+    """
+    Bloqueia e devolve uma conta da empresa (CompanyAccount.DoesNotExist se não existir).
+    """
+    account = lock_accounts([account_id], active_only=active_only).get(int(account_id))
+    if account is None:
+        raise CompanyAccount.DoesNotExist
+    return account
+
+
+def apply_journal(account_ids=None):
+    """
+    Avança o saldo das contas com lançamentos pendentes no diário
+    (uma transacção curta por conta). Devolve o número de lançamentos aplicados.
+    """
+    if account_ids is None:
+        account_ids = (
+            Transaction.objects.filter(balance_after__isnull=True)
+            .values_list("company_account_id", flat=True)
+            .distinct()
+        )
+
+    applied = 0
+    for account_id in sorted(set(account_ids)):
+        with db_transaction.atomic():
+            account = CompanyAccount.objects.select_for_update().filter(pk=account_id).first()
+            if account is not None:
+                applied += _apply_pending(account)
+    return applied
+
+
+#=============================================================================
+#=============================================================================
+
+
+def post_transaction(
+    account,
+    tx_type,
+    amount,
+    tx_date,
+    description,
+    source_type=None,
+    source_id=None,
+    created_by=None,
+    require_funds=False,
+    mode=None,
+):
+    """
+    Lança uma entrada (IN) ou saída (OUT) numa conta da empresa.
+
+    Modo "locked" (por omissão):
+    - bloqueia a linha da conta (SELECT ... FOR UPDATE);
+    - actualiza o saldo com UPDATE balance = balance ± valor;
+    - cria a Transaction com balance_before/balance_after exactos.
+
+    Modo "journal" (ver ACCOUNT_POSTING_MODE): apenas acrescenta a Transaction
+    ao diário, sem tocar na linha da conta, para que lançamentos concorrentes
+    na mesma conta não esperem uns pelos outros. O saldo é avançado por
+    `apply_journal`. Lançamentos com `require_funds=True` usam sempre o modo
+    "locked", porque precisam do saldo exacto.
+
+    `account` pode ser o objecto ou o id; se for o objecto, o seu `balance`
+    é actualizado (modo "locked").
+    """
+    account_id = getattr(account, "pk", account)
+    mode = mode or posting_mode(account_id)
+
+    if mode == POSTING_MODE_JOURNAL and not require_funds:
+        tx = Transaction.objects.create(
+            company_account_id=account_id,
+            tx_type=tx_type,
+            source_type=source_type,
+            source_id=source_id,
+            tx_date=tx_date,
+            description=description,
+            amount=amount,
+            balance_before=None,
+            balance_after=None,
+            is_active=True,
+            created_at=timezone.now(),
+            created_by=created_by,
+        )
+        return Posting(transaction=tx, balance_before=None, balance_after=None)
+
+    signed = amount if tx_type == Transaction.TX_TYPE_IN else -amount
+
+    with db_transaction.atomic():
+        locked = lock_account(account_id, active_only=False)
+        balance_before = locked.balance or Decimal("0")
+        balance_after = balance_before + signed
+
+        if require_funds and balance_after < 0:
+            raise InsufficientFunds(
+                f"Saldo insuficiente na conta {locked.name} ({balance_before}) para movimentar {amount}."
+            )
+
+        CompanyAccount.objects.filter(pk=account_id).update(balance=F("balance") + signed)
+
+        tx = Transaction.objects.create(
+            company_account_id=account_id,
+            tx_type=tx_type,
+            source_type=source_type,
+            source_id=source_id,
+            tx_date=tx_date,
+            description=description,
+            amount=amount,
+            balance_before=balance_before,
+            balance_after=balance_after,
+            is_active=True,
+            created_at=timezone.now(),
+            created_by=created_by,
+        )
+
+    if isinstance(account, CompanyAccount):
+        account.balance = balance_after
+    return Posting(transaction=tx, balance_before=balance_before, balance_after=balance_after)
+
+
+def post_transactions(transactions, mode=None):
+    """
+    Lança de uma vez várias transacções (objectos Transaction ainda por
+    gravar, com conta, tipo, valor, data e descrição) — importações e
+    cobranças em lote. Cada conta segue o seu modo (`posting_mode`):
+
+    - "locked": as contas são bloqueadas pela ordem do id, os saldos
+      antes/depois são encadeados pela ordem da lista e o saldo de cada
+      conta é gravado com um único UPDATE;
+    - "journal": as transacções entram no diário (saldos a None), sem
+      tocar na linha da conta; o saldo é avançado por `apply_journal`.
+
+    Uma única INSERT em lote para todas as transacções. Devolve a lista.
+    """
+    transactions = list(transactions)
+    if not transactions:
+        return transactions
+
+    with db_transaction.atomic():
+        locked_ids = {
+            tx.company_account_id
+            for tx in transactions
+            if (mode or posting_mode(tx.company_account_id)) != POSTING_MODE_JOURNAL
+        }
+        accounts = lock_accounts(locked_ids, active_only=False)
+        balances = {pk: account.balance or Decimal("0") for pk, account in accounts.items()}
+
+        now = timezone.now()
+        for tx in transactions:
+            tx.is_active = True
+            tx.created_at = tx.created_at or now
+            if tx.company_account_id in balances:
+                signed = tx.amount if tx.tx_type == Transaction.TX_TYPE_IN else -tx.amount
+                tx.balance_before = balances[tx.company_account_id]
+                tx.balance_after = tx.balance_before + signed
+                balances[tx.company_account_id] = tx.balance_after
+            else:
+                tx.balance_before = tx.balance_after = None
+        Transaction.objects.bulk_create(transactions, batch_size=BULK_BATCH_SIZE)
+
+        for pk, balance in balances.items():
+            if balance != (accounts[pk].balance or Decimal("0")):
+                CompanyAccount.objects.filter(pk=pk).update(balance=balance)
+                accounts[pk].balance = balance
+
+    return transactions
+
+
+def set_account_balance(account, new_balance, created_by=None):
+    """
+    Ajuste manual: leva o saldo da conta a `new_balance`, lançando a
+    diferença como transacção 'manual' (IN ou OUT). Devolve o Posting ou
+    None se o saldo não mudou.
+    """
+    account_id = getattr(account, "pk", account)
+
+    with db_transaction.atomic():
+        locked = lock_account(account_id, active_only=False)
+        old_balance = locked.balance or Decimal("0")
+        if new_balance == old_balance:
+            return None
+
+        if new_balance > old_balance:
+            tx_type = Transaction.TX_TYPE_IN
+            amount = new_balance - old_balance
+            desc = f"Ajuste manual de saldo (+{amount})"
+        else:
+            tx_type = Transaction.TX_TYPE_OUT
+            amount = old_balance - new_balance
+            desc = f"Ajuste manual de saldo (-{amount})"
+
+        return post_transaction(
+            account,
+            tx_type,
+            amount,
+            timezone.localdate(),
+            desc,
+            source_type="manual",
+            created_by=created_by,
+            mode=POSTING_MODE_LOCKED,
+        )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def annotate_live_balance(queryset):
+    """
+    Acrescenta `live_balance` a um queryset de CompanyAccount:
+    saldo aplicado + lançamentos pendentes do diário.
+    """
+    pending = (
+        Transaction.objects
+        .filter(company_account_id=OuterRef("pk"), balance_after__isnull=True)
+        .order_by()
+        .values("company_account_id")
+        .annotate(total=Sum(_signed_amount()))
+        .values("total")
+    )
+    return queryset.annotate(
+        live_balance=Coalesce(F("balance"), Decimal("0"), output_field=MONEY_FIELD)
+        + Coalesce(Subquery(pending, output_field=MONEY_FIELD), Decimal("0"), output_field=MONEY_FIELD)
+    )
+
+
+def company_accounts_balance():
+    """
+    Saldo total das contas activas (aplicado + pendente no diário).
+    """
+    applied = CompanyAccount.objects.filter(is_active=True).aggregate(
+        total=Coalesce(Sum("balance"), Decimal("0"), output_field=MONEY_FIELD)
+    )["total"]
+    pending = Transaction.objects.filter(
+        balance_after__isnull=True, company_account__is_active=True
+    ).aggregate(total=Coalesce(Sum(_signed_amount()), Decimal("0"), output_field=MONEY_FIELD))["total"]
+    return applied + pending
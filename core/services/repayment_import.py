@@ -0,0 +1,491 @@
+# core/services/repayment_import.py
+
+import csv
+import io
+import re
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from core.models import CompanyAccount, Loan, LoanRepayment, PnlMonthly, Transaction
+from core.services.kpi_snapshot import apply_kpi_delta, loan_interest_total
+from core.services.loan_balances import rebuild_loan_balances
+from core.services.pnl import apply_pnl_delta
+from core.services.posting import post_transactions
+from core.services.repayment_state import (
+    REPAYMENT_TYPE_LABELS,
+    RepaymentRuleError,
+    allocate_repayment,
+    repayment_states,
+    state_after_payment,
+)
+
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y")
+
+METHODS = {code for code, _ in LoanRepayment.METHOD_CHOICES}
+
+# Números de telefone comparados pelos últimos 9 dígitos (ex.: 25884xxxxxxx ≡ 84xxxxxxx)
+PHONE_DIGITS = 9
+
+BULK_BATCH_SIZE = 1000
+
+REFERENCE_MAX_LENGTH = LoanRepayment._meta.get_field("reference").max_length
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass
+class ImportRow:
+    """
+    Linha do ficheiro, já convertida, e o respectivo resultado.
+    """
+
+    line: int
+    raw: dict
+    loan_id: int = None
+    payment_date: object = None
+    amount: Decimal = None
+    method: str = None
+    repayment_type: str = "partial"
+    reference: str = ""
+    company_account_id: int = None
+
+    error: str = ""
+    interest_amount: Decimal = Decimal("0.00")
+    principal_amount: Decimal = Decimal("0.00")
+    principal_balance_before: Decimal = Decimal("0.00")
+    principal_balance_after: Decimal = Decimal("0.00")
+    closes_loan: bool = False
+    renews_cycle: bool = False
+
+    @property
+    def ok(self):
+        return not self.error
+
+    def as_dict(self):
+        return {
+            "line": self.line,
+            "loan_id": self.loan_id,
+            "payment_date": self.payment_date.isoformat() if self.payment_date else None,
+            "amount": str(self.amount) if self.amount is not None else None,
+            "reference": self.reference,
+            "ok": self.ok,
+            "message": self.error,
+            "interest_amount": str(self.interest_amount),
+            "principal_amount": str(self.principal_amount),
+            "principal_balance_after": str(self.principal_balance_after),
+        }
+
+
+@dataclass
+class ImportResult:
+    batch: str
+    dry_run: bool
+    rows: list = field(default_factory=list)
+
+    @property
+    def ok_rows(self):
+        return [r for r in self.rows if r.ok]
+
+    @property
+    def error_rows(self):
+        return [r for r in self.rows if not r.ok]
+
+    @property
+    def total_amount(self):
+        return sum((r.amount for r in self.ok_rows), Decimal("0.00"))
+
+    @property
+    def summary(self):
+        prefix = "Simulação" if self.dry_run else "Importação"
+        return (
+            f"{prefix} {self.batch}: {len(self.ok_rows)} reembolsos válidos "
+            f"(total {self.total_amount}), {len(self.error_rows)} linhas com erro."
+        )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _digits(value):
+    return re.sub(r"\D", "", value or "")[-PHONE_DIGITS:]
+
+
+def _parse_amount(value):
+    """
+    Aceita "1234.50", "1 234,50", "1.234,50" ou "1,234.50".
+    """
+    value = (value or "").strip().replace(" ", "").replace("\xa0", "")
+    if "," in value and "." in value:
+        if value.rfind(",") > value.rfind("."):
+            value = value.replace(".", "").replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    else:
+        value = value.replace(",", ".")
+    amount = Decimal(value).quantize(Decimal("0.01"))
+    if amount <= 0:
+        raise InvalidOperation
+    return amount
+
+
+def _parse_date(value):
+    value = (value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError
+
+
+def read_csv(file_or_text):
+    """
+    Lê o CSV (bytes, texto ou ficheiro) e devolve [(nº da linha, dict)].
+    Cabeçalhos normalizados para minúsculas; separador "," ou ";".
+    Colunas: loan_id ou member_phone, payment_date, amount e, opcionalmente,
+    reference, method, repayment_type, company_account.
+    """
+    data = file_or_text.read() if hasattr(file_or_text, "read") else file_or_text
+    if isinstance(data, bytes):
+        try:
+            data = data.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            data = data.decode("latin-1")
+
+    sample = data[:4096]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+
+    reader = csv.DictReader(io.StringIO(data), dialect=dialect)
+    reader.fieldnames = [(name or "").strip().lower() for name in (reader.fieldnames or [])]
+
+    return [
+        (reader.line_num, {k: (v or "").strip() for k, v in row.items() if k})
+        for row in reader
+        if any((v or "").strip() for v in row.values() if isinstance(v, str))
+    ]
+
+
+def _parse_rows(raw_rows, default_account_id, default_method):
+    rows = []
+    for line, raw in raw_rows:
+        row = ImportRow(line=line, raw=raw, company_account_id=default_account_id)
+        rows.append(row)
+
+        if raw.get("loan_id"):
+            try:
+                row.loan_id = int(raw["loan_id"])
+            except ValueError:
+                row.error = f"loan_id inválido: {raw['loan_id']}."
+                continue
+        elif not raw.get("member_phone"):
+            row.error = "Indique loan_id ou member_phone."
+            continue
+
+        try:
+            row.payment_date = _parse_date(raw.get("payment_date"))
+        except ValueError:
+            row.error = f"Data de pagamento inválida: {raw.get('payment_date')}."
+            continue
+
+        try:
+            row.amount = _parse_amount(raw.get("amount"))
+        except (InvalidOperation, ValueError):
+            row.error = f"Valor do pagamento inválido: {raw.get('amount')}."
+            continue
+
+        row.method = raw.get("method") or default_method
+        if row.method not in METHODS:
+            row.error = f"Método de pagamento inválido: {row.method}."
+            continue
+
+        row.repayment_type = raw.get("repayment_type") or "partial"
+        if row.repayment_type not in REPAYMENT_TYPE_LABELS:
+            row.error = f"Tipo de pagamento inválido: {row.repayment_type}."
+            continue
+
+        row.reference = raw.get("reference", "")
+        if len(row.reference) > REFERENCE_MAX_LENGTH:
+            row.error = f"Referência com mais de {REFERENCE_MAX_LENGTH} caracteres: {row.reference}."
+            continue
+
+        if raw.get("company_account"):
+            try:
+                row.company_account_id = int(raw["company_account"])
+            except ValueError:
+                row.error = f"Conta da empresa inválida: {raw['company_account']}."
+                continue
+        if not row.company_account_id:
+            row.error = "Selecione a conta da empresa que recebe o pagamento."
+    return rows
+
+
+def _match_phones(rows):
+    """
+    Resolve member_phone → empréstimo desembolsado do cliente (1 query).
+    Só associa se o cliente tiver exactamente um empréstimo em curso.
+    """
+    pending = [r for r in rows if r.ok and r.loan_id is None]
+    if not pending:
+        return
+
+    loans_by_phone = defaultdict(set)
+    for loan_id, phone, alt_phone in Loan.objects.filter(status="disbursed").values_list(
+        "id", "member__phone", "member__alt_phone"
+    ):
+        for number in (phone, alt_phone):
+            if _digits(number):
+                loans_by_phone[_digits(number)].add(loan_id)
+
+    for row in pending:
+        candidates = loans_by_phone.get(_digits(row.raw.get("member_phone")), set())
+        if len(candidates) == 1:
+            row.loan_id = next(iter(candidates))
+        elif not candidates:
+            row.error = f"Nenhum empréstimo em curso para o telefone {row.raw.get('member_phone')}."
+        else:
+            row.error = (
+                f"O telefone {row.raw.get('member_phone')} tem {len(candidates)} empréstimos "
+                f"em curso; indique o loan_id."
+            )
+
+
+def _imported_references(rows):
+    """
+    Referências do ficheiro que já existem em reembolsos gravados:
+    {referência: id do reembolso} (1 query, índice sobre `reference`).
+    """
+    references = {row.reference for row in rows if row.ok and row.reference}
+    if not references:
+        return {}
+    return dict(
+        LoanRepayment.objects.filter(reference__in=references).order_by("id").values_list("reference", "id")
+    )
+
+
+def _allocate(rows, loans, accounts):
+    """
+    Aplica as regras de distribuição (juros primeiro) linha a linha, na ordem
+    do ficheiro, mantendo o estado de cada empréstimo em memória.
+    """
+    states = repayment_states(list(loans)) if loans else {}
+    imported_references = _imported_references(rows)
+    seen_references = set()
+    renewed = set()
+
+    for row in rows:
+        if not row.ok:
+            continue
+
+        loan = loans.get(row.loan_id)
+        if loan is None:
+            row.error = f"Empréstimo #{row.loan_id} não encontrado ou não está desembolsado."
+            continue
+        if row.company_account_id not in accounts:
+            row.error = f"Conta da empresa inválida: {row.company_account_id}."
+            continue
+        if row.reference:
+            if row.reference in imported_references:
+                row.error = f"Referência {row.reference} já importada (reembolso #{imported_references[row.reference]})."
+                continue
+            if row.reference in seen_references:
+                row.error = f"Referência {row.reference} repetida no ficheiro."
+                continue
+            seen_references.add(row.reference)
+        if row.loan_id in renewed:
+            row.error = (
+                f"O ciclo do empréstimo #{row.loan_id} foi renovado por um pagamento de juros "
+                f"neste ficheiro; importe os pagamentos seguintes noutro lote."
+            )
+            continue
+
+        state = states[row.loan_id]
+        try:
+            allocation = allocate_repayment(
+                state.outstanding_principal, state.interest_remaining, row.amount, row.repayment_type
+            )
+        except RepaymentRuleError as exc:
+            row.error = f"Empréstimo #{row.loan_id}: {exc}"
+            continue
+
+        row.repayment_type = allocation.repayment_type
+        row.interest_amount = allocation.interest_amount
+        row.principal_amount = allocation.principal_amount
+        row.principal_balance_before = state.outstanding_principal
+        row.principal_balance_after = allocation.principal_balance_after
+        row.closes_loan = allocation.closes_loan
+        row.renews_cycle = allocation.renews_cycle
+
+        states[row.loan_id] = state_after_payment(
+            state,
+            loan.interest_type.rate if loan.interest_type else None,
+            row.payment_date,
+            row.interest_amount,
+            row.principal_amount,
+        )
+        if row.renews_cycle:
+            renewed.add(row.loan_id)
+
+
+def _description(row, loan):
+    return (
+        f"{REPAYMENT_TYPE_LABELS[row.repayment_type]} - Reembolso de empréstimo (Loan #{loan.id}) "
+        f"de {loan.member.first_name} {loan.member.last_name} "
+        f"- Juros: {row.interest_amount} · Principal: {row.principal_amount}"
+    )[:255]
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _write(batch, rows, loans, user):
+    """
+    Grava as linhas válidas: LoanRepayment com bulk_create, lançamentos nas
+    contas (`post_transactions`), estado dos empréstimos, LoanBalance e KPIs.
+    """
+    LoanRepayment.objects.bulk_create(
+        [
+            LoanRepayment(
+                loan_id=row.loan_id,
+                member_id=loans[row.loan_id].member_id,
+                company_account_id=row.company_account_id,
+                payment_date=row.payment_date,
+                amount=row.amount,
+                interest_amount=row.interest_amount,
+                principal_amount=row.principal_amount,
+                principal_balance_after=row.principal_balance_after,
+                method=row.method,
+                reference=row.reference or None,
+                import_batch=batch,
+                import_line=row.line,
+            )
+            for row in rows
+        ],
+        batch_size=BULK_BATCH_SIZE,
+    )
+
+    # MySQL não devolve os IDs do bulk_create: recuperá-los pelo lote
+    repayment_ids = dict(
+        LoanRepayment.objects.filter(import_batch=batch).values_list("import_line", "id")
+    )
+
+    post_transactions(
+        Transaction(
+            company_account_id=row.company_account_id,
+            tx_type=Transaction.TX_TYPE_IN,
+            source_type="loan_repayment",
+            source_id=repayment_ids[row.line],
+            tx_date=row.payment_date,
+            description=_description(row, loans[row.loan_id]),
+            amount=row.amount,
+            created_by=user,
+        )
+        for row in rows
+    )
+
+    # Estado / validade dos empréstimos
+    closed_ids = {row.loan_id for row in rows if row.closes_loan}
+    if closed_ids:
+        Loan.objects.filter(pk__in=closed_ids).update(status="closed")
+
+    renewals = defaultdict(list)
+    for row in rows:
+        if row.renews_cycle:
+            renewals[row.payment_date].append(row.loan_id)
+    for payment_date, loan_ids in renewals.items():
+        Loan.objects.filter(pk__in=loan_ids).update(
+            release_date=payment_date,
+            first_payment_date=payment_date + timedelta(days=30),
+        )
+
+    rebuild_loan_balances({row.loan_id for row in rows})
+
+    # KPIs: fluxos por data de negócio, stocks de uma só vez
+    flows = defaultdict(lambda: {"repayments_amount": Decimal("0"), "repayments_count": 0})
+    for row in rows:
+        flows[row.payment_date]["repayments_amount"] += row.amount
+        flows[row.payment_date]["repayments_count"] += 1
+    for payment_date, deltas in flows.items():
+        apply_kpi_delta(flow_date=payment_date, **deltas)
+
+    # P&L: juros por mês e conta da empresa
+    interest = defaultdict(lambda: [Decimal("0"), 0])
+    for row in rows:
+        totals = interest[(row.payment_date.replace(day=1), row.company_account_id)]
+        totals[0] += row.interest_amount
+        totals[1] += 1
+    for (month, account_id), (amount, entries) in interest.items():
+        apply_pnl_delta(PnlMonthly.LINE_LOAN_INTEREST, month, amount, account_id, entries=entries)
+
+    outstanding_before = {}
+    outstanding_after = {}
+    for row in rows:
+        outstanding_before.setdefault(row.loan_id, row.principal_balance_before)
+        outstanding_after[row.loan_id] = row.principal_balance_after
+    apply_kpi_delta(
+        outstanding_principal=sum(outstanding_after.values()) - sum(outstanding_before.values()),
+        loans_disbursed=-len(closed_ids),
+        loans_closed=len(closed_ids),
+        interest_to_receive=-sum(
+            (loan_interest_total(loans[loan_id]) for loan_id in closed_ids), Decimal("0")
+        ),
+    )
+
+
+def import_repayments(file_or_text, company_account_id=None, method="mobile", user=None, dry_run=False):
+    """
+    Importa reembolsos a partir de um extracto CSV (M-Pesa, e-Mola, banco).
+
+    Cada linha é associada a um empréstimo desembolsado (loan_id ou telefone
+    do cliente) e distribuída com as mesmas regras do registo manual
+    (`allocate_repayment`). Linhas com erro — incluindo referências repetidas
+    no ficheiro ou já importadas — não são gravadas e são devolvidas no
+    resultado; as restantes são gravadas numa única transacção.
+    Com `dry_run=True` nada é gravado.
+    """
+    batch = f"{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+    default_account_id = int(company_account_id) if company_account_id else None
+
+    rows = _parse_rows(read_csv(file_or_text), default_account_id, method)
+    _match_phones(rows)
+    result = ImportResult(batch=batch, dry_run=dry_run, rows=rows)
+
+    with db_transaction.atomic():
+        loan_ids = {r.loan_id for r in rows if r.ok}
+        account_ids = {r.company_account_id for r in rows if r.ok}
+
+        if dry_run:
+            loan_ids = set(
+                Loan.objects.filter(pk__in=loan_ids, status="disbursed").values_list("id", flat=True)
+            )
+        else:
+            # Bloqueia os empréstimos antes de ler o estado (as contas são
+            # bloqueadas por post_transactions, conforme o modo de lançamento)
+            loan_ids = set(
+                Loan.objects.select_for_update()
+                .filter(pk__in=loan_ids, status="disbursed")
+                .values_list("id", flat=True)
+            )
+        accounts = CompanyAccount.objects.filter(is_active=True).in_bulk(account_ids)
+
+        loans = Loan.objects.select_related("member", "interest_type").in_bulk(loan_ids)
+        _allocate(rows, loans, accounts)
+
+        valid = result.ok_rows
+        if valid and not dry_run:
+            _write(batch, valid, loans, user)
+
+    return result
@@ -0,0 +1,314 @@
+# core/services/repayment_state.py
+
+from dataclasses import dataclass, replace
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Count, ExpressionWrapper, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Round, TruncDate
+
+from core.models import Loan
+from core.services.money import MONEY_FIELD
+
+
+RATE_FIELD_PRECISION = 4
+
+ZERO = Value(Decimal("0"), output_field=MONEY_FIELD)
+
+
+#=============================================================================
+#=============================================================================
+
+
+@dataclass(frozen=True)
+class RepaymentState:
+    """
+    Estado de reembolso de um empréstimo no ciclo actual.
+    """
+
+    loan_id: int
+    principal_amount: Decimal
+    cycle_start: date
+    cycle_due: date
+    principal_paid_total: Decimal
+    principal_paid_before_cycle: Decimal
+    interest_paid_cycle: Decimal
+    outstanding_principal: Decimal
+    cycle_base_principal: Decimal
+    cycle_interest_total: Decimal
+    interest_remaining: Decimal
+    repayments_count: int
+    last_repayment_date: date
+
+    @property
+    def outstanding_with_interest(self):
+        return self.outstanding_principal + self.interest_remaining
+
+
+STATE_FIELDS = [
+    name for name in RepaymentState.__dataclass_fields__ if name not in ("loan_id", "principal_amount")
+]
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _money(expression):
+    return ExpressionWrapper(expression, output_field=MONEY_FIELD)
+
+
+def annotate_repayment_state(queryset):
+    """
+    Acrescenta a um queryset de Loan as colunas `rs_<campo>` do RepaymentState,
+    calculadas numa única query agrupada (sl_loans ⟕ sl_loan_repayments) com
+    somas condicionais:
+
+    - ciclo actual = [release_date (ou data de criação), first_payment_date]
+    - principal na entrada do ciclo = principal - principal pago antes do ciclo
+    - juros do ciclo = ROUND(base × ROUND(taxa / 100, 4), 2)
+    - juros em falta = juros do ciclo - juros pagos dentro do ciclo
+    """
+    in_cycle = Q(repayments__payment_date__gte=F("rs_cycle_start")) & (
+        Q(first_payment_date__isnull=True)
+        | Q(repayments__payment_date__lte=F("first_payment_date"))
+    )
+
+    rate = Round(
+        Coalesce(F("interest_type__rate"), Value(Decimal("0"))) / Value(Decimal("100")),
+        RATE_FIELD_PRECISION,
+    )
+
+    return (
+        queryset
+        .annotate(
+            rs_cycle_start=Coalesce("release_date", TruncDate("created_at")),
+            rs_cycle_due=F("first_payment_date"),
+        )
+        .annotate(
+            rs_principal_paid_total=Coalesce(
+                Sum("repayments__principal_amount"), ZERO, output_field=MONEY_FIELD
+            ),
+            rs_principal_paid_before_cycle=Coalesce(
+                Sum(
+                    "repayments__principal_amount",
+                    filter=Q(repayments__payment_date__lt=F("rs_cycle_start")),
+                ),
+                ZERO,
+                output_field=MONEY_FIELD,
+            ),
+            rs_interest_paid_cycle=Coalesce(
+                Sum("repayments__interest_amount", filter=in_cycle),
+                ZERO,
+                output_field=MONEY_FIELD,
+            ),
+            rs_repayments_count=Count("repayments"),
+            rs_last_repayment_date=Max("repayments__payment_date"),
+        )
+        .annotate(
+            rs_outstanding_principal=_money(
+                Greatest(F("principal_amount") - F("rs_principal_paid_total"), ZERO)
+            ),
+            rs_cycle_base_principal=_money(
+                Greatest(F("principal_amount") - F("rs_principal_paid_before_cycle"), ZERO)
+            ),
+        )
+        .annotate(
+            rs_cycle_interest_total=_money(Round(F("rs_cycle_base_principal") * rate, 2)),
+        )
+        .annotate(
+            rs_interest_remaining=_money(
+                Greatest(F("rs_cycle_interest_total") - F("rs_interest_paid_cycle"), ZERO)
+            ),
+        )
+    )
+
+
+def state_from_row(loan_id, principal_amount, row):
+    """
+    Constrói o RepaymentState a partir de um objecto/dict com as colunas `rs_*`.
+    """
+    get = row.get if isinstance(row, dict) else (lambda name: getattr(row, name))
+    return RepaymentState(
+        loan_id=loan_id,
+        principal_amount=principal_amount,
+        **{name: get(f"rs_{name}") for name in STATE_FIELDS},
+    )
+
+
+def repayment_states(loans):
+    """
+    Estado de reembolso para um conjunto de empréstimos (queryset de Loan ou
+    lista de IDs), numa única query. Devolve {loan_id: RepaymentState}.
+    """
+    if not hasattr(loans, "model"):
+        loans = Loan.objects.filter(pk__in=list(loans))
+
+    rows = annotate_repayment_state(loans.order_by()).values(
+        "id", "principal_amount", *[f"rs_{name}" for name in STATE_FIELDS]
+    )
+    return {
+        row["id"]: state_from_row(row["id"], row["principal_amount"], row)
+        for row in rows
+    }
+
+
+def apply_repayment_state(loan, state):
+    """
+    Anexa ao `loan` os atributos usados pelos templates de reembolsos.
+    """
+    loan.repayment_state = state
+    loan.outstanding_principal = state.outstanding_principal
+    loan.current_cycle_start = state.cycle_start
+    loan.current_cycle_due = state.cycle_due
+    loan.period_interest_total = state.cycle_interest_total
+    loan.period_interest_remaining = state.interest_remaining
+    loan.outstanding_with_interest = state.outstanding_with_interest
+    return loan
+
+
+def cycle_interest(base_principal, rate):
+    """
+    Juros de um ciclo em Python, com o mesmo arredondamento do SQL:
+    ROUND(base × ROUND(taxa / 100, 4), 2).
+    """
+    rate_decimal = ((rate or Decimal("0")) / Decimal("100")).quantize(
+        Decimal("0.0001"), rounding=ROUND_HALF_UP
+    )
+    return (base_principal * rate_decimal).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def state_after_payment(state, rate, payment_date, interest_amount, principal_amount):
+    """
+    Estado resultante de acrescentar um pagamento a `state`, sem voltar à base
+    de dados (usado para aplicar vários pagamentos do mesmo empréstimo em lote).
+    O ciclo (início/validade) não muda.
+    """
+    paid_total = state.principal_paid_total + principal_amount
+    paid_before = state.principal_paid_before_cycle
+    interest_paid = state.interest_paid_cycle
+
+    if payment_date < state.cycle_start:
+        paid_before += principal_amount
+    elif state.cycle_due is None or payment_date <= state.cycle_due:
+        interest_paid += interest_amount
+
+    base = max(state.principal_amount - paid_before, Decimal("0"))
+    interest_total = cycle_interest(base, rate)
+
+    return replace(
+        state,
+        principal_paid_total=paid_total,
+        principal_paid_before_cycle=paid_before,
+        interest_paid_cycle=interest_paid,
+        outstanding_principal=max(state.principal_amount - paid_total, Decimal("0")),
+        cycle_base_principal=base,
+        cycle_interest_total=interest_total,
+        interest_remaining=max(interest_total - interest_paid, Decimal("0")),
+        repayments_count=state.repayments_count + 1,
+        last_repayment_date=max(filter(None, [state.last_repayment_date, payment_date])),
+    )
+
+
+#=============================================================================
+#=============================================================================
+
+
+REPAYMENT_TYPE_LABELS = {
+    "interest_only": "Pagamento apenas de juros",
+    "full": "Liquidação total (juros + principal)",
+    "partial": "Pagamento parcial (juros + principal)",
+}
+
+
+class RepaymentRuleError(ValueError):
+    """
+    Pagamento que não respeita as regras de distribuição (mensagem para o utilizador).
+    """
+
+
+@dataclass(frozen=True)
+class RepaymentAllocation:
+    repayment_type: str
+    interest_amount: Decimal
+    principal_amount: Decimal
+    principal_balance_after: Decimal
+
+    @property
+    def label(self):
+        return REPAYMENT_TYPE_LABELS[self.repayment_type]
+
+    @property
+    def closes_loan(self):
+        return self.principal_balance_after <= 0
+
+    @property
+    def renews_cycle(self):
+        return self.repayment_type == "interest_only" and not self.closes_loan
+
+
+def allocate_repayment(outstanding_principal, interest_remaining, amount, repayment_type="partial"):
+    """
+    Distribui um pagamento entre juros e principal (juros primeiro):
+    - interest_only: valor = exactamente os juros em falta; principal mantém-se.
+    - full: valor = principal em dívida + juros em falta; fecha o empréstimo.
+    - partial: pelo menos os juros em falta; o resto amortiza principal.
+    Lança RepaymentRuleError com a mensagem a mostrar ao utilizador.
+    """
+    if outstanding_principal <= 0:
+        raise RepaymentRuleError("Este empréstimo não tem saldo de principal em dívida.")
+
+    if repayment_type == "interest_only":
+        if interest_remaining <= 0:
+            raise RepaymentRuleError(
+                "Não há juros em falta neste ciclo. Não é possível liquidar apenas juros."
+            )
+        # tem de pagar exactamente os juros em falta
+        if amount != interest_remaining:
+            raise RepaymentRuleError(
+                f"Para liquidar apenas os juros deste ciclo o valor deve ser exactamente "
+                f"{interest_remaining}. Introduziu {amount}."
+            )
+        return RepaymentAllocation(
+            repayment_type="interest_only",
+            interest_amount=interest_remaining,
+            principal_amount=Decimal("0.00"),
+            principal_balance_after=outstanding_principal,  # não muda
+        )
+
+    if repayment_type == "full":
+        total_to_close = outstanding_principal + interest_remaining
+        if amount != total_to_close:
+            raise RepaymentRuleError(
+                f"Para liquidar totalmente este empréstimo deve pagar exactamente "
+                f"{total_to_close} (principal {outstanding_principal} + juros em falta {interest_remaining}). "
+                f"Introduziu {amount}."
+            )
+        return RepaymentAllocation(
+            repayment_type="full",
+            interest_amount=interest_remaining,
+            principal_amount=outstanding_principal,
+            principal_balance_after=Decimal("0.00"),
+        )
+
+    # partial
+    if interest_remaining > 0 and amount < interest_remaining:
+        raise RepaymentRuleError(
+            f"Para pagamento parcial neste ciclo deve pagar pelo menos os juros em falta "
+            f"({interest_remaining}). Introduziu {amount}."
+        )
+
+    # primeiro liquida juros em falta, resto vai para principal
+    interest_amount = min(amount, interest_remaining)
+    principal_amount = amount - interest_amount
+
+    principal_balance_after = outstanding_principal - principal_amount
+    if principal_balance_after < 0:
+        principal_balance_after = Decimal("0.00")
+
+    return RepaymentAllocation(
+        repayment_type="partial",
+        interest_amount=interest_amount,
+        principal_amount=principal_amount,
+        principal_balance_after=principal_balance_after,
+    )
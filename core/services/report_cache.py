@@ -0,0 +1,87 @@
+# core/services/report_cache.py
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from core.services.reports import build_report_context, report_querysets
+
+
+# Relatórios com mais linhas do que isto não guardam o contexto em cache
+# (o PDF continua a ser reutilizado através de ReportJob.cache_key).
+CONTEXT_CACHE_MAX_ROWS = 5000
+
+
+#=============================================================================
+#=============================================================================
+
+
+def report_watermark(params):
+    """
+    Marca d'água dos dados de um relatório: para cada queryset de origem
+    (já com período e filtros), número de linhas e maior id — e, nos saldos,
+    a soma dos saldos com os lançamentos pendentes no diário. Um lançamento
+    com data retroactiva dentro do período muda a contagem/o maior id e
+    invalida a cache; lançamentos fora do período não.
+    """
+    marks = []
+    for name, qs in sorted(report_querysets(params).items()):
+        aggregates = {"n": Count("pk"), "max_id": Max("pk")}
+        if params.report_type == "balances":
+            aggregates["balance"] = Sum("live_balance")
+        row = qs.order_by().aggregate(**aggregates)
+        marks.append([name, *(row[key] for key in sorted(row))])
+    return marks
+
+
+def report_cache_key(params, watermark=None):
+    """
+    Chave da cache: tipo, datas, filtros (membro, utilizador, conta) e marca d'água.
+    """
+    if watermark is None:
+        watermark = report_watermark(params)
+    payload = json.dumps([params.to_dict(), watermark], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_seconds():
+    """
+    Validade máxima de uma entrada, para edições no próprio registo
+    (valor alterado sem mudar contagem nem ids), que a marca d'água não vê.
+    """
+    return getattr(settings, "REPORT_CACHE_SECONDS", 6 * 3600)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def cached_report_context(params, generated_by=None, key=None):
+    """
+    Contexto do relatório, reutilizado da cache quando a marca d'água não
+    mudou. As linhas são materializadas (listas) para poderem ir para a cache,
+    excepto em relatórios grandes, que não são guardados.
+    """
+    key = key or report_cache_key(params)
+    cache_key = f"report_context:{key}"
+
+    context = cache.get(cache_key)
+    if context is None:
+        context = build_report_context(params)
+        too_big = False
+        for name in ("rows", "accounts"):
+            if name in context:
+                # no máximo CONTEXT_CACHE_MAX_ROWS + 1 linhas em memória; acima
+                # disso fica o queryset (o PDF é gerado por blocos)
+                rows = list(context[name][: CONTEXT_CACHE_MAX_ROWS + 1])
+                if len(rows) > CONTEXT_CACHE_MAX_ROWS:
+                    too_big = True
+                else:
+                    context[name] = rows
+        if not too_big:
+            cache.set(cache_key, context, cache_seconds())
+
+    return {**context, "generated_by": generated_by}
@@ -0,0 +1,104 @@
+# core/services/report_chunks.py
+
+import gc
+import io
+import os
+import tempfile
+from decimal import Decimal
+from itertools import islice
+
+from django.db.models import Q
+from django.template.loader import render_to_string
+
+from core.services.pdf import get_renderer
+
+
+#=============================================================================
+#=============================================================================
+
+
+def iter_keyset(queryset, order_field, chunk_size):
+    """
+    Objectos de `queryset` por ordem de (order_field, id), lidos em blocos de
+    `chunk_size` com paginação por chave (cada bloco é um SELECT ... LIMIT;
+    o mysqlclient não faz streaming de um SELECT único).
+    """
+    qs = queryset.order_by(order_field, "pk")
+    page = qs
+    while True:
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+        value = getattr(last, order_field)
+        page = qs.filter(Q(**{f"{order_field}__gt": value}) | Q(**{order_field: value, "pk__gt": last.pk}))
+
+
+def render_chunked_pdf(template_name, context, rows, carry, chunk_rows):
+    """
+    Gera um PDF com `rows` em blocos de `chunk_rows` linhas: cada bloco é
+    um PDF parcial (em disco) e no fim são juntos com o pypdf. Só um bloco
+    (e o seguinte, para saber qual é o último) está em memória de cada vez.
+
+    No template, `chunk` tem:
+      first / last  — o cabeçalho só sai no primeiro bloco; totais e resumo só no último
+      page_offset   — páginas dos blocos anteriores (numeração contínua)
+      carried_in    — [(rótulo, valor)] transportados dos blocos anteriores
+      carried_out   — [(rótulo, valor)] acumulados até ao fim deste bloco
+      row_count     — linhas até ao fim deste bloco (no último, o total)
+
+    `carry`: [(rótulo, função(linha) -> valor)] dos totais a transportar.
+    """
+    from pypdf import PdfWriter
+
+    renderer = get_renderer()
+    sums = [Decimal("0")] * len(carry)
+    labels = [label for label, _ in carry]
+    page_offset = 0
+    row_count = 0
+    rows = iter(rows)
+
+    with tempfile.TemporaryDirectory(prefix="report_") as tmp_dir:
+        parts = []
+        chunk = list(islice(rows, chunk_rows))
+        while chunk:
+            next_chunk = list(islice(rows, chunk_rows))
+            carried_in = list(zip(labels, sums)) if parts else []
+            row_count += len(chunk)
+            for i, (_, value) in enumerate(carry):
+                sums[i] += sum((value(row) or 0 for row in chunk), Decimal("0"))
+
+            html_string = render_to_string(template_name, {
+                **context,
+                "rows": chunk,
+                "chunk": {
+                    "index": len(parts) + 1,
+                    "first": not parts,
+                    "last": not next_chunk,
+                    "page_offset": page_offset,
+                    "carried_in": carried_in,
+                    "carried_out": list(zip(labels, sums)),
+                    "row_count": row_count,
+                },
+            })
+            pdf_bytes = renderer.render(html_string)
+            page_offset += renderer.stats.last_pages
+
+            path = os.path.join(tmp_dir, f"part_{len(parts):05d}.pdf")
+            with open(path, "wb") as fh:
+                fh.write(pdf_bytes)
+            parts.append(path)
+
+            # a árvore de layout do WeasyPrint tem ciclos: libertar antes do bloco seguinte
+            del html_string, pdf_bytes
+            chunk = next_chunk
+            gc.collect()
+
+        writer = PdfWriter()
+        for path in parts:
+            writer.append(path)
+        output = io.BytesIO()
+        writer.write(output)
+        writer.close()
+        return output.getvalue()
@@ -0,0 +1,565 @@
+# core/services/report_export.py
+
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from core.models import Loan, LoanDisbursement, LoanRepayment, Transaction
+from core.services.reports import report_querysets
+
+
+# Linhas lidas da BD de cada vez — a memória não cresce com o período
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+TEXT, INT, MONEY, DATE, DATETIME = "text", "int", "money", "date", "datetime"
+
+CREATED_BY = Concat(
+    F("created_by__first_name"), Value(" "), F("created_by__last_name"),
+)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _choice(choices):
+    labels = dict(choices)
+    return lambda value: labels.get(value, value)
+
+
+def _user_name(row):
+    return (row.get("created_by_name") or "").strip() or row.get("created_by__username") or ""
+
+
+def _member_name(row):
+    return f'{row["member__first_name"]} {row["member__last_name"]}'
+
+
+class ReportExport:
+    """
+    Linhas de um relatório para exportação (CSV/XLSX), sem materializar o
+    queryset: lê com values() só as colunas exportadas, em blocos, e vai
+    somando os totais enquanto as linhas passam. Os totais só ficam
+    completos depois de `rows()` ser consumido.
+
+    `columns`: [(cabeçalho, tipo, função(linha) -> valor)]
+    `totals`:  [(rótulo, índice da coluna, função(linha) -> valor a somar)]
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.columns, self.totals, self._sources = _EXPORTS[params.report_type](report_querysets(params))
+        self._sums = [Decimal("0")] * len(self.totals)
+
+    @property
+    def headers(self):
+        return [header for header, _, _ in self.columns]
+
+    @property
+    def kinds(self):
+        return [kind for _, kind, _ in self.columns]
+
+    def rows(self):
+        for row in chain.from_iterable(self._sources):
+            for i, (_, _, amount) in enumerate(self.totals):
+                self._sums[i] += amount(row) or 0
+            yield [getter(row) for _, _, getter in self.columns]
+
+    def total_rows(self):
+        rows = []
+        for (label, column, _), total in zip(self.totals, self._sums):
+            row = [None] * len(self.columns)
+            row[0] = label
+            row[column] = total
+            rows.append(row)
+        return rows
+
+
+def _iter(qs, order_field, *fields, **expressions):
+    """
+    Linhas (dicts de values()) por ordem de (order_field, id), lidas em blocos
+    de EXPORT_CHUNK_SIZE com paginação por chave. O mysqlclient não faz
+    streaming — .iterator() traria o resultado inteiro para a memória do
+    cliente de uma vez — por isso cada bloco é uma consulta com LIMIT.
+    """
+    qs = qs.order_by(order_field, "pk").values("pk", order_field, *fields, **expressions)
+    page = qs
+    while True:
+        rows = list(page[:EXPORT_CHUNK_SIZE])
+        yield from rows
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        last = rows[-1]
+        page = qs.filter(
+            Q(**{f"{order_field}__gt": last[order_field]})
+            | Q(**{order_field: last[order_field], "pk__gt": last["pk"]})
+        )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _cash_flow_export(date_field):
+    """Rendimentos / Despesas."""
+
+    def build(querysets):
+        columns = [
+            ("Data", DATE, lambda r: r[date_field]),
+            ("Categoria", TEXT, lambda r: r["category__name"] or ""),
+            ("Descrição", TEXT, lambda r: r["description"]),
+            ("Conta", TEXT, lambda r: r["company_account__name"] or ""),
+            ("Valor (MT)", MONEY, lambda r: r["amount"]),
+            ("Registado por", TEXT, _user_name),
+        ]
+        totals = [("Total", 4, lambda r: r["amount"])]
+        rows = _iter(
+            querysets["rows"], date_field,
+            "category__name", "description", "company_account__name", "amount",
+            "created_by__username", created_by_name=CREATED_BY,
+        )
+        return columns, totals, [rows]
+
+    return build
+
+
+def _balances_export(querysets):
+    columns = [
+        ("Conta", TEXT, lambda r: r["name"]),
+        ("Identificador", TEXT, lambda r: r["account_identifier"]),
+        ("Saldo Actual (MT)", MONEY, lambda r: r["live_balance"]),
+    ]
+    totals = [("Total", 2, lambda r: r["live_balance"])]
+    return columns, totals, [_iter(querysets["accounts"], "name", "account_identifier", "live_balance")]
+
+
+def _loans_export(querysets):
+    status = _choice(Loan.STATUS_CHOICES)
+    period_type = _choice(Loan.PERIOD_TYPE_CHOICES)
+    columns = [
+        ("ID", INT, lambda r: r["id"]),
+        ("Membro", TEXT, _member_name),
+        ("Tipo", TEXT, lambda r: r["loan_type__name"] or ""),
+        ("Principal (MT)", MONEY, lambda r: r["principal_amount"]),
+        ("Períodos", INT, lambda r: r["term_periods"]),
+        ("Tipo de Período", TEXT, lambda r: period_type(r["period_type"])),
+        ("Estado", TEXT, lambda r: status(r["status"])),
+        ("Criado em", DATETIME, lambda r: r["created_at"]),
+        ("Registado por", TEXT, _user_name),
+    ]
+    totals = [("Total", 3, lambda r: r["principal_amount"])]
+    rows = _iter(
+        querysets["rows"], "created_at",
+        "id", "member__first_name", "member__last_name", "loan_type__name", "principal_amount",
+        "term_periods", "period_type", "status",
+        "created_by__username", created_by_name=CREATED_BY,
+    )
+    return columns, totals, [rows]
+
+
+def _disbursements_export(querysets):
+    method = _choice(LoanDisbursement.METHOD_CHOICES)
+    columns = [
+        ("ID", INT, lambda r: r["id"]),
+        ("Empréstimo", INT, lambda r: r["loan_id"]),
+        ("Data", DATE, lambda r: r["disburse_date"]),
+        ("Membro", TEXT, _member_name),
+        ("Conta", TEXT, lambda r: r["company_account__name"] or ""),
+        ("Valor (MT)", MONEY, lambda r: r["amount"]),
+        ("Método", TEXT, lambda r: method(r["method"])),
+    ]
+    totals = [("Total", 5, lambda r: r["amount"])]
+    rows = _iter(
+        querysets["rows"], "disburse_date",
+        "id", "loan_id", "member__first_name", "member__last_name",
+        "company_account__name", "amount", "method",
+    )
+    return columns, totals, [rows]
+
+
+def _repayments_export(querysets):
+    method = _choice(LoanRepayment.METHOD_CHOICES)
+    columns = [
+        ("ID", INT, lambda r: r["id"]),
+        ("Empréstimo", INT, lambda r: r["loan_id"]),
+        ("Data", DATE, lambda r: r["payment_date"]),
+        ("Membro", TEXT, _member_name),
+        ("Conta", TEXT, lambda r: r["company_account__name"] or ""),
+        ("Total (MT)", MONEY, lambda r: r["amount"]),
+        ("Juros", MONEY, lambda r: r["interest_amount"]),
+        ("Principal", MONEY, lambda r: r["principal_amount"]),
+        ("Método", TEXT, lambda r: method(r["method"])),
+    ]
+    totals = [
+        ("Total", 5, lambda r: r["amount"]),
+        ("Total de Juros", 6, lambda r: r["interest_amount"]),
+        ("Total de Principal", 7, lambda r: r["principal_amount"]),
+    ]
+    rows = _iter(
+        querysets["rows"], "payment_date",
+        "id", "loan_id", "member__first_name", "member__last_name",
+        "company_account__name", "amount", "interest_amount", "principal_amount", "method",
+    )
+    return columns, totals, [rows]
+
+
+def _transactions_export(querysets):
+    tx_type = _choice(Transaction.TX_TYPE_CHOICES)
+
+    def signed(r):
+        return r["amount"] if r["tx_type"] == Transaction.TX_TYPE_IN else -r["amount"]
+
+    columns = [
+        ("Data", DATE, lambda r: r["tx_date"]),
+        ("Conta", TEXT, lambda r: r["company_account__name"] or ""),
+        ("Tipo", TEXT, lambda r: tx_type(r["tx_type"])),
+        ("Origem", TEXT, lambda r: Transaction.SOURCE_TYPE_LABELS.get(r["source_type"], r["source_type"] or "")),
+        ("Descrição", TEXT, lambda r: r["description"]),
+        ("Valor (MT)", MONEY, lambda r: r["amount"]),
+        ("Saldo Antes", MONEY, lambda r: r["balance_before"]),
+        ("Saldo Depois", MONEY, lambda r: r["balance_after"]),
+        ("Registado por", TEXT, _user_name),
+    ]
+    totals = [
+        ("Total Entradas", 5, lambda r: r["amount"] if r["tx_type"] == Transaction.TX_TYPE_IN else 0),
+        ("Total Saídas", 5, lambda r: r["amount"] if r["tx_type"] == Transaction.TX_TYPE_OUT else 0),
+        ("Líquido (Entradas - Saídas)", 5, signed),
+    ]
+    rows = _iter(
+        querysets["rows"], "tx_date",
+        "company_account__name", "tx_type", "source_type", "description",
+        "amount", "balance_before", "balance_after",
+        "created_by__username", created_by_name=CREATED_BY,
+    )
+    return columns, totals, [rows]
+
+
+def _lease_arrears_export(querysets):
+    columns = [
+        ("Contrato", INT, lambda r: r["id"]),
+        ("Viatura", TEXT, lambda r: r["leased_vehicle__plate_number"]),
+        ("Motorista", TEXT, lambda r: f'{r["driver__first_name"]} {r["driver__last_name"]}'),
+        ("Início", DATE, lambda r: r["start_date"]),
+        ("Renda Semanal (MT)", MONEY, lambda r: r["weekly_rent"]),
+        ("Semanas Vencidas", INT, lambda r: r["lease_weeks_due"]),
+        ("Semanas Pagas", INT, lambda r: r["lease_weeks_paid"]),
+        ("Esperado (MT)", MONEY, lambda r: r["lease_expected"]),
+        ("Recebido (MT)", MONEY, lambda r: r["lease_received"]),
+        ("Em Atraso (MT)", MONEY, lambda r: r["lease_arrears"]),
+    ]
+    totals = [
+        ("Total Esperado", 7, lambda r: r["lease_expected"]),
+        ("Total Recebido", 8, lambda r: r["lease_received"]),
+        ("Total em Atraso", 9, lambda r: r["lease_arrears"]),
+    ]
+    rows = _iter(
+        querysets["rows"], "start_date",
+        "id", "leased_vehicle__plate_number", "driver__first_name", "driver__last_name", "weekly_rent",
+        "lease_weeks_due", "lease_weeks_paid", "lease_expected", "lease_received", "lease_arrears",
+    )
+    return columns, totals, [rows]
+
+
+def _profits_export(querysets):
+    """
+    O PDF só mostra os dois totais; a exportação traz o detalhe (rendimentos
+    e depois despesas, com sinal) e os totais no fim.
+    """
+    columns = [
+        ("Tipo", TEXT, lambda r: r["kind"]),
+        ("Data", DATE, lambda r: r["date"]),
+        ("Categoria", TEXT, lambda r: r["category__name"] or ""),
+        ("Descrição", TEXT, lambda r: r["description"]),
+        ("Conta", TEXT, lambda r: r["company_account__name"] or ""),
+        ("Valor (MT)", MONEY, lambda r: r["amount"] if r["kind"] == "Rendimento" else -r["amount"]),
+    ]
+    totals = [
+        ("Total de Rendimentos", 5, lambda r: r["amount"] if r["kind"] == "Rendimento" else 0),
+        ("Total de Despesas", 5, lambda r: r["amount"] if r["kind"] == "Despesa" else 0),
+        ("Lucro Líquido (Rendimentos - Despesas)", 5,
+         lambda r: r["amount"] if r["kind"] == "Rendimento" else -r["amount"]),
+    ]
+    fields = ("category__name", "description", "company_account__name", "amount")
+    incomes = _iter(
+        querysets["incomes"], "income_date",
+        *fields, kind=Value("Rendimento"), date=F("income_date"),
+    )
+    expenses = _iter(
+        querysets["expenses"], "expense_date",
+        *fields, kind=Value("Despesa"), date=F("expense_date"),
+    )
+    return columns, totals, [incomes, expenses]
+
+
+_EXPORTS = {
+    "incomes": _cash_flow_export("income_date"),
+    "expenses": _cash_flow_export("expense_date"),
+    "balances": _balances_export,
+    "loans": _loans_export,
+    "disbursements": _disbursements_export,
+    "repayments": _repayments_export,
+    "transactions": _transactions_export,
+    "lease_arrears": _lease_arrears_export,
+    "profits": _profits_export,
+}
+
+
+#=============================================================================
+# CSV
+#=============================================================================
+
+
+class _Echo:
+    """Pseudo-ficheiro: write() devolve o texto, para o csv.writer alimentar o gerador."""
+
+    def write(self, value):
+        return value
+
+
+def _local(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.replace(tzinfo=None)
+
+
+# Texto começado por um destes caracteres é lido pelo Excel/LibreOffice como
+# fórmula (injecção via descrição, notas ou nome); leva um apóstrofo à frente.
+_FORMULA_PREFIXES = ("=", "+", "-", "@")
+
+
+def _safe_text(value):
+    if value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return _local(value).strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, Decimal):
+        return f"{value:.2f}"
+    if isinstance(value, str):
+        return _safe_text(value)
+    return value
+
+
+def stream_csv(export):
+    """
+    Gerador de CSV (UTF-8 com BOM, para o Excel reconhecer os acentos).
+    """
+    writer = csv.writer(_Echo())
+    yield "﻿" + writer.writerow(export.headers)
+    for row in export.rows():
+        yield writer.writerow([_csv_value(value) for value in row])
+    yield writer.writerow([])
+    for row in export.total_rows():
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+#=============================================================================
+# XLSX — escrito à mão (SpreadsheetML dentro de um zip), linha a linha
+#=============================================================================
+
+_EXCEL_EPOCH = date(1899, 12, 30)
+
+# Índices de cellXfs em _STYLES_XML
+_STYLE_HEADER, _STYLE_DATE, _STYLE_DATETIME, _STYLE_MONEY = 1, 2, 3, 4
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="yyyy-mm-dd"/>'
+    '<numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm"/>'
+    '</numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="5">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '</cellXfs>'
+    '</styleSheet>'
+)
+
+
+def _workbook_xml(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name[:31], {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+# Caracteres de controlo que o XML 1.0 não admite (o Excel recusa o ficheiro).
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _xlsx_cell(value, kind, style=None):
+    if value is None or value == "":
+        return "<c/>"
+    if kind in (DATE, DATETIME) and isinstance(value, (date, datetime)):
+        if isinstance(value, datetime):
+            delta = _local(value) - datetime(1899, 12, 30)
+            serial = delta.days + delta.seconds / 86400
+            return f'<c s="{_STYLE_DATETIME}"><v>{serial:.6f}</v></c>'
+        return f'<c s="{_STYLE_DATE}"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    if kind in (MONEY, INT) and isinstance(value, (int, Decimal)):
+        style_attr = f' s="{_STYLE_MONEY}"' if kind == MONEY else ""
+        return f"<c{style_attr}><v>{value}</v></c>"
+    style_attr = f' s="{style}"' if style else ""
+    text = str(value)
+    if isinstance(value, str):
+        text = _safe_text(text)
+    text = escape(_XML_INVALID.sub("", text))
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values, kinds, style=None):
+    cells = "".join(_xlsx_cell(value, kind, style) for value, kind in zip(values, kinds))
+    return f"<row>{cells}</row>"
+
+
+class _ZipStream:
+    """
+    Destino não posicionável para o zipfile: guarda o que é escrito até o
+    gerador o entregar (o zipfile usa então data descriptors, sem seek()).
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_xlsx(export, rows_per_flush=500):
+    """
+    Gerador de XLSX: a folha é escrita directamente no zip, linha a linha,
+    com texto inline (sem tabela de strings partilhadas), e os bytes
+    comprimidos são entregues a cada `rows_per_flush` linhas.
+    """
+    output = _ZipStream()
+    kinds = export.kinds
+    text_kinds = [TEXT] * len(kinds)
+
+    with zipfile.ZipFile(output, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES_XML)
+        archive.writestr("_rels/.rels", _ROOT_RELS_XML)
+        archive.writestr("xl/workbook.xml", _workbook_xml(export.params.title))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS_XML)
+        archive.writestr("xl/styles.xml", _STYLES_XML)
+        yield output.drain()
+
+        with archive.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                b'<sheetViews><sheetView workbookViewId="0">'
+                b'<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+                b"</sheetView></sheetViews><sheetData>"
+            )
+            sheet.write(_xlsx_row(export.headers, text_kinds, _STYLE_HEADER).encode())
+
+            for count, row in enumerate(export.rows(), start=1):
+                sheet.write(_xlsx_row(row, kinds).encode())
+                if count % rows_per_flush == 0:
+                    yield output.drain()
+
+            sheet.write(b"<row/>")
+            for row in export.total_rows():
+                cells = "".join(
+                    _xlsx_cell(value, MONEY if i else TEXT, _STYLE_HEADER)
+                    for i, value in enumerate(row)
+                )
+                sheet.write(f"<row>{cells}</row>".encode())
+            sheet.write(b"</sheetData></worksheet>")
+
+    yield output.drain()
+
+
+#=============================================================================
+#=============================================================================
+
+
+def export_filename(params, fmt):
+    return f"{params.report_type}_{params.start_date}_{params.end_date}.{EXPORT_FORMATS[fmt][1]}"
+
+
+def stream_report(params, fmt):
+    """
+    (gerador, content_type) da exportação de `params` no formato `fmt`
+    ("csv" ou "xlsx").
+    """
+    export = ReportExport(params)
+    content_type = EXPORT_FORMATS[fmt][0]
+    if fmt == "csv":
+        return stream_csv(export), content_type
+    return stream_xlsx(export), content_type
@@ -0,0 +1,208 @@
+# core/services/report_jobs.py
+
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import ReportJob
+from core.services.report_cache import cache_seconds, cached_report_context, report_cache_key
+from core.services.report_prerender import find_prerendered
+from core.services.reports import ReportError, ReportParams, render_report_pdf
+
+
+# Tentativas por pedido (um worker que morre a meio devolve o pedido à fila)
+MAX_ATTEMPTS = 3
+
+
+#=============================================================================
+#=============================================================================
+
+
+def cached_report_job(cache_key, user=None):
+    """
+    Pedido concluído do mesmo utilizador, ainda válido, com a mesma chave de
+    cache e com o PDF ainda no storage; None se não houver. O PDF leva o
+    nome de quem o pediu e a hora da geração, por isso não é partilhado
+    entre utilizadores (o contexto é — ver cached_report_context).
+    """
+    cutoff = timezone.now() - timedelta(seconds=cache_seconds())
+    job = (
+        ReportJob.objects
+        .filter(cache_key=cache_key, requested_by=user, status=ReportJob.STATUS_DONE, finished_at__gte=cutoff)
+        .exclude(file="")
+        .exclude(file__isnull=True)
+        .order_by("-id")
+        .first()
+    )
+    if job is None or not job.file.storage.exists(job.file.name):
+        return None
+    return job
+
+
+def _served_job(params, params_hash, cache_key, file_name, file_size, user):
+    """
+    Pedido criado já concluído, a apontar para um PDF existente.
+    """
+    now = timezone.now()
+    return ReportJob.objects.create(
+        report_type=params.report_type,
+        params=params.to_dict(),
+        params_hash=params_hash,
+        cache_key=cache_key,
+        from_cache=True,
+        status=ReportJob.STATUS_DONE,
+        file=file_name,
+        file_size=file_size,
+        duration_ms=0,
+        requested_by=user,
+        created_at=now,
+        started_at=now,
+        finished_at=now,
+    )
+
+
+def enqueue_report(params, user=None):
+    """
+    Põe um relatório na fila e devolve (job, criado).
+
+    - Se já houver um pedido igual (mesmos parâmetros e utilizador) em fila
+      ou a correr, devolve esse — duplo clique e pedidos repetidos não geram
+      trabalho a dobrar.
+    - Se houver um PDF de fim de mês pré-gerado para estes parâmetros (sem
+      nome de utilizador), ou um relatório com os mesmos parâmetros e a
+      mesma marca d'água dos dados já gerado para o mesmo utilizador, é
+      criado um pedido já concluído que aponta para esse PDF — sem fila nem
+      nova geração.
+    """
+    params_hash = params.digest(user.pk if user else None)
+
+    existing = ReportJob.objects.filter(inflight_key=params_hash).first()
+    if existing is not None:
+        return existing, False
+
+    cache_key = report_cache_key(params)
+    served = find_prerendered(params, cache_key) or cached_report_job(cache_key, user)
+    if served is not None:
+        job = _served_job(params, params_hash, cache_key, served.file.name, served.file_size, user)
+        return job, True
+
+    try:
+        with db_transaction.atomic():
+            job = ReportJob.objects.create(
+                report_type=params.report_type,
+                params=params.to_dict(),
+                params_hash=params_hash,
+                inflight_key=params_hash,
+                cache_key=cache_key,
+                status=ReportJob.STATUS_QUEUED,
+                requested_by=user,
+                created_at=timezone.now(),
+            )
+    except IntegrityError:
+        # outro pedido igual entrou entre a leitura e o INSERT
+        existing = ReportJob.objects.filter(inflight_key=params_hash).first()
+        if existing is None:
+            raise
+        return existing, False
+    return job, True
+
+
+def claim_jobs(limit):
+    """
+    Reserva até `limit` pedidos em fila (mais antigos primeiro).
+    Cada pedido é reservado com um UPDATE condicional, por isso vários
+    workers podem correr em paralelo sem apanharem o mesmo pedido.
+    Devolve a lista de ids reservados.
+    """
+    if limit <= 0:
+        return []
+
+    candidates = list(
+        ReportJob.objects.filter(status=ReportJob.STATUS_QUEUED)
+        .order_by("id")
+        .values_list("id", flat=True)[: limit * 2]
+    )
+    claimed = []
+    for job_id in candidates:
+        updated = ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_QUEUED).update(
+            status=ReportJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+        if updated:
+            claimed.append(job_id)
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def requeue_stale_jobs(older_than=timedelta(minutes=30)):
+    """
+    Pedidos "a gerar" há mais de `older_than` (worker morto a meio):
+    voltam à fila, ou falham se já esgotaram as tentativas.
+    Devolve o número de pedidos tratados.
+    """
+    cutoff = timezone.now() - older_than
+    stale = ReportJob.objects.filter(status=ReportJob.STATUS_RUNNING, started_at__lt=cutoff)
+
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=ReportJob.STATUS_FAILED,
+        inflight_key=None,
+        error="Tempo de geração excedido.",
+        finished_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=MAX_ATTEMPTS).update(status=ReportJob.STATUS_QUEUED, started_at=None)
+    return failed + requeued
+
+
+def mark_failed(job_id, error):
+    ReportJob.objects.filter(pk=job_id).update(
+        status=ReportJob.STATUS_FAILED,
+        inflight_key=None,
+        error=str(error)[:2000],
+        finished_at=timezone.now(),
+    )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def run_report_job(job_id):
+    """
+    Gera o PDF de um pedido já reservado e grava-o no storage (MEDIA_ROOT).
+    Corre num processo do pool do worker. Devolve (job_id, status, erro).
+    """
+    job = ReportJob.objects.select_related("requested_by").get(pk=job_id)
+    start = time.perf_counter()
+
+    try:
+        params = ReportParams.from_dict(job.params)
+        # chave recalculada: os dados podem ter mudado desde o pedido
+        cache_key = report_cache_key(params)
+        context = cached_report_context(params, generated_by=job.requested_by, key=cache_key)
+        pdf_bytes = render_report_pdf(params, context=context)
+        job.file.save(params.filename, ContentFile(pdf_bytes), save=False)
+    except ReportError as exc:
+        # relatório recusado (ex.: acima de REPORT_PDF_MAX_ROWS): mensagem para o utilizador
+        mark_failed(job_id, exc)
+        return job_id, ReportJob.STATUS_FAILED, str(exc)
+    except Exception as exc:
+        mark_failed(job_id, f"{type(exc).__name__}: {exc}")
+        return job_id, ReportJob.STATUS_FAILED, str(exc)
+
+    ReportJob.objects.filter(pk=job_id).update(
+        status=ReportJob.STATUS_DONE,
+        inflight_key=None,
+        cache_key=cache_key,
+        file=job.file.name,
+        file_size=len(pdf_bytes),
+        error=None,
+        duration_ms=int((time.perf_counter() - start) * 1000),
+        finished_at=timezone.now(),
+    )
+    return job_id, ReportJob.STATUS_DONE, None
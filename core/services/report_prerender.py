@@ -0,0 +1,120 @@
+# core/services/report_prerender.py
+
+import calendar
+import time
+from datetime import date, timedelta
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from core.models import CompanyAccount, PrerenderedReport
+from core.services.report_cache import report_cache_key
+from core.services.reports import (
+    REPORT_LABELS,
+    ReportParams,
+    build_report_context,
+    render_report_pdf,
+)
+
+
+# Relatórios sem filtro de conta (o snapshot de saldos mostra sempre todas as contas)
+GLOBAL_ONLY_REPORTS = {"balances"}
+
+
+#=============================================================================
+#=============================================================================
+
+
+def month_period(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def previous_month(today=None):
+    """
+    (ano, mês) do mês acabado de fechar.
+    """
+    last_day = (today or timezone.localdate()).replace(day=1) - timedelta(days=1)
+    return last_day.year, last_day.month
+
+
+def month_end_params(year, month, report_types=None, per_account=True):
+    """
+    Conjunto padrão de fim de mês: cada tipo de relatório para todas as
+    contas e, quando aplicável, para cada conta da empresa activa.
+    """
+    start_date, end_date = month_period(year, month)
+    account_ids = [None]
+    if per_account:
+        account_ids += list(
+            CompanyAccount.objects.filter(is_active=True).order_by("id").values_list("id", flat=True)
+        )
+
+    for report_type in report_types or list(REPORT_LABELS):
+        for account_id in account_ids:
+            if account_id and report_type in GLOBAL_ONLY_REPORTS:
+                continue
+            yield ReportParams(
+                report_type=report_type,
+                start_date=start_date,
+                end_date=end_date,
+                company_account_id=account_id,
+            )
+
+
+def is_month_period(params):
+    """
+    Só pedidos de um mês civil completo, sem filtro de membro/utilizador,
+    podem corresponder a um PDF pré-gerado.
+    """
+    if params.member_id or params.user_id or params.start_date.day != 1:
+        return False
+    return (params.start_date, params.end_date) == month_period(params.start_date.year, params.start_date.month)
+
+
+def find_prerendered(params, cache_key=None):
+    """
+    PDF pré-gerado para exactamente estes parâmetros, ainda válido (mesma
+    marca d'água dos dados e ficheiro presente); None se não houver.
+    """
+    if not is_month_period(params):
+        return None
+
+    report = PrerenderedReport.objects.filter(params_hash=params.digest()).first()
+    if report is None:
+        return None
+    if report.cache_key != (cache_key or report_cache_key(params)):
+        return None
+    if not report.file or not report.file.storage.exists(report.file.name):
+        return None
+    return report
+
+
+def prerender_report(params, force=False):
+    """
+    Gera (ou mantém) o PDF pré-gerado de `params`.
+    Devolve (PrerenderedReport, gerado agora?).
+    """
+    cache_key = report_cache_key(params)
+    if not force:
+        existing = find_prerendered(params, cache_key)
+        if existing is not None:
+            return existing, False
+
+    start = time.perf_counter()
+    pdf_bytes = render_report_pdf(params, context=build_report_context(params))
+
+    report = PrerenderedReport.objects.filter(params_hash=params.digest()).first() or PrerenderedReport(
+        report_type=params.report_type,
+        period_start=params.start_date,
+        period_end=params.end_date,
+        company_account_id=params.company_account_id,
+        params_hash=params.digest(),
+    )
+    # o ficheiro anterior não é apagado: pedidos já servidos podem apontar para ele
+    report.file.save(params.filename, ContentFile(pdf_bytes), save=False)
+    report.cache_key = cache_key
+    report.file_size = len(pdf_bytes)
+    report.duration_ms = int((time.perf_counter() - start) * 1000)
+    report.generated_at = timezone.now()
+    report.save()
+    return report, True
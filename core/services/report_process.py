@@ -0,0 +1,34 @@
+# core/services/report_process.py
+#
+# Pontos de entrada dos processos do pool de `run_report_worker`.
+# Os processos arrancam com "spawn" (sem herdar ligações à base de dados do
+# pai), por isso este módulo não pode importar modelos ao nível do módulo:
+# o Django só fica configurado em `init_process`.
+
+
+def init_process():
+    import django
+
+    django.setup()
+
+    # renderer pronto (CSS processado, fontes carregadas) antes do primeiro pedido
+    from core.services.pdf import get_renderer
+
+    get_renderer().warm_up()
+
+
+def run_job(job_id):
+    """
+    (job_id, estado, erro, métricas do renderer deste processo).
+    """
+    from django.db import close_old_connections
+
+    from core.services.pdf import render_stats
+    from core.services.report_jobs import run_report_job
+
+    # o processo vive entre pedidos: descartar ligações expiradas (MySQL "gone away")
+    close_old_connections()
+    try:
+        return (*run_report_job(job_id), render_stats())
+    finally:
+        close_old_connections()
@@ -0,0 +1,505 @@
+# core/services/reports.py
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+
+from core.models import (
+    Member,
+    CompanyAccount,
+    Income,
+    Expense,
+    Loan,
+    LoanDisbursement,
+    LoanRepayment,
+    Transaction,
+    VehicleLeasePayment,
+)
+from core.services.amortization import expected_interest_total
+from core.services.money import MONEY_FIELD
+from core.services.lease_schedule import lease_schedule_queryset
+from core.services.pdf import html_to_pdf
+from core.services.pnl import pnl_pivot, pnl_tables
+from core.services.posting import annotate_live_balance
+from core.services.report_chunks import iter_keyset, render_chunked_pdf
+
+
+REPORT_LABELS = {
+    "incomes": "Rendimentos",
+    "expenses": "Despesas",
+    "balances": "Saldos por Conta",
+    "loans": "Empréstimos",
+    "disbursements": "Desembolsos",
+    "repayments": "Reembolsos",
+    "transactions": "Transacções",
+    "lease_arrears": "Leasing · Rendas em Atraso",
+    "profits": "Lucros (Receitas - Despesas)",
+}
+
+
+# Colunas do utilizador usadas no PDF ("Registado por")
+CREATED_BY_FIELDS = ("created_by__first_name", "created_by__last_name", "created_by__username")
+
+# Totais de cada relatório: {fonte: {nome no contexto: (campo, condição)}}.
+# Uma agregação por fonte (tabela), com todos os totais dessa fonte.
+REPORT_TOTALS = {
+    "incomes": {"rows": {"total_amount": ("amount", None)}},
+    "expenses": {"rows": {"total_amount": ("amount", None)}},
+    "balances": {},
+    "loans": {"rows": {"total_principal": ("principal_amount", None)}},
+    "disbursements": {"rows": {"total_amount": ("amount", None)}},
+    "repayments": {
+        "rows": {
+            "total_amount": ("amount", None),
+            "total_interest": ("interest_amount", None),
+            "total_principal": ("principal_amount", None),
+        }
+    },
+    "transactions": {
+        "rows": {
+            "total_in": ("amount", Q(tx_type=Transaction.TX_TYPE_IN)),
+            "total_out": ("amount", Q(tx_type=Transaction.TX_TYPE_OUT)),
+        }
+    },
+    "lease_arrears": {
+        "rows": {
+            "total_expected": ("lease_expected", None),
+            "total_received": ("lease_received", None),
+            "total_arrears": ("lease_arrears", None),
+        }
+    },
+    "profits": {
+        "incomes": {"total_incomes": ("amount", None)},
+        "expenses": {"total_expenses": ("amount", None)},
+    },
+}
+
+
+# Ordem das linhas (e chave da leitura por blocos) de cada relatório
+REPORT_ORDER_FIELDS = {
+    "incomes": "income_date",
+    "expenses": "expense_date",
+    "loans": "created_at",
+    "disbursements": "disburse_date",
+    "repayments": "payment_date",
+    "transactions": "tx_date",
+    "lease_arrears": "start_date",
+}
+
+# Totais transportados entre blocos nos PDFs gerados por partes
+# (ver services/report_chunks.py): [(rótulo, função(linha) -> valor)]
+REPORT_CARRY_TOTALS = {
+    "incomes": [("Total", lambda r: r.amount)],
+    "expenses": [("Total", lambda r: r.amount)],
+    "loans": [("Total Principal", lambda r: r.principal_amount)],
+    "disbursements": [("Total", lambda r: r.amount)],
+    "repayments": [
+        ("Total", lambda r: r.amount),
+        ("Juros", lambda r: r.interest_amount),
+        ("Principal", lambda r: r.principal_amount),
+    ],
+    "transactions": [
+        ("Entradas", lambda r: r.amount if r.tx_type == Transaction.TX_TYPE_IN else 0),
+        ("Saídas", lambda r: r.amount if r.tx_type == Transaction.TX_TYPE_OUT else 0),
+    ],
+    "lease_arrears": [
+        ("Esperado", lambda r: r.lease_expected),
+        ("Recebido", lambda r: r.lease_received),
+        ("Em atraso", lambda r: r.lease_arrears),
+    ],
+}
+
+
+#=============================================================================
+#=============================================================================
+
+
+class ReportError(ValueError):
+    """
+    Parâmetros de relatório inválidos (tipo, datas ou filtros).
+    """
+
+
+@dataclass(frozen=True)
+class ReportParams:
+    """
+    Parâmetros de um relatório, já validados e com as datas resolvidas
+    (o mesmo pedido feito em dias diferentes dá parâmetros diferentes).
+    """
+
+    report_type: str
+    start_date: date
+    end_date: date
+    member_id: int = None
+    user_id: int = None
+    company_account_id: int = None
+
+    @property
+    def title(self):
+        return REPORT_LABELS.get(self.report_type, "Relatório")
+
+    @property
+    def filename(self):
+        return f"{self.report_type}_{self.start_date}_{self.end_date}.pdf"
+
+    def to_dict(self):
+        data = asdict(self)
+        data["start_date"] = self.start_date.isoformat()
+        data["end_date"] = self.end_date.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            report_type=data["report_type"],
+            start_date=date.fromisoformat(data["start_date"]),
+            end_date=date.fromisoformat(data["end_date"]),
+            member_id=data.get("member_id"),
+            user_id=data.get("user_id"),
+            company_account_id=data.get("company_account_id"),
+        )
+
+    def digest(self, *extra):
+        """
+        Hash estável dos parâmetros (mais `extra`), para identificar pedidos iguais.
+        """
+        payload = json.dumps([self.to_dict(), *extra], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _parse_date(value, default, label):
+    value = (value or "").strip()
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ReportError(f"{label} inválida.")
+
+
+def _parse_id(model, value, label):
+    value = (value or "").strip() if isinstance(value, str) else value
+    if not value:
+        return None
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        raise ReportError(f"{label} inválido.")
+    if not model.objects.filter(pk=pk).exists():
+        raise ReportError(f"{label} não encontrado.")
+    return pk
+
+
+def parse_report_params(data, today=None):
+    """
+    Valida os campos do formulário de relatórios (report_type, start_date,
+    end_date, member, user, company_account). Lança ReportError.
+    """
+    report_type = (data.get("report_type") or "").strip()
+    if not report_type:
+        raise ReportError("Tipo de relatório é obrigatório.")
+    if report_type not in REPORT_LABELS:
+        raise ReportError("Tipo de relatório desconhecido.")
+
+    today = today or date.today()
+    start_date = _parse_date(data.get("start_date"), today.replace(day=1), "Data inicial")
+    end_date = _parse_date(data.get("end_date"), today, "Data final")
+
+    return ReportParams(
+        report_type=report_type,
+        start_date=start_date,
+        end_date=end_date,
+        member_id=_parse_id(Member, data.get("member"), "Membro"),
+        user_id=_parse_id(User, data.get("user"), "Utilizador"),
+        company_account_id=_parse_id(CompanyAccount, data.get("company_account"), "Conta da empresa"),
+    )
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _filter_objects(params):
+    member_obj = Member.objects.filter(pk=params.member_id).first() if params.member_id else None
+    user_obj = User.objects.filter(pk=params.user_id).first() if params.user_id else None
+    account_obj = (
+        CompanyAccount.objects.filter(pk=params.company_account_id).first()
+        if params.company_account_id
+        else None
+    )
+    return member_obj, user_obj, account_obj
+
+
+def report_querysets(params):
+    """
+    Querysets de origem de um relatório, já com o período e os filtros:
+    {"rows": qs} na maioria dos relatórios, {"accounts": qs} nos saldos,
+    {"incomes", "expenses", "loan_interest", "lease_revenue"} nos lucros
+    (as duas últimas só entram no P&L mensal e na marca d'água) e, nas
+    rendas de leasing, também "lease_payments" (só para a marca d'água).
+    Usados para montar o contexto e para a marca d'água da cache.
+    """
+    start_date, end_date = params.start_date, params.end_date
+    member_id, user_id, account_id = params.member_id, params.user_id, params.company_account_id
+    report_type = params.report_type
+
+    # 1) RENDIMENTOS
+    if report_type == "incomes":
+        qs = (
+            Income.objects
+            .select_related("category", "company_account", "created_by")
+            .only("income_date", "description", "amount", "category__name", "company_account__name", *CREATED_BY_FIELDS)
+            .filter(income_date__range=(start_date, end_date), is_active=True)
+        )
+        if account_id:
+            qs = qs.filter(company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk")}
+
+    # 2) DESPESAS
+    if report_type == "expenses":
+        qs = (
+            Expense.objects
+            .select_related("category", "company_account", "created_by")
+            .only("expense_date", "description", "amount", "category__name", "company_account__name", *CREATED_BY_FIELDS)
+            .filter(expense_date__range=(start_date, end_date), is_active=True)
+        )
+        if account_id:
+            qs = qs.filter(company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk")}
+
+    # 3) SALDOS – snapshot de todas as contas (saldo aplicado + pendente no diário)
+    if report_type == "balances":
+        return {
+            "accounts": annotate_live_balance(
+                CompanyAccount.objects
+                .only("name", "account_identifier", "balance")
+                .filter(is_active=True)
+                .order_by("name")
+            )
+        }
+
+    # 4) EMPRÉSTIMOS
+    if report_type == "loans":
+        qs = (
+            Loan.objects
+            .select_related("member", "loan_type", "created_by")
+            .only(
+                "principal_amount", "term_periods", "period_type", "status", "created_at",
+                "member__first_name", "member__last_name", "loan_type__name", *CREATED_BY_FIELDS,
+            )
+            .filter(created_at__date__range=(start_date, end_date))
+        )
+        if member_id:
+            qs = qs.filter(member_id=member_id)
+        if user_id:
+            qs = qs.filter(created_by_id=user_id)
+        if account_id:
+            qs = qs.filter(company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk")}
+
+    # 5) DESEMBOLSOS
+    if report_type == "disbursements":
+        qs = (
+            LoanDisbursement.objects
+            .select_related("member", "company_account")
+            .only(
+                "disburse_date", "amount", "method",
+                "member__first_name", "member__last_name", "company_account__name",
+            )
+            .filter(disburse_date__range=(start_date, end_date))
+        )
+        if member_id:
+            qs = qs.filter(member_id=member_id)
+        if account_id:
+            qs = qs.filter(company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk")}
+
+    # 6) REEMBOLSOS
+    if report_type == "repayments":
+        qs = (
+            LoanRepayment.objects
+            .select_related("member", "company_account")
+            .only(
+                "payment_date", "amount", "interest_amount", "principal_amount",
+                "member__first_name", "member__last_name", "company_account__name",
+            )
+            .filter(payment_date__range=(start_date, end_date))
+        )
+        if member_id:
+            qs = qs.filter(member_id=member_id)
+        if account_id:
+            qs = qs.filter(company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk")}
+
+    # 7) TRANSACÇÕES
+    if report_type == "transactions":
+        qs = (
+            Transaction.objects
+            .select_related("company_account", "created_by")
+            .only(
+                "tx_date", "tx_type", "description", "amount", "balance_before", "balance_after",
+                "company_account__name", *CREATED_BY_FIELDS,
+            )
+            .filter(tx_date__range=(start_date, end_date))
+        )
+        if account_id:
+            qs = qs.filter(company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk")}
+
+    # 8) LEASING · RENDAS EM ATRASO – contratos activos, à data final do período
+    if report_type == "lease_arrears":
+        qs = (
+            lease_schedule_queryset(end_date, company_account_id=account_id, driver_id=member_id)
+            .select_related("leased_vehicle", "driver")
+            .only(
+                "start_date", "end_date", "weekly_rent", "payment_weekday",
+                "leased_vehicle__plate_number", "driver__first_name", "driver__last_name",
+            )
+            .filter(start_date__lte=end_date)
+        )
+        payments_qs = VehicleLeasePayment.objects.filter(contract__status="active", payment_date__lte=end_date)
+        if user_id:
+            qs = qs.filter(created_by_id=user_id)
+        if member_id:
+            payments_qs = payments_qs.filter(driver_id=member_id)
+        if account_id:
+            payments_qs = payments_qs.filter(contract__company_account_id=account_id)
+        return {"rows": qs.order_by(REPORT_ORDER_FIELDS[report_type], "pk"), "lease_payments": payments_qs}
+
+    # 9) LUCROS = Receitas (rendimentos, juros, leasing) - Despesas
+    if report_type == "profits":
+        incomes_qs = Income.objects.filter(
+            income_date__range=(start_date, end_date),
+            is_active=True,
+        )
+        expenses_qs = Expense.objects.filter(
+            expense_date__range=(start_date, end_date),
+            is_active=True,
+        )
+        interest_qs = LoanRepayment.objects.filter(payment_date__range=(start_date, end_date))
+        lease_qs = VehicleLeasePayment.objects.filter(payment_date__range=(start_date, end_date))
+        if account_id:
+            incomes_qs = incomes_qs.filter(company_account_id=account_id)
+            expenses_qs = expenses_qs.filter(company_account_id=account_id)
+            interest_qs = interest_qs.filter(company_account_id=account_id)
+            lease_qs = lease_qs.filter(company_account_id=account_id)
+        return {
+            "incomes": incomes_qs,
+            "expenses": expenses_qs,
+            "loan_interest": interest_qs,
+            "lease_revenue": lease_qs,
+        }
+
+    raise ReportError("Tipo de relatório desconhecido.")
+
+
+def report_totals(params, querysets=None):
+    """
+    Todos os totais de um relatório (REPORT_TOTALS) — uma única agregação
+    condicional por fonte, em vez de um aggregate() por total. Inclui o
+    líquido das transacções (o resultado dos lucros vem do P&L).
+    """
+    if querysets is None:
+        querysets = report_querysets(params)
+
+    totals = {}
+    for source, columns in REPORT_TOTALS[params.report_type].items():
+        totals.update(
+            querysets[source].order_by().aggregate(**{
+                name: Coalesce(Sum(field, filter=condition), Decimal("0"), output_field=MONEY_FIELD)
+                for name, (field, condition) in columns.items()
+            })
+        )
+
+    if params.report_type == "transactions":
+        totals["net"] = totals["total_in"] - totals["total_out"]
+    return totals
+
+
+def build_report_context(params, generated_by=None):
+    """
+    Contexto do template reports/report_pdf.html para `params`: as linhas
+    (só com as colunas usadas no template) e os totais de report_totals();
+    nos lucros, também o P&L mensal por categoria (services/pnl.py); nos
+    empréstimos, os juros previstos pelos quadros de amortização
+    (services/amortization.py, em lotes).
+    """
+    member_obj, user_obj, account_obj = _filter_objects(params)
+
+    context = {
+        "report_type": params.report_type,
+        "report_title": params.title,
+        "start_date": params.start_date,
+        "end_date": params.end_date,
+        "member": member_obj,
+        "user_obj": user_obj,
+        "account": account_obj,
+        "generated_by": generated_by,
+    }
+
+    querysets = report_querysets(params)
+    for name in ("rows", "accounts"):
+        if name in querysets:
+            context[name] = querysets[name]
+    context.update(report_totals(params, querysets))
+
+    if params.report_type == "profits":
+        pivot = pnl_pivot(params.start_date, params.end_date, params.company_account_id)
+        context["pnl"] = pivot
+        context["pnl_tables"] = pnl_tables(pivot)
+        # Um só resultado no PDF: o do P&L (com juros de empréstimos e leasing)
+        context["profit"] = pivot["total_net"]
+        context["profit_margin"] = (
+            pivot["total_net"] * 100 / pivot["total_revenue"] if pivot["total_revenue"] else None
+        )
+    elif params.report_type == "loans":
+        context["total_expected_interest"] = expected_interest_total(querysets["rows"])
+
+    return context
+
+
+def render_report_pdf(params, generated_by=None, context=None):
+    """
+    Gera o PDF de um relatório (bytes). `context` permite passar um contexto
+    já calculado (ver services/report_cache.py). Os ficheiros estáticos
+    (logótipo) são lidos do disco pelo renderer, sem depender do host do pedido.
+
+    Relatórios com mais de REPORT_PDF_CHUNK_ROWS linhas são gerados por
+    blocos (services/report_chunks.py); acima de REPORT_PDF_MAX_ROWS lança
+    ReportError.
+    """
+    if context is None:
+        context = build_report_context(params, generated_by)
+
+    rows = context.get("rows")
+    if rows is not None:
+        total = len(rows) if isinstance(rows, list) else rows.count()
+        max_rows = getattr(settings, "REPORT_PDF_MAX_ROWS", 100000)
+        if total > max_rows:
+            raise ReportError(
+                f"O relatório tem {total} linhas (máximo {max_rows} em PDF). "
+                "Reduza o período ou use a exportação CSV/Excel."
+            )
+
+        chunk_rows = getattr(settings, "REPORT_PDF_CHUNK_ROWS", 1500)
+        if total > chunk_rows:
+            if not isinstance(rows, list):
+                rows = iter_keyset(rows, REPORT_ORDER_FIELDS[params.report_type], chunk_rows)
+            return render_chunked_pdf(
+                "reports/report_pdf.html",
+                context,
+                rows,
+                REPORT_CARRY_TOTALS[params.report_type],
+                chunk_rows,
+            )
+
+    html_string = render_to_string("reports/report_pdf.html", context)
+    return html_to_pdf(html_string)
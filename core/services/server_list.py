@@ -0,0 +1,164 @@
+# core/services/server_list.py
+
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+from core.services.datatables import datatables_response, keyset_page, parse_datatables_request
+
+
+#=============================================================================
+#=============================================================================
+
+
+class ServerSideList:
+    """
+    Lista server-side declarativa para tabelas DataTables.
+
+    Cada view declara:
+    - queryset: conjunto base (com select_related para o que a linha mostra);
+    - row_template: partial que desenha um <tr> — o mesmo usado pelo template
+      da página, para que o HTML das linhas não fique duplicado;
+    - search_fields: campos pesquisados com icontains (cada palavra da pesquisa
+      tem de aparecer em pelo menos um deles; números também procuram no id);
+    - order_fields: {índice da coluna: campo} das colunas ordenáveis;
+    - filters: {parâmetro GET: lookup} ou {parâmetro GET: função(qs, valor)}.
+
+    O componente trata da paginação (por chave quando há cursor, ver
+    `keyset_page`), pesquisa, contagens em cache e resposta JSON.
+    A página continua a ser servida pelo mesmo URL: pedidos com `draw`
+    (enviados pelo DataTables) recebem JSON.
+    """
+
+    def __init__(
+        self,
+        name,
+        queryset,
+        row_template,
+        row_name="row",
+        search_fields=(),
+        order_fields=None,
+        filters=None,
+        default_order=(0, "desc"),
+        count_cache_seconds=300,
+    ):
+        self.name = name
+        self.queryset = queryset
+        self.row_template = row_template
+        self.row_name = row_name
+        self.search_fields = tuple(search_fields)
+        self.order_fields = dict(order_fields or {0: "id"})
+        self.filters = dict(filters or {})
+        self.default_order = default_order
+        self.count_cache_seconds = count_cache_seconds
+
+    #-------------------------------------------------------------------------
+
+    @staticmethod
+    def wants_json(request):
+        return "draw" in request.GET
+
+    def js_options(self):
+        """
+        Configuração para `slServerList` (ver includes/sl_server_list_js.html).
+        """
+        return {
+            "order": [list(self.default_order)],
+            "orderable": sorted(self.order_fields),
+            # As contagens ficam em cache por carregamento da página: depois de
+            # gravar algo e recarregar, a tabela volta a contar.
+            "count_key": uuid.uuid4().hex[:12],
+        }
+
+    #-------------------------------------------------------------------------
+
+    def get_queryset(self, request):
+        return self.queryset.all()
+
+    def filter_queryset(self, queryset, params):
+        """
+        Aplica os filtros com valor no pedido. Um valor que o campo não
+        aceita (ex.: texto num filtro por id, data inválida) dá uma lista
+        vazia em vez de erro.
+        """
+        for param, lookup in self.filters.items():
+            value = params.get(param, "").strip()
+            if not value:
+                continue
+            try:
+                if callable(lookup):
+                    queryset = lookup(queryset, value)
+                else:
+                    queryset = queryset.filter(**{lookup: value})
+            except (ValueError, ValidationError):
+                return queryset.none()
+        return queryset
+
+    def search_queryset(self, queryset, search):
+        if not search or not self.search_fields:
+            return queryset
+        for term in search.split():
+            condition = Q()
+            for field in self.search_fields:
+                condition |= Q(**{f"{field}__icontains": term})
+            if term.isdigit():
+                condition |= Q(pk=int(term))
+            queryset = queryset.filter(condition)
+        return queryset
+
+    #-------------------------------------------------------------------------
+
+    def _cache_key(self, *parts):
+        digest = hashlib.md5(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+        return f"server_list:{self.name}:{digest}"
+
+    def _count(self, queryset, *key_parts):
+        """
+        COUNT(*) em cache: a contagem não muda ao folhear páginas nem ao
+        reordenar, e numa tabela grande é a query mais cara.
+        """
+        if not self.count_cache_seconds:
+            return queryset.count()
+        key = self._cache_key(*key_parts)
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_seconds)
+        return count
+
+    def render_row(self, request, obj, context):
+        return render_to_string(self.row_template, {self.row_name: obj, **context}, request=request)
+
+    #-------------------------------------------------------------------------
+
+    def response(self, request, **context):
+        """
+        Resposta JSON a um pedido server-side do DataTables.
+        `context` é passado ao template das linhas.
+        """
+        params = request.GET
+        dt = parse_datatables_request(params, *self.default_order)
+
+        base = self.get_queryset(request)
+        filter_values = {param: params.get(param, "").strip() for param in self.filters}
+        filtered = self.filter_queryset(base, params)
+        filtered = self.search_queryset(filtered, dt.search)
+
+        count_key = params.get("count_key", "")
+        records_total = self._count(base, count_key, "total")
+        if dt.search or any(filter_values.values()):
+            records_filtered = self._count(filtered, count_key, "filtered", filter_values, dt.search)
+        else:
+            records_filtered = records_total
+
+        order_field = self.order_fields.get(dt.order_column) or self.order_fields[self.default_order[0]]
+        rows, cursor = keyset_page(filtered, dt, order_field)
+
+        data = [self.render_row(request, obj, context) for obj in rows]
+        return JsonResponse(datatables_response(dt, records_total, records_filtered, data, cursor=cursor))
@@ -0,0 +1,313 @@
+# core/services/vehicle_profitability.py
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Case,
+    Count,
+    DateField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Max,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Ceil, Coalesce, Floor, Greatest
+from django.utils import timezone
+
+from core.models import LeasedVehicle, VehicleLeaseContract, VehicleLeasePayment, VehicleProfitability
+from core.services.money import MONEY_FIELD
+from core.services.lease_schedule import LEASE_WEEK_DAYS
+from core.services.loan_aging import DateDiff
+
+
+ZERO = Decimal("0")
+
+PROFITABILITY_FIELDS = [
+    "revenue_total",
+    "payments_count",
+    "last_payment_date",
+    "contracts_count",
+    "first_lease_date",
+    "closed_lease_days",
+    "active_since",
+    "active_weekly_rent",
+    "payback_date",
+    "updated_at",
+]
+
+# Estado de retorno de uma viatura: {valor: (rótulo, condição)}
+PAYBACK_STATES = {
+    "paid_back": ("Custo recuperado", Q(profitability__payback_date__isnull=False)),
+    "pending": ("Por recuperar", Q(acquisition_cost__gt=0, profitability__payback_date__isnull=True)),
+    "no_cost": ("Sem custo registado", Q(acquisition_cost__isnull=True) | Q(acquisition_cost=0)),
+}
+
+PERCENT_FIELD = DecimalField(max_digits=9, decimal_places=2)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def _contract_days(start, end):
+    return max((end - start).days + 1, 0)
+
+
+def rebuild_vehicle_profitability(vehicle_ids=None):
+    """
+    Recalcula as linhas de VehicleProfitability e grava-as com um upsert.
+    Sem `vehicle_ids`, processa a frota toda. Devolve o número de linhas.
+
+    Uma query agrupada por contrato sobre os pagamentos, uma aos contratos
+    e, só para as viaturas cujo custo já foi recuperado, os pagamentos
+    ordenados para encontrar a data em que a receita acumulada o atingiu.
+    """
+    vehicles = LeasedVehicle.objects.all()
+    if vehicle_ids is not None:
+        vehicles = vehicles.filter(pk__in=vehicle_ids)
+    costs = dict(vehicles.values_list("id", "acquisition_cost"))
+    if not costs:
+        return 0
+
+    paid = {
+        r["contract_id"]: r
+        for r in (
+            VehicleLeasePayment.objects
+            .filter(contract__leased_vehicle_id__in=list(costs))
+            .values("contract_id")
+            .annotate(total=Sum("amount"), n=Count("pk"), last=Max("payment_date"))
+            .order_by()
+        )
+    }
+    contracts = (
+        VehicleLeaseContract.objects
+        .filter(leased_vehicle_id__in=list(costs))
+        .values("id", "leased_vehicle_id", "start_date", "end_date", "status", "weekly_rent")
+    )
+
+    now = timezone.now()
+    rows = {
+        pk: VehicleProfitability(
+            vehicle_id=pk,
+            revenue_total=ZERO,
+            payments_count=0,
+            last_payment_date=None,
+            contracts_count=0,
+            first_lease_date=None,
+            closed_lease_days=0,
+            active_since=None,
+            active_weekly_rent=ZERO,
+            payback_date=None,
+            updated_at=now,
+        )
+        for pk in costs
+    }
+
+    for c in contracts:
+        row = rows[c["leased_vehicle_id"]]
+        payments = paid.get(c["id"])
+        row.contracts_count += 1
+        if row.first_lease_date is None or c["start_date"] < row.first_lease_date:
+            row.first_lease_date = c["start_date"]
+        if payments:
+            row.revenue_total += payments["total"] or ZERO
+            row.payments_count += payments["n"]
+            if row.last_payment_date is None or payments["last"] > row.last_payment_date:
+                row.last_payment_date = payments["last"]
+
+        if c["status"] == "active":
+            if row.active_since is None or c["start_date"] < row.active_since:
+                row.active_since = c["start_date"]
+            row.active_weekly_rent += c["weekly_rent"]
+        else:
+            # contrato terminado: até à data de fim ou, sem ela, ao último pagamento
+            end = c["end_date"] or (payments and payments["last"]) or c["start_date"]
+            row.closed_lease_days += _contract_days(c["start_date"], end)
+
+    reached = [pk for pk, row in rows.items() if costs[pk] and row.revenue_total >= costs[pk]]
+    if reached:
+        running = {}
+        payments = (
+            VehicleLeasePayment.objects
+            .filter(contract__leased_vehicle_id__in=reached)
+            .values_list("contract__leased_vehicle_id", "payment_date", "amount")
+            .order_by("contract__leased_vehicle_id", "payment_date", "pk")
+        )
+        for vehicle_id, payment_date, amount in payments:
+            row = rows[vehicle_id]
+            if row.payback_date is not None:
+                continue
+            running[vehicle_id] = running.get(vehicle_id, ZERO) + amount
+            if running[vehicle_id] >= costs[vehicle_id]:
+                row.payback_date = payment_date
+
+    VehicleProfitability.objects.bulk_create(
+        list(rows.values()),
+        batch_size=1000,
+        update_conflicts=True,
+        update_fields=PROFITABILITY_FIELDS,
+    )
+    return len(rows)
+
+
+def record_vehicle_revenue(contract, payment):
+    """
+    Soma incrementalmente um pagamento novo à rentabilidade da viatura do
+    contrato. Chamar depois de gravar o VehicleLeasePayment, dentro da mesma
+    transacção.
+    """
+    record_vehicle_revenues([(contract, payment)])
+
+
+def record_vehicle_revenues(payments):
+    """
+    Versão em lote de record_vehicle_revenue(): `payments` = [(contrato,
+    pagamento)]. Bloqueia as linhas das viaturas de uma vez e grava com um
+    bulk_update.
+
+    Se a linha de uma viatura ainda não existe, ou um pagamento é anterior
+    ao último já contado (a data de retorno pode mudar), recalcula a linha
+    dessa viatura.
+    """
+    rows = VehicleProfitability.objects.select_for_update().in_bulk(
+        {contract.leased_vehicle_id for contract, _ in payments}
+    )
+
+    now = timezone.now()
+    changed = {}
+    rebuild = set()
+    for contract, payment in sorted(payments, key=lambda pair: pair[1].payment_date):
+        vehicle_id = contract.leased_vehicle_id
+        row = rows.get(vehicle_id)
+        if vehicle_id in rebuild or row is None or (
+            row.last_payment_date is not None and payment.payment_date < row.last_payment_date
+        ):
+            rebuild.add(vehicle_id)
+            continue
+
+        row.revenue_total += payment.amount
+        row.payments_count += 1
+        row.last_payment_date = payment.payment_date
+        cost = contract.leased_vehicle.acquisition_cost
+        if row.payback_date is None and cost and row.revenue_total >= cost:
+            row.payback_date = payment.payment_date
+        row.updated_at = now
+        changed[vehicle_id] = row
+
+    VehicleProfitability.objects.bulk_update(
+        [row for vehicle_id, row in changed.items() if vehicle_id not in rebuild],
+        PROFITABILITY_FIELDS,
+        batch_size=1000,
+    )
+    if rebuild:
+        rebuild_vehicle_profitability(rebuild)
+
+
+#=============================================================================
+#=============================================================================
+
+
+def annotate_profitability(queryset, today=None):
+    """
+    Acrescenta a um queryset de LeasedVehicle (LEFT JOIN a
+    sl_vehicle_profitability, sem tocar nos pagamentos):
+    - vp_revenue / vp_payback_date: receita acumulada e data de retorno;
+    - vp_payback_pct: receita / custo de aquisição, em % (None sem custo);
+    - vp_leased_weeks / vp_idle_weeks: semanas em leasing e paradas desde o
+      1º contrato até `today`;
+    - vp_remaining: custo ainda por recuperar;
+    - vp_weeks_to_payback: semanas até recuperar o custo ao ritmo das rendas
+      dos contratos activos (0 se já recuperado, None sem contrato activo).
+
+    O custo por linha não depende do histórico de pagamentos.
+    """
+    today = today or timezone.localdate()
+    day = Value(today, output_field=DateField())
+    week = Value(LEASE_WEEK_DAYS)
+    p = "profitability__"
+
+    return (
+        queryset
+        .annotate(
+            vp_revenue=Coalesce(F(f"{p}revenue_total"), Value(ZERO), output_field=MONEY_FIELD),
+            vp_payback_date=F(f"{p}payback_date"),
+            vp_leased_days=ExpressionWrapper(
+                Coalesce(F(f"{p}closed_lease_days"), Value(0))
+                + Case(
+                    When(**{f"{p}active_since__isnull": False}, then=DateDiff(day, F(f"{p}active_since")) + 1),
+                    default=Value(0),
+                ),
+                output_field=IntegerField(),
+            ),
+        )
+        .annotate(
+            vp_payback_pct=Case(
+                When(acquisition_cost__gt=0, then=F("vp_revenue") * 100 / F("acquisition_cost")),
+                default=None,
+                output_field=PERCENT_FIELD,
+            ),
+            vp_remaining=Greatest(F("acquisition_cost") - F("vp_revenue"), Value(ZERO), output_field=MONEY_FIELD),
+            vp_leased_weeks=Floor(F("vp_leased_days") / week, output_field=IntegerField()),
+            vp_idle_weeks=Floor(
+                Greatest(DateDiff(day, F(f"{p}first_lease_date")) + 1 - F("vp_leased_days"), Value(0)) / week,
+                output_field=IntegerField(),
+            ),
+        )
+        .annotate(
+            vp_weeks_to_payback=Case(
+                When(vp_remaining=0, then=Value(0)),
+                When(
+                    **{f"{p}active_weekly_rent__gt": 0},
+                    then=Ceil(F("vp_remaining") / F(f"{p}active_weekly_rent")),
+                ),
+                default=None,
+                output_field=IntegerField(),
+            ),
+        )
+    )
+
+
+def projected_payback_date(vehicle, today=None):
+    """
+    Data prevista de recuperação do custo de uma viatura anotada com
+    annotate_profitability(): a data de retorno, se já aconteceu, ou hoje
+    mais as semanas que faltam.
+    """
+    if vehicle.vp_payback_date:
+        return vehicle.vp_payback_date
+    if vehicle.vp_weeks_to_payback is None:
+        return None
+    return (today or timezone.localdate()) + timedelta(days=LEASE_WEEK_DAYS * vehicle.vp_weeks_to_payback)
+
+
+def filter_payback_state(queryset, state):
+    if state not in PAYBACK_STATES:
+        return queryset
+    return queryset.filter(PAYBACK_STATES[state][1])
+
+
+def fleet_profitability():
+    """
+    Totais da frota a partir do agregado (uma query, independente do número
+    de pagamentos): custo, receita acumulada, % recuperado (só viaturas com
+    custo registado) e viaturas com o custo recuperado.
+    """
+    def money(field, **extra):
+        return Coalesce(Sum(field, **extra), Value(ZERO), output_field=MONEY_FIELD)
+
+    row = LeasedVehicle.objects.aggregate(
+        vehicles=Count("pk"),
+        cost=money("acquisition_cost"),
+        revenue=money("profitability__revenue_total"),
+        revenue_costed=money("profitability__revenue_total", filter=Q(acquisition_cost__gt=0)),
+        paid_back=Count("pk", filter=PAYBACK_STATES["paid_back"][1]),
+        weekly_rent=money("profitability__active_weekly_rent"),
+    )
+    row["payback_pct"] = (row["revenue_costed"] * 100 / row["cost"]).quantize(Decimal("0.01")) if row["cost"] else None
+    return row
@@ -0,0 +1,15 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class CoreTestRunner(DiscoverRunner):
+    """
+    O esquema da base não vem das migrações (modelos managed=False; as
+    migrações do core só acrescentam tabelas/índices ao esquema existente):
+    na base de testes não correm e core/tests.py cria as tabelas a partir dos
+    modelos.
+    """
+
+    def setup_databases(self, **kwargs):
+        with override_settings(MIGRATION_MODULES={"core": None}):
+            return super().setup_databases(**kwargs)
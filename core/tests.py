@@ -1,3 +1,1082 @@
-from django.test import TestCase
+import io
+import re
+import tempfile
+import threading
+import tracemalloc
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import patch
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.template.defaultfilters import floatformat
+from django.template.loader import render_to_string
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfWriter
+
+from core.models import (
+    AccountType,
+    CompanyAccount,
+    Expense,
+    ExpenseCategory,
+    Income,
+    IncomeCategory,
+    InterestType,
+    LeasedVehicle,
+    Loan,
+    LoanBalance,
+    LoanDisbursement,
+    LoanRepayment,
+    Member,
+    PnlMonthly,
+    PrerenderedReport,
+    ReportJob,
+    Transaction,
+    VehicleLeaseAllocation,
+    VehicleLeaseContract,
+    VehicleLeaseCoverage,
+    VehicleLeasePayment,
+)
+from core.services.amortization import (
+    MAX_PERIODS,
+    METHOD_DAILY,
+    METHOD_FLAT,
+    METHOD_REDUCING,
+    SCHEDULE_BATCH_SIZE,
+    LoanTerms,
+    ScheduleError,
+    build_schedule,
+    build_schedules,
+)
+from core.services.dashboard_metrics import compute_dashboard_kpis
+from core.services.lease_allocation import open_lease_coverage, record_lease_payments, split_payment
+from core.services.lease_collection import post_lease_collection
+from core.services.leasing_kpis import invalidate_leasing_kpis
+from core.services.loan_aging import portfolio_aging
+from core.services.loan_balances import rebuild_loan_balances
+from core.services.pdf import RenderStats
+from core.services.pnl import PNL_MAX_QUERIES, apply_pnl_delta, pnl_pivot, rebuild_pnl_rollup
+from core.services.posting import apply_journal, company_accounts_balance, post_transaction, post_transactions
+from core.services.repayment_import import import_repayments
+from core.services.report_cache import report_watermark
+from core.services.report_chunks import render_chunked_pdf
+from core.services.report_export import MONEY, TEXT, ReportExport, stream_csv, stream_xlsx
+from core.services.report_jobs import enqueue_report
+from core.services.report_prerender import month_end_params
+from core.services.reports import (
+    REPORT_CARRY_TOTALS,
+    REPORT_LABELS,
+    REPORT_TOTALS,
+    ReportParams,
+    build_report_context,
+    report_querysets,
+)
+from core.views.leasing.leasing import leased_vehicle_list
+from core.views.leasing.leasing_contracts import vehicle_lease_contract_list
+from core.views.leasing.vehicle_lease_payments import vehicle_lease_payment_list
+
+
+def create_unmanaged_tables():
+    """
+    Cria na base de testes as tabelas dos modelos managed=False do core que
+    ainda não existem (o esquema real não vem das migrações).
+    """
+    existing = set(connection.introspection.table_names())
+    models = [
+        model
+        for model in apps.get_app_config("core").get_models()
+        if not model._meta.managed and model._meta.db_table not in existing
+    ]
+    with connection.schema_editor() as editor:
+        for model in models:
+            editor.create_model(model)
+
+
+class CoreTestCase(TestCase):
+    """
+    Base dos testes do core: tabelas dos modelos managed=False e dados
+    mínimos (utilizador, membro, conta da empresa, tipo de juro).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # antes do atomic() da classe: DDL no MySQL faz commit implícito
+        create_unmanaged_tables()
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = date(2025, 3, 17)
+        cls.user = User.objects.create_user("gestor", password="x", is_superuser=True, is_staff=True)
+        cls.member = Member.objects.create(first_name="Ana", last_name="Bila", phone="840000000", manager=cls.user)
+        account_type = AccountType.objects.create(category="bank", name="Banco")
+        cls.account = CompanyAccount.objects.create(
+            account_type=account_type, name="Conta BCI", account_identifier="0001", balance=Decimal("10000")
+        )
+        cls.interest_type = InterestType.objects.create(name="Mensal 10%", rate=Decimal("10"), period_type="monthly")
+
+    @classmethod
+    def make_loan(cls, principal="1000", status="disbursed", **extra):
+        return Loan.objects.create(
+            member=cls.member,
+            interest_type=cls.interest_type,
+            principal_amount=Decimal(principal),
+            term_periods=4,
+            payment_per_period=Decimal(principal) * Decimal("0.35"),
+            company_account=cls.account,
+            status=status,
+            **extra,
+        )
+
+
+#=============================================================================
+#=============================================================================
+
+
+class DashboardKPIQueryTests(CoreTestCase):
+    """
+    compute_dashboard_kpis(): uma query por tabela de origem, qualquer que
+    seja o volume de dados.
+    """
+
+    # Loan, LoanRepayment, LoanDisbursement, VehicleLeasePayment,
+    # VehicleLeaseContract e CompanyAccount (saldo aplicado + diário)
+    QUERY_BUDGET = 7
+
+    def seed(self, loans):
+        for i in range(loans):
+            loan = self.make_loan(status=["pending", "disbursed", "closed"][i % 3])
+            LoanDisbursement.objects.create(
+                loan=loan, member=self.member, company_account=self.account,
+                disburse_date=self.today - timedelta(days=40), amount=loan.principal_amount,
+            )
+            LoanRepayment.objects.create(
+                loan=loan, member=self.member, company_account=self.account,
+                payment_date=self.today - timedelta(days=i % 20), amount=Decimal("350"),
+                interest_amount=Decimal("100"), principal_amount=Decimal("250"),
+                principal_balance_after=loan.principal_amount - Decimal("250"),
+            )
+
+    def test_query_budget_does_not_grow_with_data(self):
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            compute_dashboard_kpis(self.today)
+
+        self.seed(30)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            kpis = compute_dashboard_kpis(self.today)
+
+        self.assertEqual(kpis.status_pending_count, 10)
+        self.assertEqual(kpis.status_disbursed_count, 10)
+        self.assertEqual(kpis.outstanding_principal, Decimal("7500"))
+        self.assertEqual(kpis.mc_income_30d, Decimal("350") * 30)
+        self.assertEqual(kpis.company_accounts_balance, Decimal("10000"))
+
+
+class LeasingPageQueryTests(CoreTestCase):
+    """
+    Páginas de leasing (view + template): orçamento fixo de queries,
+    qualquer que seja o número de viaturas, contratos e pagamentos, com os
+    KPIs fora da cache (pior caso).
+    """
+
+    # Queries por página:
+    # - frota: KPIs (1) + lista de viaturas (1)
+    # - contratos: KPIs (1) + rendas em atraso (1) + viaturas disponíveis,
+    #   motoristas e contas do modal (3); as linhas vêm depois, em JSON
+    # - pagamentos: KPIs (1) + contratos activos (1) + contas (1)
+    PAGE_BUDGETS = {
+        "core:leased_vehicle_list": (leased_vehicle_list, 2),
+        "core:vehicle_lease_contract_list": (vehicle_lease_contract_list, 5),
+        "core:vehicle_lease_payment_list": (vehicle_lease_payment_list, 3),
+    }
+
+    def seed(self, count):
+        start = LeasedVehicle.objects.count()
+        for n in range(start, start + count):
+            vehicle = LeasedVehicle.objects.create(
+                plate_number=f"AAB-{n:03d}-MC", acquisition_cost=Decimal("400000"), status="leased"
+            )
+            contract = VehicleLeaseContract.objects.create(
+                leased_vehicle=vehicle, driver=self.member, company_account=self.account,
+                start_date=self.today - timedelta(days=60), weekly_rent=Decimal("1000"),
+            )
+            VehicleLeasePayment.objects.create(
+                contract=contract, driver=self.member, company_account=self.account,
+                payment_date=self.today - timedelta(days=n % 30), amount=Decimal("1000"), created_by=self.user,
+            )
+
+    def assert_budgets(self):
+        factory = RequestFactory()
+        for name, (view, budget) in self.PAGE_BUDGETS.items():
+            invalidate_leasing_kpis()
+            request = factory.get(reverse(name))
+            request.user = self.user
+            with self.subTest(page=name), self.assertNumQueries(budget):
+                response = view(request)
+            self.assertEqual(response.status_code, 200)
+
+    def test_page_queries_do_not_grow_with_data(self):
+        self.seed(2)
+        self.assert_budgets()
+
+        self.seed(20)
+        self.assert_budgets()
+
+
+class LoanRepaymentListTests(CoreTestCase):
+    def test_list_does_not_write_missing_balances(self):
+        loan = self.make_loan(release_date=self.today - timedelta(days=10))
+        repayment = LoanRepayment.objects.create(
+            loan=loan, member=self.member, company_account=self.account,
+            payment_date=self.today, amount=Decimal("350"), interest_amount=Decimal("100"),
+            principal_amount=Decimal("250"), principal_balance_after=Decimal("750"),
+        )
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("core:loan_repayment_list"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(LoanBalance.objects.exists())
+        self.assertEqual(response.context["loans"][0].last_repayment, repayment)
+
+
+    def test_list_reads_the_cycle_from_loan_balance(self):
+        loans = [self.make_loan(release_date=self.today - timedelta(days=10)) for _ in range(2)]
+        for loan, (interest, principal) in zip(loans, [("40", "0"), ("100", "250")]):
+            LoanRepayment.objects.create(
+                loan=loan, member=self.member, company_account=self.account,
+                payment_date=self.today, amount=Decimal(interest) + Decimal(principal),
+                interest_amount=Decimal(interest), principal_amount=Decimal(principal),
+                principal_balance_after=loan.principal_amount - Decimal(principal),
+            )
+        rebuild_loan_balances([loans[0].id])
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("core:loan_repayment_list"))
+
+        # com linha de LoanBalance: juros do ciclo 10% de 1000, 40 já pagos
+        listed = {loan.id: loan for loan in response.context["loans"]}
+        first, second = listed[loans[0].id], listed[loans[1].id]
+        self.assertEqual(
+            (first.outstanding_principal, first.period_interest_remaining, first.outstanding_with_interest),
+            (Decimal("1000"), Decimal("60"), Decimal("1060")),
+        )
+        self.assertEqual(second.outstanding_with_interest, Decimal("750"))
+        self.assertEqual(response.context["kpi_total_outstanding"], Decimal("1810"))
+        grouped = [q["sql"] for q in queries.captured_queries if "GROUP BY" in q["sql"]]
+        self.assertEqual(len(grouped), 1)  # só o empréstimo sem linha de LoanBalance
+
+
+class LoanAgingTests(CoreTestCase):
+    def test_outstanding_falls_back_to_repayments_without_a_balance_row(self):
+        for principal in ("1000", "2000"):
+            loan = self.make_loan(principal=principal, release_date=self.today - timedelta(days=10))
+            LoanRepayment.objects.create(
+                loan=loan, member=self.member, company_account=self.account,
+                payment_date=self.today, amount=Decimal("400"), interest_amount=Decimal("100"),
+                principal_amount=Decimal("300"), principal_balance_after=loan.principal_amount - Decimal("300"),
+            )
+        rebuild_loan_balances([loan.id])
+
+        aging = portfolio_aging(self.today)
+
+        self.assertEqual(LoanBalance.objects.count(), 1)
+        self.assertEqual(aging.portfolio.outstanding_total, Decimal("2400"))
+
+
+class RepaymentImportTests(CoreTestCase):
+    def test_reimporting_a_statement_skips_known_references(self):
+        loan = self.make_loan(release_date=self.today - timedelta(days=10), first_payment_date=self.today + timedelta(days=20))
+        statement = (
+            "loan_id,payment_date,amount,reference\n"
+            f"{loan.id},{self.today:%Y-%m-%d},100,MP001\n"
+            f"{loan.id},{self.today:%Y-%m-%d},200,MP002\n"
+        )
+
+        first = import_repayments(statement, company_account_id=self.account.id, user=self.user)
+        second = import_repayments(statement, company_account_id=self.account.id, user=self.user)
+
+        self.assertEqual(len(first.ok_rows), 2)
+        self.assertEqual(len(second.ok_rows), 0)
+        self.assertIn("já importada", second.rows[0].error)
+        self.assertEqual(LoanRepayment.objects.filter(loan=loan).count(), 2)
+        self.assertEqual(set(LoanRepayment.objects.values_list("reference", flat=True)), {"MP001", "MP002"})
+        self.assertEqual(
+            set(LoanRepayment.objects.values_list("import_batch", "import_line", "notes")),
+            {(first.batch, 2, None), (first.batch, 3, None)},
+        )
+        self.assertEqual(
+            set(Transaction.objects.values_list("source_id", flat=True)),
+            set(LoanRepayment.objects.values_list("id", flat=True)),
+        )
+
+
+class PostingTests(CoreTestCase):
+    def test_journal_postings_apply_as_a_continuous_chain(self):
+        for amount in ("100", "50"):
+            post_transaction(self.account, Transaction.TX_TYPE_IN, Decimal(amount), self.today, "Entrada", mode="journal")
+        post_transaction(self.account, Transaction.TX_TYPE_OUT, Decimal("30"), self.today, "Saída", mode="journal")
+
+        self.assertEqual(company_accounts_balance(), Decimal("10120"))
+        self.assertEqual(apply_journal(), 3)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("10120"))
+        chain = list(Transaction.objects.order_by("id").values_list("balance_before", "balance_after"))
+        self.assertEqual(chain[0][0], Decimal("10000"))
+        self.assertEqual([after for _, after in chain[:-1]], [before for before, _ in chain[1:]])
+
+    def test_batch_posting_follows_each_account_mode(self):
+        journal = CompanyAccount.objects.create(
+            account_type=self.account.account_type, name="M-Pesa", account_identifier="0002", balance=Decimal("500")
+        )
+        entries = [(self.account, "100"), (journal, "40"), (self.account, "60")]
+
+        with override_settings(ACCOUNT_POSTING_MODE="journal", ACCOUNT_JOURNAL_ACCOUNTS=[journal.id]):
+            posted = post_transactions(
+                Transaction(
+                    company_account_id=account.id, tx_type=Transaction.TX_TYPE_IN, amount=Decimal(amount),
+                    tx_date=self.today, description="Lote",
+                )
+                for account, amount in entries
+            )
+
+        self.assertEqual(
+            [(tx.balance_before, tx.balance_after) for tx in posted],
+            [(Decimal("10000"), Decimal("10100")), (None, None), (Decimal("10100"), Decimal("10160"))],
+        )
+        self.account.refresh_from_db()
+        journal.refresh_from_db()
+        self.assertEqual((self.account.balance, journal.balance), (Decimal("10160"), Decimal("500")))
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(company_accounts_balance(), Decimal("10700"))
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class PostingConcurrencyTests(TransactionTestCase):
+    """
+    Lançamentos simultâneos na mesma conta (modo "locked"): nenhuma
+    actualização perdida e saldos antes/depois em cadeia contínua.
+    """
+
+    THREADS = 20
+
+    @classmethod
+    def setUpClass(cls):
+        create_unmanaged_tables()
+        super().setUpClass()
+
+    def setUp(self):
+        account_type = AccountType.objects.create(category="cash", name="Caixa")
+        self.account = CompanyAccount.objects.create(
+            account_type=account_type, name="Caixa", account_identifier="caixa", balance=Decimal("0")
+        )
+
+    def tearDown(self):
+        # tabelas managed=False não são limpas pelo flush do TransactionTestCase
+        Transaction.objects.filter(company_account=self.account).delete()
+        self.account.delete()
+        AccountType.objects.filter(pk=self.account.account_type_id).delete()
+
+    def test_concurrent_postings_keep_every_update(self):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker(n):
+            try:
+                barrier.wait()
+                post_transaction(
+                    self.account.pk, Transaction.TX_TYPE_IN, Decimal("1.00"), date.today(), f"#{n}", mode="locked"
+                )
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal(self.THREADS))
+        chain = list(
+            Transaction.objects.filter(company_account=self.account)
+            .order_by("balance_before")
+            .values_list("balance_before", "balance_after")
+        )
+        self.assertEqual(len(chain), self.THREADS)
+        self.assertEqual([after for _, after in chain[:-1]], [before for before, _ in chain[1:]])
+
+
+class BalancesReportTests(CoreTestCase):
+    def test_balances_include_pending_journal_entries(self):
+        post_transaction(self.account, Transaction.TX_TYPE_IN, Decimal("250"), self.today, "Entrada", mode="journal")
+        params = ReportParams(report_type="balances", start_date=self.today, end_date=self.today)
+
+        accounts = list(report_querysets(params)["accounts"])
+        self.assertEqual(accounts[0].live_balance, Decimal("10250"))
+
+        export = ReportExport(params)
+        self.assertEqual([row[2] for row in export.rows()], [Decimal("10250")])
+        self.assertEqual(export.total_rows()[0][2], Decimal("10250"))
+
+        before = report_watermark(params)
+        post_transaction(self.account, Transaction.TX_TYPE_IN, Decimal("1"), self.today, "Entrada", mode="journal")
+        self.assertNotEqual(report_watermark(params), before)
+
+
+class ExportCellTests(SimpleTestCase):
+    """Texto vindo do utilizador não pode virar fórmula nem partir o XML do XLSX."""
+
+    def export(self, description):
+        return SimpleNamespace(
+            params=SimpleNamespace(title="Transacções"),
+            headers=["Descrição", "Valor"],
+            kinds=[TEXT, MONEY],
+            rows=lambda: iter([[description, Decimal("-5.00")]]),
+            total_rows=lambda: [],
+        )
+
+    def test_csv_text_starting_with_formula_char_is_quoted(self):
+        for text in ("=1+2", "+1", "-1", "@SUM(A1)"):
+            with self.subTest(text=text):
+                line = "".join(stream_csv(self.export(text))).splitlines()[1]
+                self.assertEqual(line, f"'{text},-5.00")
+        line = "".join(stream_csv(self.export("Renda semanal"))).splitlines()[1]
+        self.assertEqual(line, "Renda semanal,-5.00")
+
+    def test_xlsx_text_is_quoted_and_control_chars_dropped(self):
+        data = b"".join(stream_xlsx(self.export("=CMD()\x07\x1f fim")))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+        ns = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        cells = sheet.findall("s:sheetData/s:row", ns)[1]
+        self.assertEqual(cells.find("s:c/s:is/s:t", ns).text, "'=CMD() fim")
+        self.assertEqual(cells.findall("s:c", ns)[1].find("s:v", ns).text, "-5.00")
+
+
+class TransactionLedgerTests(CoreTestCase):
+    def test_totals_are_cached_per_page_load(self):
+        for amount in ("100", "40"):
+            post_transaction(self.account, Transaction.TX_TYPE_IN, Decimal(amount), self.today, "Entrada")
+        self.client.force_login(self.user)
+        url = reverse("core:transaction_list_data")
+        params = {"draw": "1", "start": "0", "length": "10", "count_key": "abc123"}
+
+        with CaptureQueriesContext(connection) as first:
+            totals = self.client.get(url, params).json()
+        post_transaction(self.account, Transaction.TX_TYPE_IN, Decimal("1"), self.today, "Entrada")
+        with CaptureQueriesContext(connection) as second:
+            cached = self.client.get(url, {**params, "draw": "2"}).json()
+
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertEqual((cached["recordsTotal"], cached["totals"]), (2, totals["totals"]))
+        self.assertEqual(Decimal(totals["totals"]["in"]), Decimal("140"))
+
+        fresh = self.client.get(url, {**params, "count_key": "def456"}).json()
+        self.assertEqual(fresh["recordsTotal"], 3)
+
+
+class ServerSideListFilterTests(CoreTestCase):
+    def test_invalid_filter_value_gives_an_empty_page(self):
+        vehicle = LeasedVehicle.objects.create(plate_number="AAA-100-MC")
+        VehicleLeaseContract.objects.create(
+            leased_vehicle=vehicle, driver=self.member, company_account=self.account,
+            start_date=self.today, weekly_rent=Decimal("1000"),
+        )
+        self.client.force_login(self.user)
+        url = reverse("core:vehicle_lease_contract_list")
+
+        response = self.client.get(url, {"draw": "1", "account": "abc"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["recordsFiltered"], response.json()["data"]), (0, []))
+
+        response = self.client.get(url, {"draw": "2", "account": str(self.account.id)})
+        self.assertEqual(response.json()["recordsFiltered"], 1)
+
+
+class SplitPaymentTests(SimpleTestCase):
+    def test_completes_the_partial_week_then_whole_weeks(self):
+        self.assertEqual(
+            split_payment(Decimal("2500"), Decimal("1000"), 2, Decimal("300")),
+            ([(3, Decimal("700")), (4, Decimal("1000")), (5, Decimal("800"))], 4, Decimal("800"), Decimal("0")),
+        )
+
+    def test_exact_rent_closes_the_week(self):
+        self.assertEqual(
+            split_payment(Decimal("1000"), Decimal("1000"), 0, Decimal("0")),
+            ([(1, Decimal("1000"))], 1, Decimal("0"), Decimal("0")),
+        )
+
+    def test_amount_past_the_contract_end_is_excess(self):
+        self.assertEqual(
+            split_payment(Decimal("2000"), Decimal("1000"), 3, Decimal("500"), max_weeks=4),
+            ([(4, Decimal("500"))], 4, Decimal("0"), Decimal("1500")),
+        )
+        self.assertEqual(
+            split_payment(Decimal("300"), Decimal("1000"), 4, Decimal("0"), max_weeks=4),
+            ([], 4, Decimal("0"), Decimal("300")),
+        )
+
+
+class LeaseAllocationTests(CoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        vehicle = LeasedVehicle.objects.create(plate_number="AAC-001-MC")
+        # vencimentos 03/03, 10/03 e 17/03: três semanas
+        cls.contract = VehicleLeaseContract.objects.create(
+            leased_vehicle=vehicle, driver=cls.member, company_account=cls.account,
+            start_date=date(2025, 3, 3), end_date=date(2025, 3, 17), weekly_rent=Decimal("1000"),
+        )
+
+    def pay(self, day, amount):
+        payment = VehicleLeasePayment.objects.create(
+            contract=self.contract, driver=self.member, company_account=self.account,
+            payment_date=date(2025, 3, day), amount=Decimal(amount),
+        )
+        record_lease_payments([(self.contract, payment)])
+        return payment
+
+    def allocations(self):
+        return list(
+            VehicleLeaseAllocation.objects.filter(contract=self.contract)
+            .order_by("payment__payment_date", "week")
+            .values_list("payment_id", "week", "amount")
+        )
+
+    def test_backdated_payment_rebuilds_the_fifo_order(self):
+        open_lease_coverage(self.contract)
+        late = self.pay(20, "1500")
+        self.assertEqual(self.allocations(), [(late.id, 1, Decimal("1000")), (late.id, 2, Decimal("500"))])
+
+        early = self.pay(5, "700")
+
+        self.assertEqual(
+            self.allocations(),
+            [
+                (early.id, 1, Decimal("700")),
+                (late.id, 1, Decimal("300")),
+                (late.id, 2, Decimal("1000")),
+                (late.id, 3, Decimal("200")),
+            ],
+        )
+        coverage = VehicleLeaseCoverage.objects.get(contract=self.contract)
+        self.assertEqual((coverage.weeks_covered, coverage.partial_amount), (2, Decimal("200")))
+        self.assertEqual((coverage.paid_total, coverage.payments_count), (Decimal("2200"), 2))
+        self.assertEqual((coverage.paid_until, coverage.next_due_date), (date(2025, 3, 10), date(2025, 3, 17)))
+        self.assertEqual(coverage.last_payment_id, late.id)
+
+    def test_payment_past_the_last_week_is_left_unallocated(self):
+        open_lease_coverage(self.contract)
+        self.pay(3, "2500")
+        self.pay(10, "1500")
+
+        coverage = VehicleLeaseCoverage.objects.get(contract=self.contract)
+        self.assertEqual((coverage.weeks_covered, coverage.unallocated_amount), (3, Decimal("1000")))
+        self.assertIsNone(coverage.next_due_date)
+        self.assertEqual(sum(amount for _, _, amount in self.allocations()), Decimal("3000"))
+
+
+class PnlPivotTests(CoreTestCase):
+    """
+    P&L mensal: meses completos do agregado sl_pnl_monthly e meses
+    incompletos nas pontas calculados das tabelas — o mesmo resultado que
+    um GROUP BY directo sobre as tabelas.
+    """
+
+    START, END = date(2025, 1, 15), date(2025, 3, 10)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        income_category = IncomeCategory.objects.create(name="Comissões")
+        expense_category = ExpenseCategory.objects.create(name="Renda")
+        loan = cls.make_loan(release_date=date(2024, 12, 1))
+        vehicle = LeasedVehicle.objects.create(plate_number="AAE-001-MC")
+        contract = VehicleLeaseContract.objects.create(
+            leased_vehicle=vehicle, driver=cls.member, company_account=cls.account,
+            start_date=date(2024, 12, 1), weekly_rent=Decimal("1000"),
+        )
+        now = timezone.now()
+        # dias dentro e fora do período, nos meses das pontas e no do meio
+        days = [date(2025, 1, 5), date(2025, 1, 20), date(2025, 2, 10), date(2025, 3, 5), date(2025, 3, 25)]
+        for n, day in enumerate(days):
+            Income.objects.create(
+                category=income_category, company_account=cls.account, income_date=day,
+                description="Comissão", amount=Decimal(100 + n), created_at=now,
+            )
+            Expense.objects.create(
+                category=expense_category, company_account=cls.account, expense_date=day,
+                description="Renda", amount=Decimal(40 + n), created_at=now,
+            )
+            LoanRepayment.objects.create(
+                loan=loan, member=cls.member, company_account=cls.account, payment_date=day,
+                amount=Decimal("60"), interest_amount=Decimal(10 + n), principal_amount=Decimal(50 - n),
+                principal_balance_after=Decimal("500"),
+            )
+            VehicleLeasePayment.objects.create(
+                contract=contract, driver=cls.member, company_account=cls.account,
+                payment_date=day, amount=Decimal(1000 + n),
+            )
+
+    def raw_pivot(self):
+        with patch("core.services.pnl.pnl_rollup_built", return_value=False):
+            return pnl_pivot(self.START, self.END)
+
+    def test_rollup_with_partial_edge_months_matches_the_raw_group_by(self):
+        raw = self.raw_pivot()
+        # 20/01, 10/02 e 05/03 (n = 1, 2, 3)
+        self.assertEqual(raw["total_revenue"], Decimal(101 + 102 + 103) + Decimal(11 + 12 + 13) + Decimal(3006))
+        self.assertEqual(raw["total_expenses"], Decimal(41 + 42 + 43))
+
+        rebuild_pnl_rollup()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(pnl_pivot(self.START, self.END), raw)
+        self.assertTrue(any("sl_pnl_monthly" in query["sql"] for query in ctx.captured_queries))
+
+        # lançamento posterior, só no agregado (mês completo) e nas tabelas
+        Income.objects.create(
+            category=IncomeCategory.objects.get(), company_account=self.account, income_date=date(2025, 2, 20),
+            description="Comissão", amount=Decimal("500"), created_at=timezone.now(),
+        )
+        apply_pnl_delta(
+            PnlMonthly.LINE_INCOME, date(2025, 2, 20), Decimal("500"), self.account.id,
+            category_id=IncomeCategory.objects.get().id,
+        )
+        pivot = pnl_pivot(self.START, self.END)
+        self.assertEqual(pivot, self.raw_pivot())
+        self.assertEqual(pivot["total_net"], raw["total_net"] + Decimal("500"))
+
+    def test_profits_pdf_shows_a_single_bottom_line(self):
+        params = ReportParams(report_type="profits", start_date=self.START, end_date=self.END)
+        context = build_report_context(params)
+        html = render_to_string("reports/report_pdf.html", context)
+
+        self.assertEqual(context["profit"], context["pnl"]["total_net"])
+        self.assertIn("Resultado (Receitas - Despesas)", html)
+        self.assertNotIn("Lucro Líquido", html)
+        self.assertIn(f"{floatformat(context['profit_margin'], 2)}%", html)
+
+
+class LeaseCollectionTests(CoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_account = CompanyAccount.objects.create(
+            account_type=cls.account.account_type, name="M-Pesa", account_identifier="0002", balance=Decimal("0")
+        )
+        cls.contracts = [
+            VehicleLeaseContract.objects.create(
+                leased_vehicle=LeasedVehicle.objects.create(plate_number=f"AAD-{n:03d}-MC"),
+                driver=cls.member, company_account=cls.account,
+                start_date=date(2025, 3, 3), weekly_rent=Decimal("1000"),
+            )
+            for n in range(3)
+        ]
+
+    def test_batch_posts_payments_transactions_and_allocations(self):
+        first, second, third = self.contracts
+        entries = [
+            (first.id, Decimal("1000"), None),
+            (second.id, Decimal("1500"), None),
+            (third.id, Decimal("400"), self.other_account.id),
+        ]
+        result = post_lease_collection(entries, self.today, user=self.user)
+
+        self.assertTrue(result.posted, result.error_rows)
+        self.assertEqual(result.total_amount, Decimal("2900"))
+        self.account.refresh_from_db()
+        self.other_account.refresh_from_db()
+        self.assertEqual((self.account.balance, self.other_account.balance), (Decimal("12500"), Decimal("400")))
+
+        payments = {p.contract_id: p for p in VehicleLeasePayment.objects.filter(import_batch=result.batch)}
+        self.assertEqual(len(payments), 3)
+        self.assertEqual(
+            set(Transaction.objects.values_list("source_type", "source_id", "company_account_id", "amount")),
+            {
+                ("vehicle_lease_payment", payments[first.id].id, self.account.id, Decimal("1000")),
+                ("vehicle_lease_payment", payments[second.id].id, self.account.id, Decimal("1500")),
+                ("vehicle_lease_payment", payments[third.id].id, self.other_account.id, Decimal("400")),
+            },
+        )
+        self.assertEqual(
+            list(
+                VehicleLeaseAllocation.objects.filter(contract=second)
+                .order_by("week").values_list("week", "amount")
+            ),
+            [(1, Decimal("1000")), (2, Decimal("500"))],
+        )
+        self.assertEqual(VehicleLeaseCoverage.objects.get(contract=third).partial_amount, Decimal("400"))
+
+    def test_one_invalid_row_posts_nothing(self):
+        first, second, _ = self.contracts
+        result = post_lease_collection(
+            [(first.id, Decimal("1000"), None), (second.id, Decimal("0"), None), (999999, Decimal("500"), None)],
+            self.today,
+            user=self.user,
+        )
+
+        self.assertFalse(result.posted)
+        self.assertEqual(len(result.error_rows), 2)
+        self.assertFalse(VehicleLeasePayment.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(VehicleLeaseAllocation.objects.exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("10000"))
+
+    def test_failure_while_writing_rolls_back_the_whole_batch(self):
+        entries = [(contract.id, Decimal("1000"), None) for contract in self.contracts]
+        with patch("core.services.lease_collection.record_vehicle_revenues", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                post_lease_collection(entries, self.today, user=self.user)
+
+        self.assertFalse(VehicleLeasePayment.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(VehicleLeaseAllocation.objects.exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal("10000"))
+
+
+class KeysetPaginationTests(CoreTestCase):
+    def pages(self, order_dir):
+        """
+        Matrículas de todas as páginas, folheadas como o DataTables: cada
+        pedido leva o cursor devolvido pelo anterior.
+        """
+        url = reverse("core:vehicle_profitability_list")
+        params = {"draw": "1", "start": "0", "length": "2", "order[0][column]": "1", "order[0][dir]": order_dir}
+        plates = []
+        while True:
+            payload = self.client.get(url, params).json()
+            if not payload["data"]:
+                return plates
+            plates += [re.search(r"AAA-\d+-MC", row).group() for row in payload["data"]]
+            params["start"] = str(int(params["start"]) + len(payload["data"]))
+            cursor = payload["cursor"]
+            params.update(
+                {"cursor_start": str(cursor["start"]), "cursor_value": cursor["value"], "cursor_id": str(cursor["id"])}
+                if cursor else {"cursor_start": "", "cursor_value": "", "cursor_id": ""}
+            )
+
+    def test_cursor_pages_keep_rows_with_a_null_order_value(self):
+        costs = ["500000", None, "300000", None, "500000", "100000", None]
+        vehicles = [
+            LeasedVehicle.objects.create(plate_number=f"AAA-{n:03d}-MC", acquisition_cost=cost)
+            for n, cost in enumerate(costs)
+        ]
+        self.client.force_login(self.user)
+
+        for order_dir in ("desc", "asc"):
+            with self.subTest(order_dir=order_dir):
+                plates = self.pages(order_dir)
+                self.assertEqual(sorted(plates), sorted(v.plate_number for v in vehicles))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MonthEndPrerenderTests(CoreTestCase):
+    def test_command_renders_every_month_end_report(self):
+        self.make_loan(release_date=date(2025, 2, 3))
+        html = []
+
+        def fake_pdf(html_string):
+            html.append(html_string)
+            return b"%PDF-1.4"
+
+        with patch("core.services.reports.html_to_pdf", side_effect=fake_pdf):
+            call_command("prerender_month_end_reports", month="2025-02", stdout=io.StringIO())
+
+        expected = len(list(month_end_params(2025, 2)))
+        self.assertEqual(PrerenderedReport.objects.count(), expected)
+        self.assertEqual(len(html), expected)
+        self.assertNotIn("Gerado por", html[0])
+        self.assertIn("Gerado automaticamente", html[0])
+
+
+def blank_pdf():
+    writer = PdfWriter()
+    writer.add_blank_page(width=595, height=842)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class FakePdfRenderer:
+    """
+    PdfRenderer sem WeasyPrint: uma página em branco por documento, com as
+    estatísticas contadas como no verdadeiro.
+    """
+
+    def __init__(self):
+        self.stats = RenderStats()
+        self.pdf = blank_pdf()
+
+    def warm_up(self):
+        pass
+
+    def render(self, html_string, base_url=None):
+        self.stats.renders += 1
+        self.stats.last_pages = 1
+        self.stats.pages += 1
+        return self.pdf
+
+
+class BenchPdfRenderTests(CoreTestCase):
+    def test_bench_renders_without_a_requesting_user(self):
+        out = io.StringIO()
+        with patch("core.management.commands.bench_pdf_render.PdfRenderer", FakePdfRenderer):
+            call_command("bench_pdf_render", report_type="balances", repeat=2, stdout=out)
+
+        self.assertIn("Saldos por Conta", out.getvalue())
+        self.assertIn("renderer pré-aquecido", out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReportJobCacheTests(CoreTestCase):
+    def finish(self, job):
+        job.file.save("report.pdf", ContentFile(b"%PDF-1.4"), save=False)
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJob.STATUS_DONE, inflight_key=None, file=job.file.name, finished_at=timezone.now()
+        )
+
+    def test_finished_pdf_is_only_reused_for_the_same_user(self):
+        other = User.objects.create_user("outro", password="x")
+        params = ReportParams(report_type="incomes", start_date=self.today, end_date=self.today)
+
+        job, _ = enqueue_report(params, user=self.user)
+        self.finish(job)
+
+        self.assertFalse(enqueue_report(params, user=other)[0].from_cache)
+        self.assertTrue(enqueue_report(params, user=self.user)[0].from_cache)
+
+
+class ReportQueryBudgetTests(CoreTestCase):
+    """
+    Queries para montar o contexto e renderizar o template do PDF (sem gerar
+    o PDF): orçamento fixo por tipo de relatório, independente do número de
+    linhas — um N+1 no template (ex.: relação sem select_related) falha aqui.
+    """
+
+    @staticmethod
+    def query_budget(params, row_count=0):
+        """
+        Uma query por filtro (membro/utilizador/conta mostrados no cabeçalho),
+        uma para as linhas e uma agregação por fonte de REPORT_TOTALS. Nos
+        lucros, mais o P&L mensal (no máximo PNL_MAX_QUERIES). Nos empréstimos,
+        mais uma query por lote de SCHEDULE_BATCH_SIZE (juros previstos).
+        """
+        filters = sum(1 for pk in (params.member_id, params.user_id, params.company_account_id) if pk)
+        sources = REPORT_TOTALS[params.report_type]
+        if params.report_type == "profits":
+            return filters + len(sources) + PNL_MAX_QUERIES
+        if params.report_type == "loans":
+            return filters + 1 + len(sources) + row_count // SCHEDULE_BATCH_SIZE + 1
+        return filters + 1 + len(sources)
+
+    def seed(self, count):
+        for i in range(count):
+            loan = self.make_loan(release_date=self.today - timedelta(days=30), created_by=self.user)
+            LoanDisbursement.objects.create(
+                loan=loan, member=self.member, company_account=self.account,
+                disburse_date=self.today - timedelta(days=30), amount=loan.principal_amount,
+            )
+            LoanRepayment.objects.create(
+                loan=loan, member=self.member, company_account=self.account,
+                payment_date=self.today - timedelta(days=i % 10), amount=Decimal("350"),
+                interest_amount=Decimal("100"), principal_amount=Decimal("250"),
+                principal_balance_after=loan.principal_amount - Decimal("250"),
+            )
+            post_transaction(self.account, Transaction.TX_TYPE_IN, Decimal("350"), self.today, f"Reembolso #{i}")
+
+    def assert_budgets(self, **filters):
+        for report_type in REPORT_LABELS:
+            params = ReportParams(
+                report_type=report_type, start_date=self.today - timedelta(days=60), end_date=date.today(), **filters
+            )
+            with self.subTest(report_type=report_type), CaptureQueriesContext(connection) as ctx:
+                context = build_report_context(params)
+                render_to_string("reports/report_pdf.html", context)
+
+                rows = context.get("rows", context.get("accounts"))
+                budget = self.query_budget(params, len(rows) if rows is not None else 0)
+                self.assertLessEqual(len(ctx.captured_queries), budget)
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.seed(2)
+        self.assert_budgets()
+
+        self.seed(20)
+        self.assert_budgets()
+        self.assert_budgets(member_id=self.member.id, user_id=self.user.id, company_account_id=self.account.id)
+
+
+def synthetic_transactions(count, start_date):
+    """
+    Transacções em memória (não gravadas), geradas uma a uma — o custo de
+    memória medido é só o da geração do PDF.
+    """
+    account = CompanyAccount(id=1, name="Conta de teste", account_identifier="000000")
+    user = User(id=1, username="teste", first_name="Utilizador", last_name="Teste")
+    balance = Decimal("0")
+    for n in range(count):
+        amount = Decimal(100 + n % 900) + Decimal("0.50")
+        tx_type = Transaction.TX_TYPE_IN if n % 3 else Transaction.TX_TYPE_OUT
+        before = balance
+        balance += amount if tx_type == Transaction.TX_TYPE_IN else -amount
+        yield Transaction(
+            id=n + 1,
+            company_account=account,
+            tx_type=tx_type,
+            tx_date=start_date + timedelta(days=n // 50),
+            description=f"Lançamento de teste #{n + 1}",
+            amount=amount,
+            balance_before=before,
+            balance_after=balance,
+            created_by=user,
+        )
+
+
+class ChunkedPdfMemoryTests(SimpleTestCase):
+    """
+    Pico de memória (tracemalloc) da geração por blocos: não cresce com o
+    número de linhas — só um bloco está em memória de cada vez. O WeasyPrint
+    é substituído por FakePdfRenderer; mede-se o template, os totais
+    transportados e a junção dos PDFs parciais.
+    """
+
+    CHUNK_ROWS = 200
+    TOLERANCE = 1.5
+
+    def peak(self, count):
+        start_date = date(2020, 1, 1)
+        context = {
+            "report_type": "transactions",
+            "report_title": REPORT_LABELS["transactions"],
+            "start_date": start_date,
+            "end_date": start_date + timedelta(days=count // 50),
+        }
+        tracemalloc.start()
+        try:
+            render_chunked_pdf(
+                "reports/report_pdf.html",
+                context,
+                synthetic_transactions(count, start_date),
+                REPORT_CARRY_TOTALS["transactions"],
+                self.CHUNK_ROWS,
+            )
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_does_not_grow_with_rows(self):
+        with patch("core.services.report_chunks.get_renderer", FakePdfRenderer):
+            self.peak(self.CHUNK_ROWS)  # aquece templates e imports fora da medição
+            small = self.peak(self.CHUNK_ROWS * 2)
+            large = self.peak(self.CHUNK_ROWS * 16)
+
+        self.assertLess(large / small, self.TOLERANCE)
+
+
+def money(*values):
+    return [Decimal(value) for value in values]
+
+
+class AmortizationScheduleTests(SimpleTestCase):
+    """
+    Quadros de amortização conhecidos (valores ao centavo, calculados à mão).
+    """
+
+    def terms(self, **extra):
+        defaults = {"principal": Decimal("1000"), "rate": Decimal("10"), "periods": 3, "start_date": date(2025, 1, 15)}
+        return LoanTerms(**{**defaults, **extra})
+
+    def test_flat_rounds_the_last_installment(self):
+        schedule = build_schedule(self.terms(method=METHOD_FLAT))
+
+        self.assertEqual(schedule.payment, Decimal("402.11"))
+        self.assertEqual(schedule.interest, money("100.00", "69.79", "36.56"))
+        self.assertEqual(schedule.principal, money("302.11", "332.32", "365.57"))
+        self.assertEqual(schedule.installments, money("402.11", "402.11", "402.13"))
+        self.assertEqual(schedule.closing, money("697.89", "365.57", "0.00"))
+        self.assertEqual(schedule.due_dates, [date(2025, 2, 15), date(2025, 3, 15), date(2025, 4, 15)])
+        self.assertEqual(schedule.total_interest, Decimal("206.35"))
+
+    def test_reducing_amortizes_a_constant_share(self):
+        schedule = build_schedule(self.terms(method=METHOD_REDUCING))
+
+        self.assertEqual(schedule.opening, money("1000.00", "666.67", "333.34"))
+        self.assertEqual(schedule.principal, money("333.33", "333.33", "333.34"))
+        self.assertEqual(schedule.interest, money("100.00", "66.67", "33.33"))
+        self.assertEqual(schedule.installments, money("433.33", "400.00", "366.67"))
+        self.assertEqual(schedule.payment, Decimal("433.33"))
+        self.assertEqual(schedule.remaining, Decimal("0.00"))
+
+    def test_daily_interest_uses_real_days_and_month_end_due_dates(self):
+        schedule = build_schedule(
+            self.terms(method=METHOD_DAILY, rate=Decimal("3"), periods=2, start_date=date(2025, 1, 31))
+        )
+
+        # 31/01 -> 28/02 (28 dias) -> 31/03 (31 dias); taxa mensal / 30 por dia
+        self.assertEqual(schedule.due_dates, [date(2025, 2, 28), date(2025, 3, 31)])
+        self.assertEqual(schedule.payment, Decimal("522.61"))
+        self.assertEqual(schedule.interest, money("28.00", "15.67"))
+        self.assertEqual(schedule.installments, money("522.61", "521.06"))
+        self.assertEqual(schedule.closing, money("505.39", "0.00"))
+
+    def test_month_end_start_keeps_the_last_day_of_each_month(self):
+        schedule = build_schedule(self.terms(periods=4, start_date=date(2024, 1, 31)))
+
+        self.assertEqual(
+            schedule.due_dates,
+            [date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31)],
+        )
+
+    def test_payment_lower_than_interest_settles_on_the_last_period(self):
+        schedule = build_schedule(self.terms(method=METHOD_FLAT, payment=Decimal("50")))
+
+        self.assertEqual(schedule.interest, money("100.00", "100.00", "100.00"))
+        self.assertEqual(schedule.principal, money("0.00", "0.00", "1000.00"))
+        self.assertEqual(schedule.installments, money("50.00", "50.00", "1100.00"))
+        self.assertEqual(schedule.closing, money("1000.00", "1000.00", "0.00"))
+
+    def test_schedules_in_one_batch_match_single_schedules(self):
+        terms = [self.terms(method=method) for method in (METHOD_FLAT, METHOD_REDUCING, METHOD_DAILY)]
+        batch = build_schedules(terms)
+
+        for i, single in enumerate(terms):
+            self.assertEqual(batch[i], build_schedule(single))
+
+    def test_invalid_terms_raise_schedule_error(self):
+        invalid = [
+            {"principal": Decimal("0")},
+            {"rate": Decimal("-1")},
+            {"periods": 0},
+            {"periods": MAX_PERIODS + 1},
+            {"payment": Decimal("0")},
+            {"method": "bullet"},
+            {"period_type": "weekly"},
+        ]
+        for extra in invalid:
+            with self.subTest(**{key: str(value) for key, value in extra.items()}):
+                with self.assertRaises(ScheduleError):
+                    build_schedule(self.terms(**extra))
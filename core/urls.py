@@ -7,20 +7,22 @@ from core.views.account.account_view import company_account_list, create_company
 from core.views.expense.expense_view import expense_category_list, create_expense_category
 from core.views.expense.expense_view import expense_list, create_expense, download_expense_attachment, update_expense_category, deactivate_expense_category
 from core.views.income.income_view import income_category_list, create_income_category, income_list, create_income, download_income_attachment, update_income_category, toggle_income_category_status
-from core.views.transaction.transaction_view import transaction_list
-from core.views.interest.interest_view import interest_type_list, create_interest_type, interest_calculator, update_interest_type, toggle_interest_type_status
+from core.views.transaction.transaction_view import transaction_list, transaction_list_data
+from core.views.interest.interest_view import interest_type_list, create_interest_type, interest_calculator, interest_schedule, update_interest_type, toggle_interest_type_status
 from core.views.loan.loan_views import new_loan
 from core.views.loan.loan_type_views import loan_type_list, create_loan_type, update_loan_type, toggle_loan_type
 from core.views.loan.loan_views import pending_loans_list, confirm_loan, reject_loan
 from core.views.payments.loan_disbursement_views import loan_disbursement_list, register_disbursement
 from core.views.loan.active_loan import active_loans_list, active_loan_details
-from core.views.payments.loan_repayment_views import loan_repayment_list, register_repayment
+from core.views.payments.loan_repayment_views import loan_repayment_list, register_repayment, import_repayments_csv
 from core.views.loan.all_loan_list_views import loan_list_all, loan_details_any_status
+from core.views.loan.loan_aging_views import loan_aging_data
 from core.views.user.user_views import user_list, toggle_user_active, update_user_groups, create_user,update_user
-from core.views.reports.report_views import report_filters, generate_report_pdf
+from core.views.reports.report_views import report_filters, generate_report_pdf, export_report, pnl_data, report_job_status, report_job_download
 from core.views.leasing.leasing import leased_vehicle_list, create_leased_vehicle
 from core.views.leasing.leasing_contracts import vehicle_lease_contract_list, create_vehicle_lease_contract
-from core.views.leasing.vehicle_lease_payments import vehicle_lease_payment_list, create_vehicle_lease_payment
+from core.views.leasing.vehicle_lease_payments import vehicle_lease_payment_list, create_vehicle_lease_payment, vehicle_lease_collection, post_vehicle_lease_collection
+from core.views.leasing.vehicle_profitability import vehicle_profitability_list
 
 app_name = "core"
 
@@ -79,12 +81,14 @@ urlpatterns = [
     
     # Transações
     path("transactions/", transaction_list, name="transaction_list"),
+    path("transactions/data/", transaction_list_data, name="transaction_list_data"),
     
     
     # Juros
     path("interest/types/", interest_type_list, name="interest_type_list"),
     path("interest/types/create/", create_interest_type, name="create_interest_type"),
     path("interest/calculator/", interest_calculator, name="interest_calculator"),
+    path("interest/schedule/", interest_schedule, name="interest_schedule"),
     path("interest/types/update/", update_interest_type,name="update_interest_type",),
     path("interest/types/toggle-status/", toggle_interest_type_status,name="toggle_interest_type_status",),
 
@@ -114,6 +118,8 @@ urlpatterns = [
     path("loans/<int:loan_id>/disburse/", register_disbursement, name="register_disbursement"),
     path("loans/repayments/", loan_repayment_list, name="loan_repayment_list"),
     path("loans/<int:loan_id>/repay/", register_repayment, name="register_repayment"),
+    path("loans/repayments/import/", import_repayments_csv, name="import_repayments_csv"),
+    path("loans/aging/", loan_aging_data, name="loan_aging_data"),
     
     
     path("leasing/veiculos/", leased_vehicle_list, name="leased_vehicle_list"),
@@ -124,6 +130,10 @@ urlpatterns = [
     
     path("leasing/veiculos/payments/",vehicle_lease_payment_list,name="vehicle_lease_payment_list",),
     path("leasing/veiculos/payments/add/",create_vehicle_lease_payment,name="create_vehicle_lease_payment",),
+    path("leasing/veiculos/payments/cobranca/",vehicle_lease_collection,name="vehicle_lease_collection",),
+    path("leasing/veiculos/payments/cobranca/post/",post_vehicle_lease_collection,name="post_vehicle_lease_collection",),
+
+    path("leasing/veiculos/rentabilidade/",vehicle_profitability_list,name="vehicle_profitability_list",),
 
 
     # UTILIZADORES
@@ -136,5 +146,9 @@ urlpatterns = [
     # RELATÓRIOS
     path("reports/", report_filters, name="report_filters"),
     path("reports/pdf/", generate_report_pdf, name="generate_report_pdf"),
+    path("reports/export/", export_report, name="export_report"),
+    path("reports/pnl/", pnl_data, name="pnl_data"),
+    path("reports/jobs/<int:job_id>/", report_job_status, name="report_job_status"),
+    path("reports/jobs/<int:job_id>/download/", report_job_download, name="report_job_download"),
 
 ]
\ No newline at end of file
@@ -1,10 +1,12 @@
-from core.models import Member, AccountType, ClientAccount, CompanyAccount, Transaction
+from core.models import Member, AccountType, ClientAccount, CompanyAccount
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
 from django.shortcuts import render
 from decimal import Decimal
-from django.utils import timezone
 from django.shortcuts import render, get_object_or_404
+from django.db import transaction as db_transaction
+from core.services.posting import annotate_live_balance, set_account_balance
+from core.services.server_list import ServerSideList
 
 
 
@@ -118,20 +120,33 @@ def toggle_account_type_status(request):
     )
 #============================================================================================================
 #============================================================================================================
+CLIENT_ACCOUNT_LIST = ServerSideList(
+    "client_accounts",
+    ClientAccount.objects.filter(is_active=True).select_related("member", "account_type"),
+    "accounts/client_account_row.html",
+    row_name="a",
+    search_fields=(
+        "member__first_name", "member__last_name", "member__legal_name",
+        "account_type__name", "account_identifier",
+    ),
+    order_fields={0: "id", 1: "member__first_name", 2: "account_type__name", 3: "account_identifier", 4: "balance"},
+    filters={"account_type": "account_type_id"},
+    default_order=(1, "asc"),
+)
+
+
 def client_account_list(request):
+    if CLIENT_ACCOUNT_LIST.wants_json(request):
+        return CLIENT_ACCOUNT_LIST.response(request)
+
     members = Member.objects.filter(is_active=True).order_by("first_name", "last_name")
     account_types = AccountType.objects.filter(is_active=True).order_by("id")
-    accounts = (
-        ClientAccount.objects.filter(is_active=True)
-        .select_related("member", "account_type")
-        .order_by("member__first_name", "member__last_name")
-    )
 
     return render(
         request,
         "accounts/client_account_list.html",
         {
-            "accounts": accounts,
+            "list_options": CLIENT_ACCOUNT_LIST.js_options(),
             "segment": "client_accounts",
             "members": members,
             "account_types": account_types,
@@ -287,7 +302,7 @@ def toggle_client_account_status(request):
 #============================================================================================================
 def company_account_list(request):
     account_types = AccountType.objects.filter(is_active=True).order_by("id")
-    accounts = (
+    accounts = annotate_live_balance(
         CompanyAccount.objects.filter(is_active=True)
         .select_related("account_type")
         .order_by("id")
@@ -342,6 +357,7 @@ def create_company_account(request):
 #============================================================================================================
 #============================================================================================================
 @require_POST
+@db_transaction.atomic
 def update_company_account(request, account_id):
     try:
         account = CompanyAccount.objects.get(pk=account_id, is_active=True)
@@ -364,15 +380,9 @@ def update_company_account(request, account_id):
     except AccountType.DoesNotExist:
         return JsonResponse({"success": False, "message": "Tipo de conta inválido."}, status=400)
 
-    # Saldo antes da alteração
-    old_balance = account.balance or Decimal("0")
-
-    # Calcular novo saldo
+    # Novo saldo (vazio = mantém o actual)
     try:
-        if balance_raw != "":
-            new_balance = Decimal(str(balance_raw))
-        else:
-            new_balance = old_balance
+        new_balance = Decimal(str(balance_raw)) if balance_raw != "" else None
     except Exception:
         return JsonResponse({"success": False, "message": "Saldo inválido."}, status=400)
 
@@ -380,33 +390,11 @@ def update_company_account(request, account_id):
     account.account_type = acc_type
     account.name = name
     account.account_identifier = account_identifier
-    account.balance = new_balance
-    account.save(update_fields=["account_type", "name", "account_identifier", "balance"])
-
-    # Se o saldo mudou, registar transacção de ajuste manual
-    if new_balance != old_balance:
-        if new_balance > old_balance:
-            tx_type = Transaction.TX_TYPE_IN
-            amount = new_balance - old_balance
-            desc = f"Ajuste manual de saldo (+{amount})"
-        else:
-            tx_type = Transaction.TX_TYPE_OUT
-            amount = old_balance - new_balance
-            desc = f"Ajuste manual de saldo (-{amount})"
-
-        Transaction.objects.create(
-            company_account=account,
-            tx_type=tx_type,
-            source_type="manual",
-            source_id=None,
-            tx_date=timezone.localdate(),
-            description=desc,
-            amount=amount,
-            balance_before=old_balance,
-            balance_after=new_balance,
-            is_active=True,
-            created_at=timezone.now(),
-        )
+    account.save(update_fields=["account_type", "name", "account_identifier"])
+
+    # Se o saldo mudou, lançar a diferença como ajuste manual (sob lock da conta)
+    if new_balance is not None:
+        set_account_balance(account, new_balance)
 
     return JsonResponse({"success": True, "message": "Conta actualizada com sucesso."})
 
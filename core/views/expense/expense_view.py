@@ -8,12 +8,17 @@ from core.models import (
     CompanyAccount,
     ExpenseCategory,
     Expense,
+    PnlMonthly,
     Transaction,
 )
 from django.views.decorators.http import require_POST
+from django.db import transaction as db_transaction
 import os
 from django.http import JsonResponse, FileResponse, Http404
 from django.shortcuts import render, get_object_or_404
+from core.services.pnl import apply_pnl_delta
+from core.services.posting import post_transaction
+from core.services.server_list import ServerSideList
 
 #============================================================================================================
 #============================================================================================================
@@ -107,23 +112,32 @@ def deactivate_expense_category(request):
 #============================================================================================================
 
 
+EXPENSE_LIST = ServerSideList(
+    "expenses",
+    Expense.objects.filter(is_active=True).select_related("category", "company_account", "created_by"),
+    "expenses/expense_row.html",
+    row_name="e",
+    search_fields=("description", "category__name", "company_account__name", "created_by__username"),
+    order_fields={0: "id", 1: "expense_date", 2: "category__name", 3: "company_account__name", 5: "amount"},
+    filters={"category": "category_id", "account": "company_account_id"},
+    default_order=(1, "desc"),
+)
+
+
 def expense_list(request):
+    if EXPENSE_LIST.wants_json(request):
+        return EXPENSE_LIST.response(request)
+
     categories = ExpenseCategory.objects.filter(is_active=True).order_by("name")
     company_accounts = CompanyAccount.objects.filter(is_active=True).order_by("name")
 
-    expenses = (
-        Expense.objects.filter(is_active=True)
-        .select_related("category", "company_account", "created_by")
-        .order_by("-expense_date", "-id")
-    )
-
     return render(
         request,
         "expenses/expense_list.html",
         {
             "categories": categories,
             "company_accounts": company_accounts,
-            "expenses": expenses,
+            "list_options": EXPENSE_LIST.js_options(),
             "segment": "expenses",
         },
     )
@@ -135,6 +149,7 @@ def expense_list(request):
 #============================================================================================================
 #============================================================================================================
 @require_POST
+@db_transaction.atomic
 def create_expense(request):
     category_id = request.POST.get("category", "").strip()
     company_account_id = request.POST.get("company_account", "").strip()
@@ -178,17 +193,13 @@ def create_expense(request):
 
     # Validar formato da data
     try:
-        timezone.datetime.strptime(expense_date, "%Y-%m-%d")
+        expense_day = timezone.datetime.strptime(expense_date, "%Y-%m-%d").date()
     except ValueError:
         return JsonResponse(
             {"success": False, "message": "Data inválida."},
             status=400,
         )
 
-    # Saldo antes
-    old_balance = company_account.balance or Decimal("0")
-    new_balance = old_balance - amount
-
     # Criar despesa
     expense = Expense(
         category=category,
@@ -204,23 +215,22 @@ def create_expense(request):
         expense.attachment = attachment_file
     expense.save()
 
-    # Actualizar saldo da conta
-    company_account.balance = new_balance
-    company_account.save(update_fields=["balance"])
-
-    # Criar transacção (saída)
-    Transaction.objects.create(
-        company_account=company_account,
-        tx_type=Transaction.TX_TYPE_OUT,
+    # Saída da conta da empresa (saldo + transacção)
+    post_transaction(
+        company_account,
+        Transaction.TX_TYPE_OUT,
+        amount,
+        expense_date,
+        f"Despesa: {description}",
         source_type="expense",
         source_id=expense.id,
-        tx_date=expense_date,
-        description=f"Despesa: {description}",
-        amount=amount,
-        balance_before=old_balance,
-        balance_after=new_balance,
-        is_active=True,
-        created_at=timezone.now(),
+    )
+    apply_pnl_delta(
+        PnlMonthly.LINE_EXPENSE,
+        expense_day,
+        amount,
+        company_account.id,
+        category_id=category.id,
     )
 
     return JsonResponse(
@@ -14,10 +14,15 @@ from core.models import (
     Expense,
     IncomeCategory,
     Income,
+    PnlMonthly,
     Transaction,
 )
 import os
+from django.db import transaction as db_transaction
 from django.http import JsonResponse, FileResponse, Http404
+from core.services.pnl import apply_pnl_delta
+from core.services.posting import post_transaction
+from core.services.server_list import ServerSideList
 
 
 #============================================================================================================
@@ -115,23 +120,32 @@ def toggle_income_category_status(request):
     )
 #============================================================================================================
 #============================================================================================================
+INCOME_LIST = ServerSideList(
+    "incomes",
+    Income.objects.filter(is_active=True).select_related("category", "company_account", "created_by"),
+    "incomes/income_row.html",
+    row_name="i",
+    search_fields=("description", "category__name", "company_account__name", "created_by__username"),
+    order_fields={0: "id", 1: "income_date", 2: "category__name", 3: "company_account__name", 5: "amount"},
+    filters={"category": "category_id", "account": "company_account_id"},
+    default_order=(1, "desc"),
+)
+
+
 def income_list(request):
+    if INCOME_LIST.wants_json(request):
+        return INCOME_LIST.response(request)
+
     categories = IncomeCategory.objects.filter(is_active=True).order_by("name")
     company_accounts = CompanyAccount.objects.filter(is_active=True).order_by("name")
 
-    incomes = (
-        Income.objects.filter(is_active=True)
-        .select_related("category", "company_account", "created_by")
-        .order_by("-income_date", "-id")
-    )
-
     return render(
         request,
         "incomes/income_list.html",
         {
             "categories": categories,
             "company_accounts": company_accounts,
-            "incomes": incomes,
+            "list_options": INCOME_LIST.js_options(),
             "segment": "incomes",
         },
     )
@@ -140,6 +154,7 @@ def income_list(request):
 #============================================================================================================
 #============================================================================================================
 @require_POST
+@db_transaction.atomic
 def create_income(request):
     category_id = request.POST.get("category", "").strip()
     company_account_id = request.POST.get("company_account", "").strip()
@@ -183,17 +198,13 @@ def create_income(request):
 
     # Validar formato da data
     try:
-        timezone.datetime.strptime(income_date, "%Y-%m-%d")
+        income_day = timezone.datetime.strptime(income_date, "%Y-%m-%d").date()
     except ValueError:
         return JsonResponse(
             {"success": False, "message": "Data inválida."},
             status=400,
         )
 
-    # Saldo antes
-    old_balance = company_account.balance or Decimal("0")
-    new_balance = old_balance + amount
-
     # Criar rendimento
     income = Income(
         category=category,
@@ -209,23 +220,22 @@ def create_income(request):
         income.attachment = attachment_file
     income.save()
 
-    # Actualizar saldo
-    company_account.balance = new_balance
-    company_account.save(update_fields=["balance"])
-
-    # Criar transacção (entrada)
-    Transaction.objects.create(
-        company_account=company_account,
-        tx_type=Transaction.TX_TYPE_IN,
+    # Entrada na conta da empresa (saldo + transacção)
+    post_transaction(
+        company_account,
+        Transaction.TX_TYPE_IN,
+        amount,
+        income_date,
+        f"Rendimento: {description}",
         source_type="income",
         source_id=income.id,
-        tx_date=income_date,
-        description=f"Rendimento: {description}",
-        amount=amount,
-        balance_before=old_balance,
-        balance_after=new_balance,
-        is_active=True,
-        created_at=timezone.now(),
+    )
+    apply_pnl_delta(
+        PnlMonthly.LINE_INCOME,
+        income_day,
+        amount,
+        company_account.id,
+        category_id=category.id,
     )
 
     return JsonResponse(
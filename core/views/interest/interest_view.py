@@ -1,4 +1,5 @@
-from django.views.decorators.http import require_POST
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST, require_http_methods
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
 from django.utils import timezone
@@ -6,6 +7,7 @@ from decimal import Decimal
 from django.shortcuts import render, get_object_or_404
 
 from core.models import InterestType
+from core.services.amortization import CALCULATION_METHODS, ScheduleError, build_schedule, parse_terms
 
 
 #============================================================================================================
@@ -45,6 +47,12 @@ def create_interest_type(request):
             status=400,
         )
 
+    if calculation_method not in CALCULATION_METHODS:
+        return JsonResponse(
+            {"success": False, "message": "Método de cálculo inválido."},
+            status=400,
+        )
+
     try:
         rate = Decimal(str(rate_raw))
     except Exception:
@@ -79,6 +87,28 @@ def interest_calculator(request):
     )
 
 
+@login_required
+@require_http_methods(["GET"])
+def interest_schedule(request):
+    """
+    Quadro de amortização (services/amortization.py) em JSON — usado pelo
+    simulador e pelo formulário de novo empréstimo.
+    Parâmetros GET: interest_type, principal, periods, period_type,
+    payment (opcional; por omissão a prestação sugerida), start_date (opcional).
+    """
+    it_id = (request.GET.get("interest_type") or "").strip()
+    interest_type = InterestType.objects.filter(pk=it_id).first() if it_id.isdigit() else None
+    if interest_type is None:
+        return JsonResponse({"success": False, "message": "Selecione um tipo de juro."}, status=400)
+
+    try:
+        schedule = build_schedule(parse_terms(request.GET, interest_type))
+    except ScheduleError as exc:
+        return JsonResponse({"success": False, "message": str(exc)}, status=400)
+
+    return JsonResponse({"success": True, "message": "", "schedule": schedule.as_dict()})
+
+
 
 #============================================================================================================
 #============================================================================================================
@@ -116,6 +146,12 @@ def update_interest_type(request):
             status=400,
         )
 
+    if calculation_method not in CALCULATION_METHODS:
+        return JsonResponse(
+            {"success": False, "message": "Método de cálculo inválido."},
+            status=400,
+        )
+
     try:
         rate = Decimal(str(rate_raw))
     except Exception:
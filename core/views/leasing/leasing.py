@@ -8,6 +8,7 @@ from django.http import JsonResponse
 from django.shortcuts import render
 
 from core.models import LeasedVehicle
+from core.services.leasing_kpis import fleet_kpis, invalidate_leasing_kpis
 
 
 @login_required
@@ -17,17 +18,15 @@ def leased_vehicle_list(request):
     """
     vehicles = LeasedVehicle.objects.all().order_by("plate_number")
 
-    kpi_total = vehicles.count()
-    kpi_available = vehicles.filter(status="available").count()
-    kpi_leased = vehicles.filter(status="leased").count()
-    kpi_maintenance = vehicles.filter(status="maintenance").count()
+    # KPIs (uma só query, ver services/leasing_kpis.py)
+    kpis = fleet_kpis()
 
     context = {
         "vehicles": vehicles,
-        "kpi_total": kpi_total,
-        "kpi_available": kpi_available,
-        "kpi_leased": kpi_leased,
-        "kpi_maintenance": kpi_maintenance,
+        "kpi_total": kpis["total"],
+        "kpi_available": kpis["available"],
+        "kpi_leased": kpis["leased"],
+        "kpi_maintenance": kpis["maintenance"],
         "segment": "vehicle_lease_fleet",
     }
     return render(request, "leasing/leased_vehicle_list.html", context)
@@ -110,6 +109,7 @@ def create_leased_vehicle(request):
         status=status,
         notes=notes or None,
     )
+    invalidate_leasing_kpis()
 
     return JsonResponse(
         {"success": True, "message": "Viatura em leasing criada com sucesso."}
@@ -2,7 +2,6 @@ from decimal import Decimal
 from datetime import datetime
 
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
 from django.db import transaction as db_transaction
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
@@ -13,32 +12,63 @@ from core.models import (
     Member,
     CompanyAccount,
 )
+from core.services.lease_allocation import open_lease_coverage
+from core.services.lease_schedule import LEASE_STATES, annotate_lease_schedule, filter_lease_state, fleet_arrears
+from core.services.leasing_kpis import contract_kpis, invalidate_leasing_kpis
+from core.services.server_list import ServerSideList
+from core.services.vehicle_profitability import rebuild_vehicle_profitability
 # ======================================================================================================================
 # ======================================================================================================================
 
+
+class LeaseContractList(ServerSideList):
+    """
+    Contratos com o plano semanal (services/lease_schedule.py) anotado à
+    data do pedido: atraso em semanas e em valor, ordenáveis e filtráveis.
+    """
+
+    def get_queryset(self, request):
+        return annotate_lease_schedule(self.queryset.all())
+
+
+VEHICLE_LEASE_CONTRACT_LIST = LeaseContractList(
+    "vehicle_lease_contracts",
+    VehicleLeaseContract.objects.select_related("leased_vehicle", "driver", "company_account"),
+    "leasing/vehicle_lease_contract_row.html",
+    row_name="c",
+    search_fields=(
+        "leased_vehicle__plate_number",
+        "leased_vehicle__model",
+        "driver__first_name",
+        "driver__last_name",
+        "driver__phone",
+        "company_account__name",
+    ),
+    order_fields={
+        0: "id",
+        3: "weekly_rent",
+        4: "start_date",
+        6: "lease_weeks_overdue",
+        7: "lease_balance",
+    },
+    filters={"status": "status", "account": "company_account_id", "state": filter_lease_state},
+    default_order=(0, "desc"),
+)
+
+
 @login_required
 def vehicle_lease_contract_list(request):
     """
     Lista de contratos de leasing de veículos + modal para novo contrato.
+    As linhas são servidas pelo mesmo URL em JSON (VEHICLE_LEASE_CONTRACT_LIST),
+    com as rendas em atraso de cada contrato.
     """
-    contracts = (
-        VehicleLeaseContract.objects
-        .select_related("leased_vehicle", "driver", "company_account")
-        .order_by("-id")
-    )
+    if VEHICLE_LEASE_CONTRACT_LIST.wants_json(request):
+        return VEHICLE_LEASE_CONTRACT_LIST.response(request)
 
-    # KPIs
-    kpi_total = contracts.count()
-    kpi_active = contracts.filter(status="active").count()
-    kpi_weekly_sum = contracts.filter(status="active").aggregate(
-        total=Sum("weekly_rent")
-    )["total"] or Decimal("0")
-    kpi_vehicles_in_leasing = (
-        contracts.filter(status="active")
-        .values("leased_vehicle_id")
-        .distinct()
-        .count()
-    )
+    # KPIs (uma só query, ver services/leasing_kpis.py) + rendas em atraso
+    kpis = contract_kpis()
+    lease_fleet = fleet_arrears()
 
     # Para o modal de novo contrato:
     available_vehicles = LeasedVehicle.objects.filter(status="available").order_by("plate_number")
@@ -46,11 +76,13 @@ def vehicle_lease_contract_list(request):
     company_accounts = CompanyAccount.objects.filter(is_active=True).order_by("name")
 
     context = {
-        "contracts": contracts,
-        "kpi_total": kpi_total,
-        "kpi_active": kpi_active,
-        "kpi_weekly_sum": kpi_weekly_sum,
-        "kpi_vehicles_in_leasing": kpi_vehicles_in_leasing,
+        "list_options": VEHICLE_LEASE_CONTRACT_LIST.js_options(),
+        "lease_states": [(key, label) for key, (label, _) in LEASE_STATES.items()],
+        "lease_fleet": lease_fleet,
+        "kpi_total": kpis["total"],
+        "kpi_active": kpis["active"],
+        "kpi_weekly_sum": kpis["weekly_sum"],
+        "kpi_vehicles_in_leasing": kpis["vehicles_in_leasing"],
         "available_vehicles": available_vehicles,
         "drivers": drivers,
         "company_accounts": company_accounts,
@@ -154,10 +186,13 @@ def create_vehicle_lease_contract(request):
         created_by=request.user,
         notes=notes or None,
     )
+    open_lease_coverage(contract)
 
     # marcar viatura como "leased"
     leased_vehicle.status = "leased"
     leased_vehicle.save(update_fields=["status"])
+    rebuild_vehicle_profitability([leased_vehicle.id])
+    invalidate_leasing_kpis()
 
     return JsonResponse(
         {"success": True, "message": f"Contrato #{contract.id} criado com sucesso."}
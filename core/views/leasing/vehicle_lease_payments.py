@@ -1,10 +1,9 @@
 
-from datetime import date, datetime
-from decimal import Decimal
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
 from django.contrib.auth.decorators import login_required
 from django.db import transaction as db_transaction
-from django.db.models import Sum
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
@@ -13,8 +12,42 @@ from core.models import (
     VehicleLeaseContract,
     VehicleLeasePayment,
     CompanyAccount,
+    PnlMonthly,
     Transaction,
 )
+from core.services.kpi_snapshot import apply_kpi_delta
+from core.services.lease_allocation import coverage_summary, record_lease_payment
+from core.services.lease_collection import collection_sheet, parse_amount, post_lease_collection
+from core.services.leasing_kpis import invalidate_leasing_kpis, payment_kpis
+from core.services.pnl import apply_pnl_delta
+from core.services.posting import post_transaction
+from core.services.server_list import ServerSideList
+from core.services.vehicle_profitability import record_vehicle_revenue
+
+
+VEHICLE_LEASE_PAYMENT_LIST = ServerSideList(
+    "vehicle_lease_payments",
+    VehicleLeasePayment.objects.select_related(
+        "contract",
+        "contract__leased_vehicle",
+        "driver",
+        "company_account",
+        "created_by",
+    ),
+    "leasing/vehicle_lease_payment_row.html",
+    row_name="p",
+    search_fields=(
+        "contract__leased_vehicle__plate_number",
+        "driver__first_name",
+        "driver__last_name",
+        "driver__phone",
+        "company_account__name",
+        "method",
+    ),
+    order_fields={0: "id", 1: "contract_id", 4: "payment_date", 5: "amount"},
+    filters={"contract": "contract_id", "account": "company_account_id"},
+    default_order=(4, "desc"),
+)
 
 
 @login_required
@@ -22,32 +55,18 @@ def vehicle_lease_payment_list(request):
     """
     Lista de pagamentos de leasing de veículos +
     modal para registar novo pagamento.
+    As linhas são servidas pelo mesmo URL em JSON (VEHICLE_LEASE_PAYMENT_LIST).
     """
+    if VEHICLE_LEASE_PAYMENT_LIST.wants_json(request):
+        return VEHICLE_LEASE_PAYMENT_LIST.response(request)
 
-    payments = (
-        VehicleLeasePayment.objects
-        .select_related(
-            "contract",
-            "contract__leased_vehicle",
-            "contract__driver",
-            "company_account",
-            "created_by",
-        )
-        .order_by("-payment_date", "-id")
-    )
-
-    # KPIs
-    kpi_total_pagamentos = payments.count()
-    kpi_total_valor = payments.aggregate(total=Sum("amount"))["total"] or Decimal("0")
-
-    today = date.today()
-    primeiro_dia_mes = today.replace(day=1)
-    pagamentos_mes = payments.filter(payment_date__gte=primeiro_dia_mes)
-    kpi_total_mes = pagamentos_mes.aggregate(total=Sum("amount"))["total"] or Decimal("0")
+    # KPIs (uma só query, ver services/leasing_kpis.py)
+    today = timezone.localdate()
+    kpis = payment_kpis(today)
 
     active_contracts = (
         VehicleLeaseContract.objects
-        .select_related("leased_vehicle", "driver")
+        .select_related("leased_vehicle", "driver", "coverage")
         .filter(status="active")
         .order_by("leased_vehicle__plate_number")
     )
@@ -55,10 +74,10 @@ def vehicle_lease_payment_list(request):
     company_accounts = CompanyAccount.objects.filter(is_active=True).order_by("name")
 
     context = {
-        "payments": payments,
-        "kpi_total_pagamentos": kpi_total_pagamentos,
-        "kpi_total_valor": kpi_total_valor,
-        "kpi_total_mes": kpi_total_mes,
+        "list_options": VEHICLE_LEASE_PAYMENT_LIST.js_options(),
+        "kpi_total_pagamentos": kpis["total"],
+        "kpi_total_valor": kpis["total_amount"],
+        "kpi_total_mes": kpis["month_amount"],
         "active_contracts": active_contracts,
         "company_accounts": company_accounts,
         "segment": "vehicle_lease_payments",
@@ -75,7 +94,9 @@ def vehicle_lease_payment_list(request):
 def create_vehicle_lease_payment(request):
     """
     Regista um pagamento de leasing de viatura (via AJAX).
-    Cria movimento de entrada na conta da empresa + Transaction.
+    Cria movimento de entrada na conta da empresa + Transaction e imputa
+    o valor às semanas do contrato (services/lease_allocation.py) e à
+    rentabilidade da viatura (services/vehicle_profitability.py).
     """
     if request.method != "POST":
         return JsonResponse({"success": False, "message": "Método inválido."}, status=405)
@@ -123,10 +144,6 @@ def create_vehicle_lease_payment(request):
             status=400,
         )
 
-    # saldo antes
-    balance_before = company_account.balance
-    balance_after = balance_before + amount
-
     # pagamento
     payment = VehicleLeasePayment.objects.create(
         contract=contract,
@@ -139,29 +156,110 @@ def create_vehicle_lease_payment(request):
         created_by=request.user,  # <<< AQUI
     )
 
-    # actualizar saldo
-    company_account.balance = balance_after
-    company_account.save(update_fields=["balance"])
-
-    # registar transacção
-    Transaction.objects.create(
-        company_account=company_account,
-        tx_type=Transaction.TX_TYPE_IN,
-        source_type="vehicle_lease_payment",
-        source_id=payment.id,
-        tx_date=payment_date,
-        description=(
+    # entrada na conta da empresa (saldo + transacção)
+    post_transaction(
+        company_account,
+        Transaction.TX_TYPE_IN,
+        amount,
+        payment_date,
+        (
             f"Leasing Viatura · Contrato #{contract.id} · "
             f"{contract.leased_vehicle.plate_number}"
         ),
-        amount=amount,
-        balance_before=balance_before,
-        balance_after=balance_after,
-        is_active=True,
-        created_at=timezone.now(),
-        created_by=request.user,  # se já tens o campo criado em Transaction
+        source_type="vehicle_lease_payment",
+        source_id=payment.id,
+        created_by=request.user,
     )
 
-    return JsonResponse(
-        {"success": True, "message": "Pagamento de leasing registado com sucesso."}
-    )
\ No newline at end of file
+    apply_kpi_delta(flow_date=payment_date, vehicle_lease_amount=amount)
+    apply_pnl_delta(PnlMonthly.LINE_LEASE_REVENUE, payment_date, amount, company_account.id)
+    record_lease_payment(contract, payment)
+    record_vehicle_revenue(contract, payment)
+    invalidate_leasing_kpis()
+
+    message = "Pagamento de leasing registado com sucesso."
+    paid_until = coverage_summary(contract)["paid_until"]
+    if paid_until:
+        message += f" Semanas pagas até {paid_until:%d/%m/%Y}."
+
+    return JsonResponse({"success": True, "message": message})
+
+# ======================================================================================================================
+# ======================================================================================================================
+
+@login_required
+def vehicle_lease_collection(request):
+    """
+    Cobrança semanal em lote: grelha com todos os contratos activos e a
+    renda semanal pré-preenchida; registada por post_vehicle_lease_collection.
+    """
+    today = timezone.localdate()
+    contracts = collection_sheet(today)
+
+    context = {
+        "contracts": contracts,
+        "company_accounts": CompanyAccount.objects.filter(is_active=True).order_by("name"),
+        "methods": VehicleLeasePayment.METHOD_CHOICES,
+        "segment": "vehicle_lease_payments",
+        "today": today,
+    }
+    return render(request, "leasing/vehicle_lease_collection.html", context)
+
+
+@login_required
+def post_vehicle_lease_collection(request):
+    """
+    Regista a grelha de cobrança (via AJAX) numa única transacção
+    (services/lease_collection.py). Campos por contrato: amount_<id> e,
+    opcionalmente, account_<id>; células vazias ou a zero são ignoradas.
+    """
+    if request.method != "POST":
+        return JsonResponse({"success": False, "message": "Método inválido."}, status=405)
+
+    try:
+        payment_date = datetime.strptime(request.POST.get("payment_date", "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return JsonResponse(
+            {"success": False, "message": "Data de pagamento inválida."},
+            status=400,
+        )
+    method = request.POST.get("method", "").strip() or "cash"
+
+    entries = []
+    for key, value in request.POST.items():
+        if not key.startswith("amount_"):
+            continue
+        contract_id = key[len("amount_"):]
+        try:
+            amount = parse_amount(value)
+            contract_id = int(contract_id)
+        except (InvalidOperation, ValueError):
+            return JsonResponse(
+                {"success": False, "message": f"Valor inválido no contrato #{contract_id}."},
+                status=400,
+            )
+        if amount is None:
+            continue
+        account_raw = request.POST.get(f"account_{contract_id}", "").strip()
+        entries.append((contract_id, amount, int(account_raw) if account_raw.isdigit() else None))
+
+    if not entries:
+        return JsonResponse(
+            {"success": False, "message": "Indique o valor cobrado de pelo menos um contrato."},
+            status=400,
+        )
+
+    result = post_lease_collection(entries, payment_date, method=method, user=request.user)
+    if result.posted:
+        invalidate_leasing_kpis()
+    else:
+        return JsonResponse(
+            {
+                "success": False,
+                "message": result.summary,
+                "errors": [row.as_dict() for row in result.error_rows],
+            },
+            status=400,
+        )
+
+    return JsonResponse({"success": True, "message": result.summary})
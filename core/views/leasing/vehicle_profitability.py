@@ -0,0 +1,68 @@
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+from django.utils import timezone
+
+from core.models import LeasedVehicle
+from core.services.server_list import ServerSideList
+from core.services.vehicle_profitability import (
+    PAYBACK_STATES,
+    annotate_profitability,
+    filter_payback_state,
+    fleet_profitability,
+    projected_payback_date,
+)
+
+
+class VehicleProfitabilityList(ServerSideList):
+    """
+    Viaturas com a rentabilidade (sl_vehicle_profitability) anotada: o custo
+    de cada página é o mesmo qualquer que seja o histórico de pagamentos.
+    """
+
+    def get_queryset(self, request):
+        return annotate_profitability(self.queryset.all())
+
+    def render_row(self, request, obj, context):
+        obj.vp_projected_payback = projected_payback_date(obj)
+        return super().render_row(request, obj, context)
+
+
+VEHICLE_PROFITABILITY_LIST = VehicleProfitabilityList(
+    "vehicle_profitability",
+    LeasedVehicle.objects.select_related("profitability"),
+    "leasing/vehicle_profitability_row.html",
+    row_name="v",
+    search_fields=("plate_number", "brand", "model"),
+    order_fields={
+        0: "plate_number",
+        1: "acquisition_cost",
+        2: "vp_revenue",
+        3: "vp_payback_pct",
+        4: "vp_leased_weeks",
+        5: "vp_idle_weeks",
+        6: "vp_weeks_to_payback",
+    },
+    filters={"status": "status", "payback": filter_payback_state},
+    default_order=(2, "desc"),
+)
+
+
+@login_required
+def vehicle_profitability_list(request):
+    """
+    Rentabilidade da frota: receita acumulada de cada viatura face ao custo
+    de aquisição, semanas em leasing / paradas e data prevista de retorno.
+    As linhas são servidas pelo mesmo URL em JSON (VEHICLE_PROFITABILITY_LIST).
+    """
+    if VEHICLE_PROFITABILITY_LIST.wants_json(request):
+        return VEHICLE_PROFITABILITY_LIST.response(request)
+
+    context = {
+        "list_options": VEHICLE_PROFITABILITY_LIST.js_options(),
+        "payback_states": [(key, label) for key, (label, _) in PAYBACK_STATES.items()],
+        "vehicle_statuses": LeasedVehicle.STATUS_CHOICES,
+        "fleet": fleet_profitability(),
+        "today": timezone.localdate(),
+        "segment": "vehicle_lease_profitability",
+    }
+    return render(request, "leasing/vehicle_profitability_list.html", context)
@@ -2,9 +2,13 @@
 from decimal import Decimal
 
 from django.contrib.auth.decorators import login_required
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.shortcuts import render
 
-from core.models import Loan
+from core.models import Loan, LoanDisbursement
+from core.services.money import MONEY_FIELD
+from core.services.server_list import ServerSideList
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 
@@ -12,75 +16,83 @@ from django.shortcuts import get_object_or_404
 
 
 
-@login_required
-def loan_list_all(request):
+def _flat_interest():
+    # Juros simples “flat”: principal * (taxa% * períodos)
+    return ExpressionWrapper(
+        F("principal_amount")
+        * Coalesce(F("interest_type__rate"), Decimal("0"))
+        * Coalesce(F("term_periods"), 1)
+        / Decimal("100"),
+        output_field=MONEY_FIELD,
+    )
+
+
+def _loan_list_all_queryset():
     """
-    Lista TODOS os empréstimos (independentemente do status)
-    + KPIs da carteira.
+    Empréstimos com os valores calculados da listagem em SQL:
+    juros, total a reembolsar e último desembolso — calculados só para as
+    linhas da página pedida.
     """
-    loans_qs = (
+    last_disb = LoanDisbursement.objects.filter(loan_id=OuterRef("pk")).order_by("-disburse_date", "-id")
+    interest = _flat_interest()
+    return (
         Loan.objects
         .select_related("member", "loan_type", "interest_type", "approved_by", "company_account")
-        .prefetch_related("disbursements")
-        .order_by("-created_at")
+        .annotate(
+            total_interest=interest,
+            total_to_repay=ExpressionWrapper(F("principal_amount") + interest, output_field=MONEY_FIELD),
+            disbursed_date=Subquery(last_disb.values("disburse_date")[:1]),
+            disbursed_amount=Subquery(last_disb.values("amount")[:1], output_field=MONEY_FIELD),
+        )
     )
 
-    loans = list(loans_qs)
-
-    total_loans = len(loans)
-    total_principal = Decimal("0")
-    total_to_repay = Decimal("0")
-    total_interest = Decimal("0")
-
-    status_counts = {
-        "pending": 0,
-        "approved": 0,
-        "disbursed": 0,
-        "closed": 0,
-        "cancelled": 0,
-    }
-
-    for loan in loans:
-        principal = loan.principal_amount or Decimal("0")
-        rate = getattr(loan.interest_type, "rate", Decimal("0")) or Decimal("0")
-        periods = loan.term_periods or 1
-
-        # Juros simples “flat”: principal * (taxa% * períodos)
-        interest = (principal * rate * periods) / Decimal("100")
-        total_amount = principal + interest
-
-        loan.total_interest = interest
-        loan.total_to_repay = total_amount
 
-        # Último desembolso (se existir)
-        last_disb = (
-            loan.disbursements.order_by("-disburse_date", "-id").first()
-            if hasattr(loan, "disbursements")
-            else None
-        )
-        loan.disbursed_date = last_disb.disburse_date if last_disb else None
-        loan.disbursed_amount = last_disb.amount if last_disb else None
-        loan.disbursed_company_account = last_disb.company_account if last_disb else None
+LOAN_LIST_ALL = ServerSideList(
+    "loans_all",
+    _loan_list_all_queryset(),
+    "loan/loan_list_all_row.html",
+    row_name="loan",
+    search_fields=("member__first_name", "member__last_name", "member__phone", "member__city", "loan_type__name"),
+    order_fields={0: "id", 1: "created_at", 4: "principal_amount", 8: "release_date", 9: "first_payment_date"},
+    filters={"status": "status"},
+    default_order=(1, "desc"),
+)
 
-        total_principal += principal
-        total_interest += interest
-        total_to_repay += total_amount
 
-        if loan.status in status_counts:
-            status_counts[loan.status] += 1
+@login_required
+def loan_list_all(request):
+    """
+    Lista TODOS os empréstimos (independentemente do status)
+    + KPIs da carteira.
+    As linhas são servidas pelo mesmo URL em JSON (LOAN_LIST_ALL);
+    os KPIs saem de uma só agregação.
+    """
+    if LOAN_LIST_ALL.wants_json(request):
+        return LOAN_LIST_ALL.response(request)
+
+    kpis = Loan.objects.annotate(total_interest=_flat_interest()).aggregate(
+        total_loans=Count("id"),
+        total_principal=Coalesce(Sum("principal_amount"), Decimal("0"), output_field=MONEY_FIELD),
+        total_interest=Coalesce(Sum("total_interest"), Decimal("0"), output_field=MONEY_FIELD),
+        status_pending=Count("id", filter=Q(status="pending")),
+        status_approved=Count("id", filter=Q(status="approved")),
+        status_disbursed=Count("id", filter=Q(status="disbursed")),
+        status_closed=Count("id", filter=Q(status="closed")),
+        status_cancelled=Count("id", filter=Q(status="cancelled")),
+    )
 
     context = {
-        "loans": loans,
+        "list_options": LOAN_LIST_ALL.js_options(),
         "segment": "loans_all",
-        "kpi_total_loans": total_loans,
-        "kpi_total_principal": total_principal,
-        "kpi_total_interest": total_interest,
-        "kpi_total_to_repay": total_to_repay,
-        "kpi_status_pending": status_counts["pending"],
-        "kpi_status_approved": status_counts["approved"],
-        "kpi_status_disbursed": status_counts["disbursed"],
-        "kpi_status_closed": status_counts["closed"],
-        "kpi_status_cancelled": status_counts["cancelled"],
+        "kpi_total_loans": kpis["total_loans"],
+        "kpi_total_principal": kpis["total_principal"],
+        "kpi_total_interest": kpis["total_interest"],
+        "kpi_total_to_repay": kpis["total_principal"] + kpis["total_interest"],
+        "kpi_status_pending": kpis["status_pending"],
+        "kpi_status_approved": kpis["status_approved"],
+        "kpi_status_disbursed": kpis["status_disbursed"],
+        "kpi_status_closed": kpis["status_closed"],
+        "kpi_status_cancelled": kpis["status_cancelled"],
     }
     return render(request, "loan/loan_list_all.html", context)
 
@@ -0,0 +1,28 @@
+# core/views/loan/loan_aging_views.py
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from core.models import CompanyAccount
+from core.services.loan_aging import portfolio_aging
+
+
+#============================================================================================================
+#============================================================================================================
+
+@login_required
+@require_http_methods(["GET"])
+def loan_aging_data(request):
+    """
+    Antiguidade dos atrasos (escalões, PAR 30/60/90 e por gestor) em JSON.
+    Parâmetro GET opcional: company_account.
+    """
+    account_id = (request.GET.get("company_account") or "").strip() or None
+    if account_id is not None:
+        if not account_id.isdigit() or not CompanyAccount.objects.filter(pk=account_id).exists():
+            return JsonResponse({"success": False, "message": "Conta da empresa inválida."}, status=400)
+        account_id = int(account_id)
+
+    aging = portfolio_aging(company_account_id=account_id)
+    return JsonResponse({"success": True, **aging.as_dict()})
@@ -4,17 +4,22 @@ from django.views.decorators.http import require_http_methods
 from django.contrib.auth import get_user_model
 from datetime import datetime
 
+from django.db import transaction as db_transaction
 from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 
 from core.models import Member, LoanType, InterestType, CompanyAccount, Loan, LoanGuarantor, LoanGuarantee, Transaction, LoanPaymentRequest
+from core.services.amortization import METHOD_FLAT, LoanTerms, ScheduleError, build_schedule
+from core.services.kpi_snapshot import apply_kpi_delta, loan_interest_total
+from core.services.server_list import ServerSideList
 #============================================================================================================
 #============================================================================================================
 
 @login_required
 @require_http_methods(["GET", "POST"])
+@db_transaction.atomic
 def new_loan(request):
     members = Member.objects.filter(is_active=True).order_by("first_name", "last_name")
     loan_types = LoanType.objects.filter(is_active=True).order_by("name")
@@ -109,11 +114,9 @@ def new_loan(request):
             except Exception:
                 errors["term_periods"] = "Número de períodos inválido."
 
-        # Payment per period
+        # Payment per period (vazio = prestação sugerida pelo quadro de amortização)
         payment_per_period = None
-        if not payment_raw:
-            errors["payment_per_period"] = "Informe o pagamento por ciclo (pode usar o sugerido)."
-        else:
+        if payment_raw:
             try:
                 payment_per_period = Decimal(str(payment_raw))
                 if payment_per_period <= 0:
@@ -121,6 +124,24 @@ def new_loan(request):
             except Exception:
                 errors["payment_per_period"] = "Pagamento por ciclo inválido."
 
+        if interest_type and principal_amount and term_periods and "payment_per_period" not in errors:
+            try:
+                schedule = build_schedule(LoanTerms(
+                    principal=principal_amount,
+                    rate=interest_type.rate,
+                    periods=term_periods,
+                    period_type=period_type,
+                    method=interest_type.calculation_method or METHOD_FLAT,
+                    rate_period_type=interest_type.period_type,
+                    payment=payment_per_period,
+                ).validate())
+            except ScheduleError as exc:
+                errors["payment_per_period"] = str(exc)
+            else:
+                payment_per_period = payment_per_period or schedule.payment
+        elif not payment_raw:
+            errors["payment_per_period"] = "Informe o pagamento por ciclo (pode usar o sugerido)."
+
         # Disburse / conta
         company_account = None
         if disburse_method in ("company_account", "mobile_wallet"):
@@ -152,6 +173,8 @@ def new_loan(request):
                 status="pending",
                 created_by=request.user if request.user.is_authenticated else None,
             )
+
+            apply_kpi_delta(portfolio_total=loan.principal_amount, loans_pending=1)
             
             # --- Garantias (opcional) ---
             has_guarantee_data = any([
@@ -234,18 +257,26 @@ def new_loan(request):
 #============================================================================================================
 #============================================================================================================
 
+PENDING_LOAN_LIST = ServerSideList(
+    "loans_pending",
+    Loan.objects.select_related("member", "loan_type", "created_by").filter(status="pending"),
+    "loan/pending_loan_row.html",
+    row_name="loan",
+    search_fields=("member__first_name", "member__last_name", "member__phone", "loan_type__name"),
+    order_fields={0: "id", 3: "principal_amount", 4: "payment_per_period", 5: "term_periods"},
+)
+
+
 def pending_loans_list(request):
     """
     Lista de empréstimos com status 'pending'.
+    As linhas são servidas pelo mesmo URL em JSON (PENDING_LOAN_LIST).
     """
-    loans = (
-        Loan.objects
-        .select_related("member", "loan_type", "interest_type", "created_by")
-        .filter(status="pending")
-        .order_by("-id")
-    )
+    if PENDING_LOAN_LIST.wants_json(request):
+        return PENDING_LOAN_LIST.response(request)
+
     context = {
-        "loans": loans,
+        "list_options": PENDING_LOAN_LIST.js_options(),
         "segment": "loans_pending",
     }
     
@@ -255,8 +286,9 @@ def pending_loans_list(request):
 #============================================================================================================
 #============================================================================================================
 @require_POST
+@db_transaction.atomic
 def confirm_loan(request, loan_id):
-    loan = get_object_or_404(Loan, pk=loan_id)
+    loan = get_object_or_404(Loan.objects.select_for_update(), pk=loan_id)
 
     if loan.status != "pending":
         return JsonResponse(
@@ -268,6 +300,13 @@ def confirm_loan(request, loan_id):
     loan.approved_by = request.user         
     loan.save(update_fields=["status", "approved_by"])
 
+    apply_kpi_delta(
+        loans_pending=-1,
+        loans_approved=1,
+        outstanding_principal=loan.principal_amount,
+        interest_to_receive=loan_interest_total(loan),
+    )
+
     return JsonResponse(
         {"success": True, "message": "Empréstimo confirmado. Agora pode ser desembolsado na secção Desembolso."}
     )
@@ -276,12 +315,13 @@ def confirm_loan(request, loan_id):
 #============================================================================================================
 #============================================================================================================
 @require_POST
+@db_transaction.atomic
 def reject_loan(request, loan_id):
     """
     Rejeita um empréstimo pendente.
     Muda o status para 'cancelled'.
     """
-    loan = get_object_or_404(Loan, pk=loan_id)
+    loan = get_object_or_404(Loan.objects.select_for_update(), pk=loan_id)
 
     if loan.status != "pending":
         return JsonResponse(
@@ -295,6 +335,12 @@ def reject_loan(request, loan_id):
     loan.status = "cancelled"
     loan.save(update_fields=["status"])
 
+    apply_kpi_delta(
+        loans_pending=-1,
+        loans_cancelled=1,
+        portfolio_total=-loan.principal_amount,
+    )
+
     return JsonResponse(
         {
             "success": True,
@@ -4,6 +4,7 @@ from core.models import Member, Loan
 from django.urls import reverse
 from django.http import JsonResponse
 from datetime import datetime
+from core.services.server_list import ServerSideList
 
 
 def add_member(request):
@@ -100,21 +101,32 @@ def add_member(request):
 
 #============================================================================================================
 #============================================================================================================
+MEMBER_LIST = ServerSideList(
+    "members",
+    Member.objects.filter(is_active=True).select_related("manager"),
+    "member/member_row.html",
+    row_name="m",
+    search_fields=(
+        "first_name", "last_name", "legal_name", "phone", "email", "city",
+        "manager__first_name", "manager__last_name", "manager__username",
+    ),
+    order_fields={0: "id", 1: "first_name", 3: "phone", 5: "city"},
+    filters={"manager": "manager_id"},
+)
+
+
 def member_list(request):
+    if MEMBER_LIST.wants_json(request):
+        return MEMBER_LIST.response(request)
+
     User = get_user_model()
     gestores = User.objects.filter(is_active=True).order_by("first_name", "last_name")
-    members = (
-        Member.objects.filter(is_active=True)
-        .select_related("manager")
-        .prefetch_related("loans")
-        .order_by("-id")
-    )
     return render(
         request,
         "member/list_members.html",
         {
-            "members": members,
             "gestores": gestores,
+            "list_options": MEMBER_LIST.js_options(),
             "segment": "members_list",
         },
     )
@@ -1,6 +1,5 @@
 from decimal import Decimal
 from datetime import datetime
-from django.utils import timezone
 from django.contrib.auth.decorators import login_required
 from django.db import transaction as db_transaction
 from django.http import JsonResponse
@@ -14,6 +13,9 @@ from core.models import (
     CompanyAccount,
     Transaction,
 )
+from core.services.kpi_snapshot import apply_kpi_delta
+from core.services.loan_balances import open_loan_balance
+from core.services.posting import lock_account, post_transaction
 
 #============================================================================================================
 #============================================================================================================
@@ -94,7 +96,7 @@ def register_disbursement(request, loan_id):
     - regista opcionalmente o nome/número da conta do cliente utilizada
     """
     loan = get_object_or_404(
-        Loan.objects.select_related("member"),
+        Loan.objects.select_related("member").select_for_update(),
         pk=loan_id
     )
 
@@ -128,8 +130,10 @@ def register_disbursement(request, loan_id):
             status=400,
         )
     try:
-        account = CompanyAccount.objects.get(pk=company_account_id, is_active=True)
-    except CompanyAccount.DoesNotExist:
+        # Bloqueia a conta até ao fim da transacção: o saldo verificado abaixo
+        # é o mesmo sobre o qual a saída é lançada
+        account = lock_account(company_account_id)
+    except (CompanyAccount.DoesNotExist, ValueError):
         return JsonResponse(
             {"success": False, "message": "Conta da empresa inválida."},
             status=400,
@@ -192,12 +196,6 @@ def register_disbursement(request, loan_id):
         notes=notes or None,
     )
 
-    # Actualizar saldo da conta
-    old_balance = current_balance
-    account.balance = old_balance - amount
-    account.save(update_fields=["balance"])
-    new_balance = account.balance
-
     # Descrição da transacção, incluindo info da conta do cliente (se fornecida)
     desc = (
         f"Desembolso de empréstimo (Loan #{loan.id}) "
@@ -211,23 +209,28 @@ def register_disbursement(request, loan_id):
         if client_account_number:
             desc += f" ({client_account_number})"
 
-    # Transacção de saída
-    Transaction.objects.create(
-        company_account=account,
-        tx_type=Transaction.TX_TYPE_OUT,
+    # Saída da conta da empresa (saldo + Transaction)
+    post_transaction(
+        account,
+        Transaction.TX_TYPE_OUT,
+        amount,
+        disburse_date,
+        desc,
         source_type="loan_disbursement",
         source_id=disb.id,
-        tx_date=disburse_date,
-        description=desc,
-        amount=amount,
-        balance_before=old_balance,
-        balance_after=new_balance,
-        is_active=True,
-        created_at=timezone.now(),
+        require_funds=True,
     )
 
     loan.status = "disbursed"
     loan.save(update_fields=["status"])
+    open_loan_balance(loan)
+
+    apply_kpi_delta(
+        flow_date=disburse_date,
+        loans_approved=-1,
+        loans_disbursed=1,
+        disbursements_amount=amount,
+    )
 
     return JsonResponse(
         {"success": True, "message": "Desembolso registado com sucesso."}
@@ -1,7 +1,6 @@
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
 from django.contrib.auth.decorators import login_required
 from django.db import transaction as db_transaction
-from django.db.models import Sum, Q
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
@@ -12,8 +11,20 @@ from core.models import (
     Loan,
     LoanRepayment,
     CompanyAccount,
+    PnlMonthly,
     Transaction,
 )
+from core.services.kpi_snapshot import apply_kpi_delta, loan_interest_total
+from core.services.loan_balances import last_repayments_for, record_repayment, state_from_balance
+from core.services.pnl import apply_pnl_delta
+from core.services.posting import post_transaction
+from core.services.repayment_import import import_repayments
+from core.services.repayment_state import (
+    RepaymentRuleError,
+    allocate_repayment,
+    apply_repayment_state,
+    repayment_states,
+)
 
 #=================================================================================================
 #=================================================================================================
@@ -28,15 +39,26 @@ def loan_repayment_list(request):
     - validade (loan.first_payment_date)
     """
 
-    loans_qs = (
+    # Uma query: empréstimo + cliente/tipos + saldo (LoanBalance) + último pagamento.
+    # O estado do ciclo sai da linha de LoanBalance; os reembolsos só são lidos
+    # para os empréstimos ainda sem linha (antes de `manage.py rebuild_loan_balances`),
+    # sem escrever na base
+    loans = list(
         Loan.objects
-        .select_related("member", "loan_type", "interest_type", "approved_by")
-        .prefetch_related("repayments", "repayments__company_account")
+        .select_related(
+            "member",
+            "loan_type",
+            "interest_type",
+            "approved_by",
+            "balance_summary__last_repayment",
+        )
         .filter(status="disbursed")
         .order_by("-id")
     )
 
-    loans = list(loans_qs)
+    missing_ids = [loan.id for loan in loans if getattr(loan, "balance_summary", None) is None]
+    missing_states = repayment_states(missing_ids) if missing_ids else {}
+    last_repayments = last_repayments_for(missing_ids) if missing_ids else {}
 
     total_loans = len(loans)
     total_principal_all = Decimal("0")
@@ -45,67 +67,17 @@ def loan_repayment_list(request):
     today = timezone.localdate()
 
     for loan in loans:
-        repayments = loan.repayments.all()
+        balance = getattr(loan, "balance_summary", None)
+        if balance is not None:
+            apply_repayment_state(loan, state_from_balance(loan, balance))
+            loan.last_repayment = balance.last_repayment
+        else:
+            apply_repayment_state(loan, missing_states[loan.id])
+            loan.last_repayment = last_repayments.get(loan.id)
 
-        # 1) Principal em dívida (global)
-        agg_tot = repayments.aggregate(total_principal=Sum("principal_amount"))
-        principal_paid_total = agg_tot["total_principal"] or Decimal("0")
-        outstanding_principal = loan.principal_amount - principal_paid_total
-        if outstanding_principal < 0:
-            outstanding_principal = Decimal("0")
-
-        loan.outstanding_principal = outstanding_principal
         total_principal_all += loan.principal_amount
-
-        # 2) Determinar ciclo actual (usamos release_date e first_payment_date)
-        # ciclo_start = data de início do ciclo actual
-        # ciclo_due   = validade / data limite do ciclo
-        cycle_start = loan.release_date or loan.created_at.date()
-        cycle_due = loan.first_payment_date  # "validade" actual
-
-        loan.current_cycle_start = cycle_start
-        loan.current_cycle_due = cycle_due
-
-        # 3) Principal na entrada deste ciclo
-        #    = principal original - principal pago antes do início do ciclo
-        agg_before = repayments.filter(payment_date__lt=cycle_start).aggregate(
-            total_before=Sum("principal_amount")
-        )
-        principal_paid_before_cycle = agg_before["total_before"] or Decimal("0")
-        cycle_base_principal = loan.principal_amount - principal_paid_before_cycle
-        if cycle_base_principal < 0:
-            cycle_base_principal = Decimal("0")
-
-        # 4) Juros do ciclo (fixos para este período de 30 dias)
-        rate = loan.interest_type.rate if loan.interest_type and loan.interest_type.rate else Decimal("0")
-        rate_decimal = (rate / Decimal("100")).quantize(Decimal("0.0001"))
-
-        cycle_interest_total = (cycle_base_principal * rate_decimal).quantize(
-            Decimal("0.01"), rounding=ROUND_HALF_UP
-        )
-
-        # 5) Juros já pagos neste ciclo
-        q_cycle = Q(payment_date__gte=cycle_start)
-        if cycle_due:
-            q_cycle &= Q(payment_date__lte=cycle_due)
-        agg_int = repayments.filter(q_cycle).aggregate(total_int=Sum("interest_amount"))
-        interest_paid_cycle = agg_int["total_int"] or Decimal("0")
-
-        # 6) Juros em falta neste ciclo
-        interest_remaining = cycle_interest_total - interest_paid_cycle
-        if interest_remaining < 0:
-            interest_remaining = Decimal("0")
-
-        loan.period_interest_total = cycle_interest_total
-        loan.period_interest_remaining = interest_remaining
-        loan.outstanding_with_interest = outstanding_principal + interest_remaining
-
         total_outstanding_all += loan.outstanding_with_interest
 
-        # 7) Último pagamento (para info)
-        last_rep = repayments.order_by("-payment_date", "-id").first()
-        loan.last_repayment = last_rep
-
     context = {
         "loans": loans,
         "segment": "loan_repayments",
@@ -136,8 +108,11 @@ def register_repayment(request, loan_id):
     - cria Transaction (IN, source_type='loan_repayment')
     """
 
+    # Bloqueia o empréstimo até ao fim da transacção: dois reembolsos em
+    # simultâneo (ou um reembolso e a importação CSV) lêem o estado um
+    # depois do outro, nunca o mesmo principal/juros em dívida.
     loan = get_object_or_404(
-        Loan.objects.select_related("member", "interest_type"),
+        Loan.objects.select_related("member", "interest_type").select_for_update(),
         pk=loan_id,
         status="disbursed",
     )
@@ -195,136 +170,25 @@ def register_repayment(request, loan_id):
             status=400,
         )
 
-    # ===== 1) PRINCIPAL EM DÍVIDA GLOBAL =====
-    repayments = loan.repayments.all()
+    # ===== 1) ESTADO ACTUAL: PRINCIPAL EM DÍVIDA + JUROS DO CICLO (1 query) =====
+    state = repayment_states([loan.id])[loan.id]
+    outstanding_principal = state.outstanding_principal
 
-    agg_tot = repayments.aggregate(total_principal=Sum("principal_amount"))
-    principal_paid_total = agg_tot["total_principal"] or Decimal("0")
-    outstanding_principal = loan.principal_amount - principal_paid_total
-    if outstanding_principal <= 0:
-        return JsonResponse(
-            {"success": False, "message": "Este empréstimo não tem saldo de principal em dívida."},
-            status=400,
+    # ===== 2) VALIDAR E DISTRIBUIR O PAGAMENTO (juros primeiro) =====
+    try:
+        allocation = allocate_repayment(
+            outstanding_principal, state.interest_remaining, amount, repayment_type
         )
+    except RepaymentRuleError as exc:
+        return JsonResponse({"success": False, "message": str(exc)}, status=400)
 
-    # ===== 2) CICLO ACTUAL =====
-    cycle_start = loan.release_date or loan.created_at.date()
-    cycle_due = loan.first_payment_date
-
-    # principal pago antes do ciclo
-    agg_before = repayments.filter(payment_date__lt=cycle_start).aggregate(
-        total_before=Sum("principal_amount")
-    )
-    principal_paid_before_cycle = agg_before["total_before"] or Decimal("0")
-    cycle_base_principal = loan.principal_amount - principal_paid_before_cycle
-    if cycle_base_principal < 0:
-        cycle_base_principal = Decimal("0")
-
-    # taxa
-    rate = loan.interest_type.rate if loan.interest_type and loan.interest_type.rate else Decimal("0")
-    rate_decimal = (rate / Decimal("100")).quantize(Decimal("0.0001"))
-
-    # juros totais deste ciclo
-    cycle_interest_total = (cycle_base_principal * rate_decimal).quantize(
-        Decimal("0.01"), rounding=ROUND_HALF_UP
-    )
+    repayment_type = allocation.repayment_type
+    repayment_type_label = allocation.label
+    interest_amount = allocation.interest_amount
+    principal_amount = allocation.principal_amount
+    principal_balance_after = allocation.principal_balance_after
 
-    # juros já pagos neste ciclo
-    q_cycle = Q(payment_date__gte=cycle_start)
-    if cycle_due:
-        q_cycle &= Q(payment_date__lte=cycle_due)
-
-    agg_int = repayments.filter(q_cycle).aggregate(total_int=Sum("interest_amount"))
-    interest_paid_cycle = agg_int["total_int"] or Decimal("0")
-
-    # juros em falta neste ciclo
-    interest_remaining = cycle_interest_total - interest_paid_cycle
-    if interest_remaining < 0:
-        interest_remaining = Decimal("0")
-
-    # ===== 3) VALIDAR E DISTRIBUIR O PAGAMENTO =====
-    repayment_type_label = ""
-    interest_amount = Decimal("0.00")
-    principal_amount = Decimal("0.00")
-    principal_balance_after = outstanding_principal
-
-    if repayment_type == "interest_only":
-        repayment_type_label = "Pagamento apenas de juros"
-
-        if interest_remaining <= 0:
-            return JsonResponse(
-                {
-                    "success": False,
-                    "message": "Não há juros em falta neste ciclo. Não é possível liquidar apenas juros.",
-                },
-                status=400,
-            )
-
-        # tem de pagar exactamente os juros em falta
-        if amount != interest_remaining:
-            return JsonResponse(
-                {
-                    "success": False,
-                    "message": (
-                        f"Para liquidar apenas os juros deste ciclo o valor deve ser exactamente "
-                        f"{interest_remaining}. Introduziu {amount}."
-                    ),
-                },
-                status=400,
-            )
-
-        interest_amount = interest_remaining
-        principal_amount = Decimal("0.00")
-        principal_balance_after = outstanding_principal  # não muda
-
-    elif repayment_type == "full":
-        repayment_type_label = "Liquidação total (juros + principal)"
-
-        total_to_close = outstanding_principal + interest_remaining
-
-        if amount != total_to_close:
-            return JsonResponse(
-                {
-                    "success": False,
-                    "message": (
-                        f"Para liquidar totalmente este empréstimo deve pagar exactamente "
-                        f"{total_to_close} (principal {outstanding_principal} + juros em falta {interest_remaining}). "
-                        f"Introduziu {amount}."
-                    ),
-                },
-                status=400,
-            )
-
-        interest_amount = interest_remaining
-        principal_amount = outstanding_principal
-        principal_balance_after = Decimal("0.00")
-
-    else:
-        # partial
-        repayment_type = "partial"
-        repayment_type_label = "Pagamento parcial (juros + principal)"
-
-        if interest_remaining > 0 and amount < interest_remaining:
-            return JsonResponse(
-                {
-                    "success": False,
-                    "message": (
-                        f"Para pagamento parcial neste ciclo deve pagar pelo menos os juros em falta "
-                        f"({interest_remaining}). Introduziu {amount}."
-                    ),
-                },
-                status=400,
-            )
-
-        # primeiro liquida juros em falta, resto vai para principal
-        interest_amount = min(amount, interest_remaining)
-        principal_amount = amount - interest_amount
-
-        principal_balance_after = outstanding_principal - principal_amount
-        if principal_balance_after < 0:
-            principal_balance_after = Decimal("0.00")
-
-    # ===== 4) CRIAR LOANREPAYMENT =====
+    # ===== 3) CRIAR LOANREPAYMENT =====
     repayment = LoanRepayment.objects.create(
         loan=loan,
         member=loan.member,
@@ -339,40 +203,42 @@ def register_repayment(request, loan_id):
         notes=notes or None,
     )
 
-    # ===== 5) ACTUALIZAR SALDO DA CONTA DA EMPRESA =====
-    old_balance = account.balance or Decimal("0")
-    account.balance = old_balance + amount
-    account.save(update_fields=["balance"])
-    new_balance = account.balance
-
-    # ===== 6) REGISTAR TRANSAÇÃO =====
+    # ===== 4) LANÇAR ENTRADA NA CONTA DA EMPRESA (saldo + Transaction) =====
     descricao = (
         f"{repayment_type_label} - Reembolso de empréstimo (Loan #{loan.id}) "
         f"de {loan.member.first_name} {loan.member.last_name} "
         f"- Juros: {interest_amount} · Principal: {principal_amount}"
     )
 
-    Transaction.objects.create(
-        company_account=account,
-        tx_type=Transaction.TX_TYPE_IN,
+    post_transaction(
+        account,
+        Transaction.TX_TYPE_IN,
+        amount,
+        payment_date,
+        descricao,
         source_type="loan_repayment",
         source_id=repayment.id,
-        tx_date=payment_date,
-        description=descricao,
-        amount=amount,
-        balance_before=old_balance,
-        balance_after=new_balance,
-        is_active=True,
-        created_at=timezone.now(),
     )
 
-    # ===== 7) ACTUALIZAR ESTADO / VALIDADE DO EMPRÉSTIMO =====
+    # ===== 5) ACTUALIZAR ESTADO / VALIDADE DO EMPRÉSTIMO =====
+
+    kpi_delta = {
+        "outstanding_principal": principal_balance_after - outstanding_principal,
+        "repayments_amount": amount,
+        "repayments_count": 1,
+    }
 
     # Se principal acabou, fecha empréstimo
     if principal_balance_after <= 0:
         loan.status = "closed"
         loan.save(update_fields=["status"])
 
+        kpi_delta.update(
+            loans_disbursed=-1,
+            loans_closed=1,
+            interest_to_receive=-loan_interest_total(loan),
+        )
+
     # Se foi "apenas juros": renova validade (novo ciclo de 30 dias)
     elif repayment_type == "interest_only":
         loan.release_date = payment_date
@@ -381,6 +247,10 @@ def register_repayment(request, loan_id):
 
     # Pagamento parcial: apenas reduz principal; ciclo continua igual
 
+    record_repayment(loan, repayment)
+    apply_kpi_delta(flow_date=payment_date, **kpi_delta)
+    apply_pnl_delta(PnlMonthly.LINE_LOAN_INTEREST, payment_date, interest_amount, account.id)
+
     return JsonResponse(
         {
             "success": True,
@@ -394,6 +264,54 @@ def register_repayment(request, loan_id):
 
 #=================================================================================================
 #=================================================================================================
+@login_required
+@require_POST
+def import_repayments_csv(request):
+    """
+    Importação em lote de reembolsos a partir de um extracto CSV
+    (M-Pesa / e-Mola / banco). Com dry_run=1 apenas valida e simula a
+    distribuição; caso contrário grava as linhas válidas.
+    Devolve o resumo e os erros por linha.
+    """
+    csv_file = request.FILES.get("file")
+    company_account_id = request.POST.get("company_account", "").strip()
+    method = request.POST.get("method", "mobile").strip()
+    dry_run = request.POST.get("dry_run") in ("1", "true", "on")
+
+    if not csv_file:
+        return JsonResponse(
+            {"success": False, "message": "Seleccione o ficheiro CSV do extracto."},
+            status=400,
+        )
+    if company_account_id and not CompanyAccount.objects.filter(pk=company_account_id, is_active=True).exists():
+        return JsonResponse(
+            {"success": False, "message": "Conta da empresa inválida."},
+            status=400,
+        )
+
+    result = import_repayments(
+        csv_file,
+        company_account_id=company_account_id or None,
+        method=method,
+        user=request.user,
+        dry_run=dry_run,
+    )
+
+    return JsonResponse(
+        {
+            "success": True,
+            "message": result.summary,
+            "batch": result.batch,
+            "dry_run": result.dry_run,
+            "ok_count": len(result.ok_rows),
+            "error_count": len(result.error_rows),
+            "total_amount": str(result.total_amount),
+            "errors": [row.as_dict() for row in result.error_rows],
+        }
+    )
+
+#=================================================================================================
+#=================================================================================================
 
 
 #=================================================================================================
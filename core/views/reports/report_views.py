@@ -1,26 +1,35 @@
 # core/views/report_views.py
 
-from datetime import date, datetime
+from datetime import date
 
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.db.models import Sum
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 
-from weasyprint import HTML
-from django.template.loader import render_to_string
-
-from core.models import (
-    Member,
-    CompanyAccount,
-    Income,
-    Expense,
-    Loan,
-    LoanDisbursement,
-    LoanRepayment,
-    Transaction,
+from core.models import Member, CompanyAccount, ReportJob, PrerenderedReport
+from core.services.dashboard_metrics import last_months
+from core.services.pnl import pnl_chart_data, pnl_pivot
+from core.services.report_cache import cached_report_context
+from core.services.report_export import EXPORT_FORMATS, export_filename, stream_report
+from core.services.report_jobs import enqueue_report
+from core.services.report_prerender import find_prerendered
+from core.services.reports import (
+    REPORT_LABELS,
+    ReportError,
+    ReportParams,
+    parse_report_params,
+    render_report_pdf,
 )
 
 #===================================================================================================
@@ -36,11 +45,25 @@ def report_filters(request):
     users = User.objects.filter(is_active=True).order_by("username")
     company_accounts = CompanyAccount.objects.filter(is_active=True).order_by("name")
 
+    recent_jobs = list(
+        ReportJob.objects.filter(requested_by=request.user)
+        .only("id", "report_type", "params", "status", "created_at", "finished_at", "file_size")
+        .order_by("-id")[:10]
+    )
+    for job in recent_jobs:
+        job.title = REPORT_LABELS.get(job.report_type, "Relatório")
+
     context = {
         "segment": "reports",
         "members": members,
         "users": users,
         "company_accounts": company_accounts,
+        "reports_async": settings.REPORTS_ASYNC,
+        "recent_jobs": recent_jobs,
+        # último mês com PDFs pré-gerados (prerender_month_end_reports)
+        "month_end_period": (
+            PrerenderedReport.objects.order_by("-period_start").values_list("period_start", flat=True).first()
+        ),
     }
     return render(request, "reports/report_filters.html", context)
 
@@ -51,219 +74,168 @@ def report_filters(request):
 @require_http_methods(["POST"])
 def generate_report_pdf(request):
     """
-    Gera o PDF com base no tipo de relatório e filtros escolhidos.
-    """
-    report_type = request.POST.get("report_type")
-    if not report_type:
-        return HttpResponseBadRequest("Tipo de relatório é obrigatório.")
+    Pede o PDF com base no tipo de relatório e filtros escolhidos.
 
-    # Intervalo de datas (compatível com Python < 3.7 — sem fromisoformat)
-    start_date_str = (request.POST.get("start_date") or "").strip()
-    end_date_str = (request.POST.get("end_date") or "").strip()
+    Com REPORTS_ASYNC o pedido só entra na fila (sl_report_jobs) e a resposta
+    é imediata, em JSON, com os URLs de estado e de download; o PDF é gerado
+    pelo worker (`manage.py run_report_worker`). Sem REPORTS_ASYNC o PDF é
+    gerado no próprio pedido, como antes.
 
-    today = date.today()
-
-    # Data inicial
-    if start_date_str:
+    Pedidos de um mês completo com PDF pré-gerado no fecho do mês
+    (`manage.py prerender_month_end_reports`) são servidos de imediato.
+    """
+    try:
+        params = parse_report_params(request.POST)
+    except ReportError as exc:
+        if settings.REPORTS_ASYNC:
+            return JsonResponse({"success": False, "message": str(exc)}, status=400)
+        return HttpResponseBadRequest(str(exc))
+
+    if not settings.REPORTS_ASYNC:
+        prerendered = find_prerendered(params)
+        if prerendered is not None:
+            return FileResponse(
+                prerendered.file.open("rb"),
+                content_type="application/pdf",
+                as_attachment=False,
+                filename=params.filename,
+            )
+
+        context = cached_report_context(params, generated_by=request.user)
         try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        except ValueError:
-            return HttpResponseBadRequest("Data inicial inválida.")
+            pdf_bytes = render_report_pdf(params, context=context)
+        except ReportError as exc:
+            return HttpResponseBadRequest(str(exc))
+        response = HttpResponse(pdf_bytes, content_type="application/pdf")
+        # abre em nova aba (inline). Se quiser forçar download, usa attachment.
+        response["Content-Disposition"] = f'inline; filename="{params.filename}"'
+        return response
+
+    job, created = enqueue_report(params, user=request.user)
+    if job.from_cache:
+        message = "Relatório pronto (dados sem alterações desde a última geração)."
+    elif created:
+        message = "Relatório em fila."
     else:
-        # primeiro dia do mês actual
-        start_date = today.replace(day=1)
+        message = "Já existe um pedido igual em curso."
+    return JsonResponse(
+        {
+            "success": True,
+            "message": message,
+            **_job_payload(job),
+        },
+        status=202,
+    )
 
-    # Data final
-    if end_date_str:
-        try:
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-        except ValueError:
-            return HttpResponseBadRequest("Data final inválida.")
-    else:
-        end_date = today
-
-    # Filtros opcionais
-    member_id = request.POST.get("member") or None
-    user_id = request.POST.get("user") or None
-    company_account_id = request.POST.get("company_account") or None
-
-    member_obj = None
-    user_obj = None
-    account_obj = None
-
-    if member_id:
-        member_obj = get_object_or_404(Member, pk=member_id)
-    if user_id:
-        user_obj = get_object_or_404(User, pk=user_id)
-    if company_account_id:
-        account_obj = get_object_or_404(CompanyAccount, pk=company_account_id)
-
-    # Mapeamento de label
-    REPORT_LABELS = {
-        "incomes": "Rendimentos",
-        "expenses": "Despesas",
-        "balances": "Saldos por Conta",
-        "loans": "Empréstimos",
-        "disbursements": "Desembolsos",
-        "repayments": "Reembolsos",
-        "transactions": "Transacções",
-        "profits": "Lucros (Rendimentos - Despesas)",
-    }
-    report_title = REPORT_LABELS.get(report_type, "Relatório")
 
-    context = {
-        "report_type": report_type,
-        "report_title": report_title,
-        "start_date": start_date,
-        "end_date": end_date,
-        "member": member_obj,
-        "user_obj": user_obj,
-        "account": account_obj,
-        "generated_by": request.user,
-    }
+@login_required
+@require_http_methods(["POST"])
+def export_report(request):
+    """
+    Exporta os dados do relatório (mesmos filtros do PDF) em CSV ou XLSX.
 
-    # ===================== LÓGICA POR TIPO =====================
+    A resposta é enviada à medida que as linhas são lidas (em blocos), com
+    os totais no fim — a memória não depende do tamanho do período.
+    """
+    fmt = (request.POST.get("format") or "csv").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Formato de exportação desconhecido.")
+
+    try:
+        params = parse_report_params(request.POST)
+    except ReportError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    stream, content_type = stream_report(params, fmt)
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{export_filename(params, fmt)}"'
+    return response
 
-    # 1) RENDIMENTOS
-    if report_type == "incomes":
-        qs = Income.objects.select_related("category", "company_account").filter(
-            income_date__range=(start_date, end_date),
-            is_active=True,
-        )
-        if account_obj:
-            qs = qs.filter(company_account=account_obj)
-
-        total_amount = qs.aggregate(total=Sum("amount"))["total"] or 0
-        context["rows"] = qs
-        context["total_amount"] = total_amount
-
-    # 2) DESPESAS
-    elif report_type == "expenses":
-        qs = Expense.objects.select_related("category", "company_account").filter(
-            expense_date__range=(start_date, end_date),
-            is_active=True,
-        )
-        if account_obj:
-            qs = qs.filter(company_account=account_obj)
-
-        total_amount = qs.aggregate(total=Sum("amount"))["total"] or 0
-        context["rows"] = qs
-        context["total_amount"] = total_amount
-
-    # 3) SALDOS – snapshot de todas as contas
-    elif report_type == "balances":
-        accounts = CompanyAccount.objects.filter(is_active=True).order_by("name")
-        context["accounts"] = accounts
-
-    # 4) EMPRÉSTIMOS
-    elif report_type == "loans":
-        qs = (
-            Loan.objects
-            .select_related("member", "loan_type", "interest_type", "company_account")
-            .filter(created_at__date__range=(start_date, end_date))
-        )
-        if member_obj:
-            qs = qs.filter(member=member_obj)
-        if user_obj:
-            qs = qs.filter(created_by=user_obj)
-        if account_obj:
-            qs = qs.filter(company_account=account_obj)
-
-        total_principal = qs.aggregate(total=Sum("principal_amount"))["total"] or 0
-        context["rows"] = qs
-        context["total_principal"] = total_principal
-
-    # 5) DESEMBOLSOS
-    elif report_type == "disbursements":
-        qs = (
-            LoanDisbursement.objects
-            .select_related("loan", "member", "company_account")
-            .filter(disburse_date__range=(start_date, end_date))
-        )
-        if member_obj:
-            qs = qs.filter(member=member_obj)
-        if account_obj:
-            qs = qs.filter(company_account=account_obj)
-
-        total_amount = qs.aggregate(total=Sum("amount"))["total"] or 0
-        context["rows"] = qs
-        context["total_amount"] = total_amount
-
-    # 6) REEMBOLSOS
-    elif report_type == "repayments":
-        qs = (
-            LoanRepayment.objects
-            .select_related("loan", "member", "company_account")
-            .filter(payment_date__range=(start_date, end_date))
-        )
-        if member_obj:
-            qs = qs.filter(member=member_obj)
-        if account_obj:
-            qs = qs.filter(company_account=account_obj)
-
-        total_amount = qs.aggregate(total=Sum("amount"))["total"] or 0
-        total_interest = qs.aggregate(total=Sum("interest_amount"))["total"] or 0
-        total_principal = qs.aggregate(total=Sum("principal_amount"))["total"] or 0
-
-        context["rows"] = qs
-        context["total_amount"] = total_amount
-        context["total_interest"] = total_interest
-        context["total_principal"] = total_principal
-
-    # 7) TRANSACÇÕES
-    elif report_type == "transactions":
-        qs = (
-            Transaction.objects
-            .select_related("company_account")
-            .filter(tx_date__range=(start_date, end_date))
-        )
-        if account_obj:
-            qs = qs.filter(company_account=account_obj)
-
-        total_in = qs.filter(tx_type=Transaction.TX_TYPE_IN).aggregate(total=Sum("amount"))["total"] or 0
-        total_out = qs.filter(tx_type=Transaction.TX_TYPE_OUT).aggregate(total=Sum("amount"))["total"] or 0
-
-        context["rows"] = qs.order_by("tx_date", "id")
-        context["total_in"] = total_in
-        context["total_out"] = total_out
-        context["net"] = (total_in or 0) - (total_out or 0)
-
-    # 8) LUCROS = Rendimentos - Despesas
-    elif report_type == "profits":
-        incomes_qs = Income.objects.filter(
-            income_date__range=(start_date, end_date),
-            is_active=True,
-        )
-        expenses_qs = Expense.objects.filter(
-            expense_date__range=(start_date, end_date),
-            is_active=True,
+
+@login_required
+@require_http_methods(["GET"])
+def pnl_data(request):
+    """
+    P&L mensal por categoria (rendimentos, juros, leasing, despesas) em JSON,
+    para gráficos. Parâmetros GET: start_date, end_date, company_account —
+    por omissão, os últimos 12 meses até hoje.
+    """
+    today = date.today()
+    data = request.GET.dict()
+    data["report_type"] = "profits"
+    data.setdefault("start_date", last_months(today, 12)[0].isoformat())
+
+    try:
+        params = parse_report_params(data, today=today)
+    except ReportError as exc:
+        return JsonResponse({"success": False, "message": str(exc)}, status=400)
+    if params.start_date > params.end_date:
+        return JsonResponse(
+            {"success": False, "message": "A data inicial é posterior à data final."},
+            status=400,
         )
-        if account_obj:
-            incomes_qs = incomes_qs.filter(company_account=account_obj)
-            expenses_qs = expenses_qs.filter(company_account=account_obj)
 
-        total_incomes = incomes_qs.aggregate(total=Sum("amount"))["total"] or 0
-        total_expenses = expenses_qs.aggregate(total=Sum("amount"))["total"] or 0
-        profit = total_incomes - total_expenses
+    pivot = pnl_pivot(params.start_date, params.end_date, params.company_account_id)
+    return JsonResponse({
+        "success": True,
+        "start_date": params.start_date.isoformat(),
+        "end_date": params.end_date.isoformat(),
+        "company_account_id": params.company_account_id,
+        **pnl_chart_data(pivot),
+    })
 
-        context["total_incomes"] = total_incomes
-        context["total_expenses"] = total_expenses
-        context["profit"] = profit
 
-    else:
-        return HttpResponseBadRequest("Tipo de relatório desconhecido.")
+#===================================================================================================
+#===================================================================================================
 
-    # ===================== GERAR PDF COM WEASYPRINT =====================
-    html_string = render_to_string("reports/report_pdf.html", context)
-    html = HTML(string=html_string, base_url=request.build_absolute_uri("/"))
-    pdf_bytes = html.write_pdf()
+def _job_payload(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_label": job.get_status_display(),
+        "report_title": REPORT_LABELS.get(job.report_type, "Relatório"),
+        "error": job.error if job.status == ReportJob.STATUS_FAILED else None,
+        "from_cache": job.from_cache,
+        "status_url": reverse("core:report_job_status", args=[job.id]),
+        "download_url": (
+            reverse("core:report_job_download", args=[job.id])
+            if job.status == ReportJob.STATUS_DONE
+            else None
+        ),
+    }
 
-    filename = f"{report_type}_{start_date}_{end_date}.pdf"
 
-    response = HttpResponse(pdf_bytes, content_type="application/pdf")
-    # abre em nova aba (inline). Se quiser forçar download, usa attachment.
-    response["Content-Disposition"] = f'inline; filename="{filename}"'
-    return response
+def _user_job(request, job_id):
+    qs = ReportJob.objects.all()
+    if not request.user.is_staff:
+        qs = qs.filter(requested_by=request.user)
+    return get_object_or_404(qs, pk=job_id)
 
-#===================================================================================================
-#===================================================================================================
+
+@login_required
+@require_http_methods(["GET"])
+def report_job_status(request, job_id):
+    """
+    Estado de um pedido de relatório (consultado periodicamente pela página).
+    """
+    job = _user_job(request, job_id)
+    return JsonResponse({"success": True, **_job_payload(job)})
+
+
+@login_required
+@require_http_methods(["GET"])
+def report_job_download(request, job_id):
+    """
+    PDF gerado por um pedido concluído.
+    """
+    job = _user_job(request, job_id)
+    if job.status != ReportJob.STATUS_DONE or not job.file:
+        raise Http404("Relatório ainda não disponível.")
+
+    params = ReportParams.from_dict(job.params)
+    return FileResponse(
+        job.file.open("rb"),
+        content_type="application/pdf",
+        filename=params.filename,
+        as_attachment=False,
+    )
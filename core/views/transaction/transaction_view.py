@@ -1,3 +1,7 @@
+import hashlib
+import json
+import uuid
+from django.core.cache import cache
 from django.utils import timezone
 from decimal import Decimal
 from django.shortcuts import render, redirect
@@ -13,26 +17,187 @@ from core.models import (
 from django.views.decorators.http import require_POST
 import os
 from django.http import JsonResponse, FileResponse, Http404
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+from datetime import datetime
+from core.services.money import MONEY_FIELD
+from core.services.datatables import datatables_response, keyset_page, parse_datatables_request
 
 #============================================================================================================
 #============================================================================================================
 def transaction_list(request):
-    transactions = (
-        Transaction.objects.filter(is_active=True)
-        .select_related("company_account", "created_by")
-        .order_by("-tx_date", "-id")
-    )
+    """
+    Página do histórico de transacções. As linhas são carregadas a pedido
+    pelo DataTables (server-side) a partir de `transaction_list_data`.
+    """
+    company_accounts = CompanyAccount.objects.order_by("name").only("id", "name", "account_identifier")
 
     return render(
         request,
         "transactions/transaction_list.html",
         {
-            "transactions": transactions,
+            "company_accounts": company_accounts,
+            "source_types": sorted(
+                {code: label for code, label in Transaction.SOURCE_TYPE_LABELS.items()
+                 if code != "tuktuk_lease_payment"}.items(),
+                key=lambda item: item[1],
+            ),
             "segment": "transactions",
+            # Totais em cache por carregamento da página (ver _ledger_totals)
+            "count_key": uuid.uuid4().hex[:12],
         },
     )
 
 
+#============================================================================================================
+#============================================================================================================
+
+# Parâmetros GET dos filtros do histórico (ver _ledger_filters)
+LEDGER_FILTER_PARAMS = ("account", "tx_type", "source_type", "date_from", "date_to")
+
+# Validade dos totais do histórico em cache (a mesma das contagens de ServerSideList)
+LEDGER_TOTALS_CACHE_SECONDS = 300
+
+# Colunas ordenáveis do DataTables → campo de ordenação (desempate sempre por id)
+LEDGER_ORDER_FIELDS = {
+    0: "id",
+    1: "tx_date",
+    2: "company_account__name",
+    6: "amount",
+}
+
+
+def _ledger_filters(params, search):
+    """
+    Filtros do histórico (conta, tipo, origem, datas e pesquisa livre) como um único Q.
+    """
+    q = Q()
+
+    account_id = params.get("account", "").strip()
+    if account_id.isdigit():
+        q &= Q(company_account_id=int(account_id))
+
+    tx_type = params.get("tx_type", "").strip()
+    if tx_type in (Transaction.TX_TYPE_IN, Transaction.TX_TYPE_OUT):
+        q &= Q(tx_type=tx_type)
+
+    source_type = params.get("source_type", "").strip()
+    if source_type == "vehicle_lease_payment":
+        q &= Q(source_type__in=["vehicle_lease_payment", "tuktuk_lease_payment"])
+    elif source_type:
+        q &= Q(source_type=source_type)
+
+    for name, lookup in (("date_from", "tx_date__gte"), ("date_to", "tx_date__lte")):
+        value = params.get(name, "").strip()
+        if value:
+            try:
+                q &= Q(**{lookup: datetime.strptime(value, "%Y-%m-%d").date()})
+            except ValueError:
+                pass
+
+    if search:
+        search_q = Q(description__icontains=search) | Q(company_account__name__icontains=search)
+        if search.isdigit():
+            search_q |= Q(pk=int(search))
+        q &= search_q
+
+    return q
+
+
+def _ledger_totals(base, filters, params, search):
+    """
+    Contagens e somas de entradas/saídas (1 query de agregação condicional
+    sobre o histórico activo), em cache por `count_key` — o identificador
+    do carregamento da página — e filtros: folhear páginas ou reordenar não
+    volta a percorrer o histórico; depois de gravar algo e recarregar, a
+    página volta a contar.
+    """
+    def compute():
+        return base.aggregate(
+            records_total=Count("id"),
+            records_filtered=Count("id", filter=filters),
+            total_in=Coalesce(
+                Sum("amount", filter=filters & Q(tx_type=Transaction.TX_TYPE_IN)),
+                Decimal("0"),
+                output_field=MONEY_FIELD,
+            ),
+            total_out=Coalesce(
+                Sum("amount", filter=filters & Q(tx_type=Transaction.TX_TYPE_OUT)),
+                Decimal("0"),
+                output_field=MONEY_FIELD,
+            ),
+        )
+
+    count_key = params.get("count_key", "").strip()
+    if not count_key:
+        return compute()
+
+    parts = [count_key, search, *(params.get(name, "").strip() for name in LEDGER_FILTER_PARAMS)]
+    key = "ledger_totals:" + hashlib.md5(json.dumps(parts).encode()).hexdigest()
+    totals = cache.get(key)
+    if totals is None:
+        totals = compute()
+        cache.set(key, totals, LEDGER_TOTALS_CACHE_SECONDS)
+    return totals
+
+
+def _ledger_row(t):
+    created_by = "—"
+    if t.created_by:
+        created_by = t.created_by.get_full_name() or t.created_by.username
+
+    return {
+        "id": t.id,
+        "tx_date": t.tx_date.isoformat(),
+        "account_name": t.company_account.name,
+        "account_identifier": t.company_account.account_identifier,
+        "tx_type": t.tx_type,
+        "source_label": Transaction.SOURCE_TYPE_LABELS.get(t.source_type, "—"),
+        "description": t.description,
+        "amount": str(t.amount),
+        "balance_before": None if t.balance_before is None else str(t.balance_before),
+        "balance_after": None if t.balance_after is None else str(t.balance_after),
+        "created_by": created_by,
+    }
+
+
+@login_required
+def transaction_list_data(request):
+    """
+    Endpoint server-side do DataTables para o histórico de transacções:
+    - 1 query de agregação (em cache por carregamento da página e filtro):
+      total geral, total filtrado e somas de entradas/saídas do filtro
+      actual (agregação condicional);
+    - 1 query para a página, com paginação por chave em (tx_date, id).
+    """
+    dt = parse_datatables_request(request.GET, default_order_column=1)
+    filters = _ledger_filters(request.GET, dt.search)
+
+    base = Transaction.objects.filter(is_active=True)
+    totals = _ledger_totals(base, filters, request.GET, dt.search)
+
+    rows, cursor = keyset_page(
+        base.filter(filters).select_related("company_account", "created_by"),
+        dt,
+        LEDGER_ORDER_FIELDS.get(dt.order_column, "tx_date"),
+    )
+
+    return JsonResponse(
+        datatables_response(
+            dt,
+            totals["records_total"],
+            totals["records_filtered"],
+            [_ledger_row(t) for t in rows],
+            cursor=cursor,
+            totals={
+                "in": str(totals["total_in"]),
+                "out": str(totals["total_out"]),
+                "net": str(totals["total_in"] - totals["total_out"]),
+            },
+        )
+    )
+
 
 #============================================================================================================
 #============================================================================================================
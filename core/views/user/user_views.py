@@ -6,6 +6,8 @@ from django.views.decorators.http import require_POST
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 
+from core.services.server_list import ServerSideList
+
 
 #===================================================================================================
 #===================================================================================================
@@ -21,21 +23,32 @@ def staff_required(view_func):
 
 #===================================================================================================
 #===================================================================================================
+USER_LIST = ServerSideList(
+    "users",
+    User.objects.prefetch_related("groups"),
+    "user/user_row.html",
+    row_name="u",
+    search_fields=("username", "first_name", "last_name", "email"),
+    order_fields={0: "id", 1: "username", 2: "email"},
+    filters={"group": "groups__id"},
+    default_order=(1, "asc"),
+)
+
+
 @login_required
 @staff_required
 def user_list(request):
     """
     Lista de todos os utilizadores, com info de grupos e permissões.
+    As linhas são servidas pelo mesmo URL em JSON (USER_LIST).
     """
-    users = (
-        User.objects
-        .prefetch_related("groups")
-        .order_by("username")
-    )
+    if USER_LIST.wants_json(request):
+        return USER_LIST.response(request)
+
     groups = Group.objects.all().order_by("name")
 
     context = {
-        "users": users,
+        "list_options": USER_LIST.js_options(),
         "groups": groups,
         "segment": "users",
     }
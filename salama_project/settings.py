@@ -134,3 +134,44 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "core:dashboard"
 LOGOUT_REDIRECT_URL = "login"
+
+# ==========================
+# LANÇAMENTOS NAS CONTAS DA EMPRESA
+# ==========================
+# "locked": cada lançamento actualiza o saldo sob lock da conta (SELECT ... FOR UPDATE)
+# "journal": lançamentos sem verificação de saldo vão para o diário (sl_transactions
+#            pendentes) e o saldo é avançado em lote por `manage.py apply_account_journal`
+ACCOUNT_POSTING_MODE = env("ACCOUNT_POSTING_MODE", default="locked")
+# Contas em modo diário (vazio = todas, quando ACCOUNT_POSTING_MODE = "journal")
+ACCOUNT_JOURNAL_ACCOUNTS = env.list("ACCOUNT_JOURNAL_ACCOUNTS", cast=int, default=[])
+
+# ==========================
+# LEASING
+# ==========================
+# Validade (segundos) dos KPIs das listas de frota, contratos e pagamentos em
+# cache; 0 = calculados em cada pedido. Os registos feitos nas próprias
+# páginas limpam a cache.
+LEASING_KPI_CACHE_SECONDS = env.int("LEASING_KPI_CACHE_SECONDS", default=0)
+
+# ==========================
+# RELATÓRIOS PDF
+# ==========================
+# True: os pedidos de PDF vão para a fila (sl_report_jobs) e são gerados por
+#       `manage.py run_report_worker`; False: geração síncrona no pedido web.
+# Só activar com o worker a correr: sem ele os pedidos ficam na fila.
+REPORTS_ASYNC = env.bool("REPORTS_ASYNC", default=False)
+# Validade máxima de um PDF/contexto em cache (segundos); a cache também é
+# invalidada pela marca d'água dos dados (contagem/maior id no período)
+REPORT_CACHE_SECONDS = env.int("REPORT_CACHE_SECONDS", default=6 * 3600)
+# Relatórios com mais linhas do que REPORT_PDF_CHUNK_ROWS são gerados em blocos
+# (um PDF parcial por bloco, juntos no fim): a memória do worker depende do
+# tamanho do bloco e não do relatório. Acima de REPORT_PDF_MAX_ROWS o PDF é
+# recusado (usar a exportação CSV/Excel).
+REPORT_PDF_CHUNK_ROWS = env.int("REPORT_PDF_CHUNK_ROWS", default=1500)
+REPORT_PDF_MAX_ROWS = env.int("REPORT_PDF_MAX_ROWS", default=100000)
+
+# ==========================
+# TESTES
+# ==========================
+# A base de testes é criada sem as migrações do core (ver core/test_runner.py).
+TEST_RUNNER = "core.test_runner.CoreTestRunner"